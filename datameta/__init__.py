@@ -44,6 +44,7 @@ def main(global_config, **settings):
         )
         config.pyramid_openapi3_add_explorer(api.base_url)
         config.include('.models')
+        config.include('.security.authcache')
         config.include('pyramid_chameleon')
         config.include('.routes')
         config.include('.api')
@@ -0,0 +1,32 @@
+"""added definition version for application settings
+
+Revision ID: 7c1f5b3e9a24
+Revises: 4e8b2a6c0d93
+Create Date: 2026-10-19 23:05:52.301846
+
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '7c1f5b3e9a24'
+down_revision = '4e8b2a6c0d93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Record a version for the cached application settings
+    definitionversions = sa.table(
+        'definitionversions',
+        sa.column('name', sa.String(length=50)),
+        sa.column('version', postgresql.UUID(as_uuid=True))
+    )
+    op.bulk_insert(definitionversions, [ { 'name' : 'appsettings', 'version' : uuid.uuid4() } ])
+
+
+def downgrade():
+    op.execute("DELETE FROM definitionversions WHERE name = 'appsettings'")
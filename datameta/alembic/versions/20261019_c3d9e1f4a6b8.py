@@ -0,0 +1,33 @@
+"""removed null metadatum records
+
+Revision ID: c3d9e1f4a6b8
+Revises: 8a4f0c6e2b17
+Create Date: 2026-10-19 18:05:44.310257
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'c3d9e1f4a6b8'
+down_revision = '8a4f0c6e2b17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Metadatum records are stored sparsely, records without a value are
+    # represented by their absence
+    op.execute("DELETE FROM metadatumrecords WHERE value IS NULL AND file_id IS NULL")
+
+
+def downgrade():
+    # Materialize a NULL record for every metadataset and metadatum without a record
+    op.execute("""
+        INSERT INTO metadatumrecords (uuid, metadatum_id, metadataset_id)
+        SELECT md5(random()::text || clock_timestamp()::text)::uuid, metadata.id, metadatasets.id
+        FROM metadatasets CROSS JOIN metadata
+        WHERE NOT EXISTS (
+            SELECT 1 FROM metadatumrecords
+            WHERE metadatumrecords.metadatum_id = metadata.id AND metadatumrecords.metadataset_id = metadatasets.id
+        )
+    """)
@@ -63,11 +63,16 @@ def includeme(config: Configurator) -> None:
     config.add_route("groups_id", base_url + "/groups/{id}")
     config.add_route("rpc_delete_files", base_url + "/rpc/delete-files")
     config.add_route("rpc_delete_metadatasets", base_url + "/rpc/delete-metadatasets")
+    config.add_route("rpc_export_metadatasets", base_url + "/rpc/export-metadatasets")
+    config.add_route("changes", base_url + "/changes")
     config.add_route("rpc_get_file_url", base_url + "/rpc/get-file-url/{id}")
     config.add_route('register_submit', base_url + "/registrations")
     config.add_route("register_settings", base_url + "/registrationsettings")
     config.add_route("services", base_url + "/services")
     config.add_route("services_id", base_url + "/services/{id}")
+    config.add_route("services_id_leases", base_url + "/services/{id}/leases")
+    config.add_route("service_leases_id", base_url + "/service-leases/{id}")
+    config.add_route("service_execution_bulk", base_url + "/service-execution/{serviceId}")
     config.add_route("service_execution", base_url + "/service-execution/{serviceId}/{metadatasetId}")
 
     # Endpoint outside of openapi
@@ -183,5 +183,6 @@ def delete_key(request: Request) -> UserSession:
         raise HTTPForbidden()
 
     db.delete(target_key)
+    security.invalidate_user(db, target_key.user_id)
 
     return HTTPOk()
@@ -0,0 +1,200 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import logging
+import select
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List, Optional, Iterable
+from pyramid.view import view_config
+from pyramid.request import Request
+from sqlalchemy import func, select as sql_select
+from sqlalchemy.orm import joinedload
+
+from . import DataHolderBase
+from .. import security
+from ..models import ChangeEvent, ChangeEventType, MetaDataSet, Submission
+from ..resource import get_identifier, get_identifier_or_none
+from ..security import authz
+
+log = logging.getLogger(__name__)
+
+# Key of the transaction level advisory lock that serializes the creation of
+# change events. Holding it while the events are inserted makes the event IDs
+# increase in commit order, such that consumers never skip over events that are
+# committed after events with higher IDs.
+CHANGE_EVENTS_LOCK_KEY = 0x6368616e6765
+
+# Channel on which the creation of change events is announced
+CHANGE_EVENTS_CHANNEL = "datameta_changes"
+
+# Upper limit for long-polling requests in seconds
+CHANGE_FEED_MAX_WAIT = 60
+
+EVENT_NAMES = {
+        ChangeEventType.SUBMISSION         : "submission",
+        ChangeEventType.SERVICE_EXECUTION  : "serviceExecution",
+        ChangeEventType.DEPRECATION        : "deprecation",
+        }
+
+
+@dataclass
+class ChangeEventResponse(DataHolderBase):
+    """ChangeEventResponse container for OpenApi communication"""
+    sequence         : int
+    event            : str
+    time             : str  # ISO format
+    metadataset_id   : dict
+    submission_id    : Optional[dict]
+    service_id       : Optional[dict]
+
+    @staticmethod
+    def from_change_event(change_event: ChangeEvent):
+        return ChangeEventResponse(
+                sequence         = change_event.id,
+                event            = EVENT_NAMES[change_event.event],
+                time             = change_event.datetime.isoformat() + '+00:00',  # Assuming UTC datetimes in the database
+                metadataset_id   = get_identifier(change_event.metadataset),
+                submission_id    = get_identifier_or_none(change_event.submission),
+                service_id       = get_identifier_or_none(change_event.service)
+                )
+
+
+@dataclass
+class ChangeFeedResponse(DataHolderBase):
+    """ChangeFeedResponse container for OpenApi communication"""
+    events           : List[ChangeEventResponse]
+    last_sequence    : int
+
+
+def record_change_events(db, event: ChangeEventType, mdata_set_ids: Iterable[int], submission_id: Optional[int] = None, service_id: Optional[int] = None):
+    """Records a change event of the specified type for each of the specified
+    metadatasets and announces them to waiting change feed consumers once the
+    transaction is committed. Should be called as late as possible in the
+    transaction, as the creation of change events is serialized."""
+    db.execute(sql_select([ func.pg_advisory_xact_lock(CHANGE_EVENTS_LOCK_KEY) ]))
+
+    now = datetime.datetime.utcnow()
+    db.bulk_insert_mappings(ChangeEvent, [
+        {
+            "event"            : event,
+            "datetime"         : now,
+            "metadataset_id"   : mdata_set_id,
+            "submission_id"    : submission_id,
+            "service_id"       : service_id
+            }
+        for mdata_set_id in mdata_set_ids
+        ])
+
+    db.execute(sql_select([ func.pg_notify(CHANGE_EVENTS_CHANNEL, '') ]))
+
+
+def query_change_events(db, auth_user, after: int, limit: int) -> List[ChangeEvent]:
+    """Queries the change events following the specified sequence number that
+    are visible to the specified user"""
+    query = db.query(ChangeEvent).filter(ChangeEvent.id > after)
+
+    # Restrict to metadatasets of the own group if the user can't view all
+    if not authz.view_mset_any(auth_user):
+        query = query\
+                .join(MetaDataSet, ChangeEvent.metadataset_id == MetaDataSet.id)\
+                .join(Submission, MetaDataSet.submission_id == Submission.id)\
+                .filter(Submission.group_id == auth_user.group_id)
+
+    # Service execution results are only visible to users who can read service metadata
+    if not authz.view_service_executions(auth_user):
+        query = query.filter(ChangeEvent.event != ChangeEventType.SERVICE_EXECUTION)
+
+    return query\
+            .options(joinedload(ChangeEvent.metadataset))\
+            .options(joinedload(ChangeEvent.submission))\
+            .options(joinedload(ChangeEvent.service))\
+            .order_by(ChangeEvent.id)\
+            .limit(limit)\
+            .all()
+
+
+@contextmanager
+def listen_for_changes(engine):
+    """Context manager that listens for the announcement of new change events
+    on a dedicated database connection. Yields the underlying DBAPI connection,
+    which becomes readable when a notification arrives."""
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        conn.execute(f"LISTEN {CHANGE_EVENTS_CHANNEL}")
+        yield conn.connection
+    finally:
+        try:
+            conn.execute(f"UNLISTEN {CHANGE_EVENTS_CHANNEL}")
+        finally:
+            conn.close()
+
+
+def wait_for_changes(dbapi_conn, timeout: int) -> bool:
+    """Waits for the announcement of new change events for at most `timeout`
+    seconds.
+
+    Returns:
+        True if new change events were announced, False if the timeout expired
+    """
+    if select.select([ dbapi_conn ], [], [], timeout) == ([], [], []):
+        return False
+    dbapi_conn.poll()
+    dbapi_conn.notifies.clear()
+    return True
+
+
+def get_change_feed_response(events: List[ChangeEvent], after: int) -> ChangeFeedResponse:
+    return ChangeFeedResponse(
+            events          = [ ChangeEventResponse.from_change_event(change_event) for change_event in events ],
+            last_sequence   = events[-1].id if events else after
+            )
+
+
+@view_config(
+    route_name      = "changes",
+    renderer        = "json",
+    request_method  = "GET",
+    openapi         = True
+)
+def get(request: Request) -> ChangeFeedResponse:
+    """Query the change events following the specified sequence number. If
+    there are none and a waiting time is specified, the request blocks until
+    new change events are committed or the waiting time expires."""
+    auth_user = security.revalidate_user(request)
+
+    # GET parameters
+    after = request.openapi_validated.parameters.query.get('after', 0)
+    limit = request.openapi_validated.parameters.query.get('limit', 1000)
+    wait = min(request.openapi_validated.parameters.query.get('wait', 0), CHANGE_FEED_MAX_WAIT)
+
+    events = query_change_events(request.dbsession, auth_user, after, limit)
+    if events or not wait:
+        return get_change_feed_response(events, after)
+
+    # The snapshot of the request transaction may predate change events
+    # committed since. Start listening for announcements and query again in a
+    # separate session to avoid missing events committed in between.
+    db = request.registry['dbsession_factory']()
+    try:
+        with listen_for_changes(db.get_bind()) as dbapi_conn:
+            events = query_change_events(db, auth_user, after, limit)
+            if not events and wait_for_changes(dbapi_conn, wait):
+                # End the transaction to obtain a new snapshot
+                db.rollback()
+                events = query_change_events(db, auth_user, after, limit)
+            return get_change_feed_response(events, after)
+    finally:
+        db.close()
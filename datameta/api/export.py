@@ -0,0 +1,151 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import io
+import json
+import logging
+from typing import Dict
+from pyramid.view import view_config
+from pyramid.request import Request
+from pyramid.response import Response
+from sqlalchemy.orm import joinedload, selectinload
+
+from .. import security
+from ..models import MetaDatum, MetaDataSet, ServiceExecution, Service
+from .metadatasets import MetaDataSetResponse, query_submitted_metadatasets, load_file_metadatumrecords
+
+log = logging.getLogger(__name__)
+
+# Number of metadatasets fetched from the server-side cursor at once
+EXPORT_BATCH_SIZE = 500
+
+EXPORT_CONTENT_TYPES = {
+        "ndjson"  : "application/x-ndjson",
+        "tsv"     : "text/tab-separated-values",
+        }
+
+
+class MetaDataSetExport:
+    """WSGI application iterator streaming the metadatasets returned by a query
+    as NDJSON or TSV. The iterator owns the database session the query is bound
+    to and closes it once the export is finished or aborted."""
+
+    def __init__(self, db, query, metadata_with_access: Dict[str, MetaDatum], export_format: str):
+        self.db                     = db
+        self.query                  = query
+        self.metadata_with_access   = metadata_with_access
+        self.export_format          = export_format
+
+    def __iter__(self):
+        try:
+            if self.export_format == "tsv":
+                yield from self._iter_tsv()
+            else:
+                yield from self._iter_ndjson()
+        finally:
+            self.close()
+
+    def _iter_responses(self):
+        for mdata_sets in self._iter_batches():
+            # The record values are read from the denormalized metadataset
+            # records, only the file records are loaded for the file IDs
+            load_file_metadatumrecords(self.db, mdata_sets, self.metadata_with_access)
+            for mdata_set in mdata_sets:
+                yield MetaDataSetResponse.from_metadataset(mdata_set, self.metadata_with_access)
+
+    def _iter_batches(self):
+        batch = []
+        for mdata_set in self.query:
+            batch.append(mdata_set)
+            if len(batch) == EXPORT_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _iter_ndjson(self):
+        for mdata_set_response in self._iter_responses():
+            yield (json.dumps(mdata_set_response.to_dict()) + "\n").encode()
+
+    def _iter_tsv(self):
+        mdata_names = [ mdatum.name for mdatum in sorted(self.metadata_with_access.values(), key=lambda mdatum: mdatum.order) ]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter="\t", lineterminator="\n")
+
+        def line(values):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(values)
+            return buffer.getvalue().encode()
+
+        yield line([ "id", "submissionId", "userId" ] + mdata_names)
+        for mdata_set_response in self._iter_responses():
+            yield line(
+                    [ mdata_set_response.id["site"], mdata_set_response.submission_id["site"], mdata_set_response.user_id["site"] ]
+                    + [ mdata_set_response.record.get(name) or "" for name in mdata_names ]
+                    )
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+@view_config(
+    route_name      = "rpc_export_metadatasets",
+    request_method  = "GET",
+    openapi         = True
+)
+def export_metadatasets(request: Request) -> Response:
+    """Stream all submitted metadatasets matching the filtering criteria"""
+    auth_user = security.revalidate_user(request)
+
+    # GET parameters
+    export_format = request.openapi_validated.parameters.query.get('format', 'ndjson')
+    submitted_after = request.openapi_validated.parameters.query.get('submittedAfter')
+    submitted_before = request.openapi_validated.parameters.query.get('submittedBefore')
+    awaiting_service = request.openapi_validated.parameters.query.get('awaitingService')
+
+    # The response body is generated after the request transaction has been
+    # closed, so the export uses a separate session. REPEATABLE READ provides
+    # a consistent snapshot for the duration of the export.
+    db = request.registry['dbsession_factory']()
+    db.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+
+    try:
+        query, metadata_with_access = query_submitted_metadatasets(db, auth_user, submitted_after, submitted_before, awaiting_service)
+    except Exception:
+        db.close()
+        raise
+
+    # Collections are loaded with 'select in' loading per batch, joined eager
+    # loading of collections is incompatible with server-side cursors
+    query = query\
+            .options(selectinload(MetaDataSet.service_executions).joinedload(ServiceExecution.user))\
+            .options(selectinload(MetaDataSet.service_executions).joinedload(ServiceExecution.service).selectinload(Service.target_metadata))\
+            .options(joinedload(MetaDataSet.submission))\
+            .options(joinedload(MetaDataSet.user))\
+            .yield_per(EXPORT_BATCH_SIZE)
+
+    # The response is streamed and cannot be validated against the API
+    # specification without materializing it
+    request.environ["pyramid_openapi3.validate_response"] = False
+
+    log.info("User exported MetaDataSets.", extra={"user_id": auth_user.id, "format": export_format})
+    return Response(
+            app_iter       = MetaDataSetExport(db, query, metadata_with_access, export_format),
+            content_type   = EXPORT_CONTENT_TYPES[export_format],
+            charset        = "utf-8",
+            )
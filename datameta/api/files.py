@@ -19,6 +19,7 @@ from pyramid.request import Request
 from pyramid.httpexceptions import HTTPOk, HTTPNotFound, HTTPForbidden, HTTPConflict, HTTPNoContent
 from typing import Optional
 from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload
 from .. import models, siteid, security, storage, resource, errors
 from ..security import authz
 from . import DataHolderBase
@@ -54,27 +55,45 @@ class FileResponse(FileBase):
     filesize          : Optional[int] = None
 
 
-def delete_staged_file_from_db(file_id, db, auth_user):
-    # Obtain file from database
-    db_file = resource.resource_query_by_id(db, models.File, file_id).one_or_none()
+def delete_staged_files_from_db(file_ids, db, auth_user):
+    """Deletes the specified staged files from the database. The files are
+    resolved with a single query and deleted with a single DELETE statement.
 
-    # Check if file could be found
-    if db_file is None:
+    Returns:
+        A list of (user UUID, file UUID, storage URI) tuples of the deleted files
+    """
+    # Obtain files from database
+    db_files = resource.resources_by_ids(db, models.File, file_ids, joinedload(models.File.metadatumrecord), joinedload(models.File.user))
+
+    # Check if files could be found
+    if any(db_file is None for db_file in db_files.values()):
         raise HTTPNotFound(json=None)
 
-    # Check if requesting user has access to the file
-    if not authz.submit_file(auth_user, db_file):
+    # The same file may have been specified by UUID and site ID
+    db_files = { db_file.id : db_file for db_file in db_files.values() }
+
+    # Check if requesting user has access to the files
+    if not all(authz.submit_file(auth_user, db_file) for db_file in db_files.values()):
         raise HTTPForbidden(json=None)
 
-    if db_file.metadatumrecord is not None:
+    if any(db_file.metadatumrecord is not None for db_file in db_files.values()):
         raise errors.get_not_modifiable_error()
 
-    user_uuid, file_uuid, storage_uri = db_file.user.uuid, db_file.uuid, db_file.storage_uri
+    deleted_files = [ (db_file.user.uuid, db_file.uuid, db_file.storage_uri) for db_file in db_files.values() ]
+
+    # Delete the database records
+    file_ids = list(db_files.keys())
+    db.query(models.DownloadToken).filter(models.DownloadToken.file_id.in_(file_ids)).delete(synchronize_session = False)
+    db.query(models.File).filter(models.File.id.in_(file_ids)).delete(synchronize_session = False)
 
-    # Delete the database record
-    db.delete(db_file)
+    for db_file in db_files.values():
+        db.expunge(db_file)
 
-    return user_uuid, file_uuid, storage_uri
+    return deleted_files
+
+
+def delete_staged_file_from_db(file_id, db, auth_user):
+    return delete_staged_files_from_db([ file_id ], db, auth_user)[0]
 
 
 def access_file_by_user(
@@ -108,10 +127,7 @@ def delete_files(request: Request) -> HTTPNoContent:
 
     db = request.dbsession
 
-    deleted_files = [
-        delete_staged_file_from_db(file_id, db, auth_user)
-        for file_id in set(request.openapi_validated.body["fileIds"])
-    ]
+    deleted_files = delete_staged_files_from_db(request.openapi_validated.body["fileIds"], db, auth_user)
 
     # Commit transaction
     request.tm.commit()
@@ -121,8 +137,8 @@ def delete_files(request: Request) -> HTTPNoContent:
     for user_uuid, file_uuid, storage_uri in deleted_files:
         log.info("File record deleted from the database.", extra={"user_uuid": user_uuid, "file_uuid": file_uuid})
     # Delete the files from storage
+    storage.rm_all(request, [ storage_uri for _, _, storage_uri in deleted_files ])
     for user_uuid, file_uuid, storage_uri in deleted_files:
-        storage.rm(request, storage_uri)
         log.info("File deleted from storage.", extra={"user_uuid": user_uuid, "file_uuid": file_uuid})
 
     return HTTPNoContent()
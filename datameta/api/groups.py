@@ -15,6 +15,7 @@
 from pyramid.view import view_config
 from pyramid.request import Request
 from typing import List
+from collections import defaultdict
 from dataclasses import dataclass
 from . import DataHolderBase
 from .. import models
@@ -46,13 +47,19 @@ class GroupSubmissions:
                 Group.submissions
             ).joinedload(
                 models.Submission.metadatasets
-            ).joinedload(
-                models.MetaDataSet.metadatumrecords
-            ).joinedload(
-                models.MetaDatumRecord.metadatum
             )
         ).one_or_none()
 
+        # Query the files associated with the metadatasets of the submissions
+        file_ids = defaultdict(list)
+        files = db.query(models.MetaDataSet.submission_id, models.File)\
+            .join(models.MetaDatumRecord, models.MetaDatumRecord.file_id == models.File.id)\
+            .join(models.MetaDataSet, models.MetaDatumRecord.metadataset_id == models.MetaDataSet.id)\
+            .join(models.Submission, models.MetaDataSet.submission_id == models.Submission.id)\
+            .filter(models.Submission.group_id == group.id)
+        for submission_id, db_file in files:
+            file_ids[submission_id].append(get_identifier(db_file))
+
         self.submissions = [
             {
                 "id": get_identifier(sub),
@@ -61,24 +68,11 @@ class GroupSubmissions:
                     get_identifier(mset)
                     for mset in sub.metadatasets
                 ],
-                "fileIds": self._get_file_ids_of_submission(sub)
+                "fileIds": file_ids[sub.id]
             }
             for sub in group.submissions
         ]
 
-    def _get_file_ids_of_submission(self, submission: models.Submission):
-        file_ids = []
-        for mset in submission.metadatasets:
-            file_records = [
-                rec
-                for rec in mset.metadatumrecords
-                if rec.metadatum.isfile and rec.value
-            ]
-            file_ids.extend(
-                [get_identifier(rec.file) for rec in file_records]
-            )
-        return file_ids
-
     def __json__(self, requests: Request) -> List[dict]:
         return self.submissions
 
@@ -0,0 +1,227 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import datetime
+import uuid
+from dataclasses import dataclass
+from typing import List
+from pyramid.view import view_config
+from pyramid.request import Request
+from pyramid.httpexceptions import HTTPNotFound, HTTPForbidden, HTTPNoContent
+from sqlalchemy import and_, exists
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import joinedload
+
+from . import DataHolderBase
+from .. import security, errors
+from ..security import authz
+from ..models import MetaDataSet, Service, ServiceExecution, ServiceLease
+from ..resource import get_identifier, resource_by_id, resource_query_by_id
+from .metadatasets import MetaDataSetResponse, query_submitted_metadatasets, load_file_metadatumrecords
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class ServiceLeaseResponse(DataHolderBase):
+    """ServiceLeaseResponse container for OpenApi communication"""
+    id               : dict
+    service_id       : dict
+    metadataset_id   : dict
+    expires          : str  # ISO format
+
+    @staticmethod
+    def from_service_lease(service_lease: ServiceLease):
+        return ServiceLeaseResponse(
+                id               = get_identifier(service_lease),
+                service_id       = get_identifier(service_lease.service),
+                metadataset_id   = get_identifier(service_lease.metadataset),
+                expires          = service_lease.expires.isoformat() + '+00:00'  # Assuming UTC datetimes in the database
+                )
+
+
+@dataclass
+class ServiceLeaseClaimResponse(ServiceLeaseResponse):
+    """ServiceLeaseClaimResponse container for OpenApi communication"""
+    metadataset      : MetaDataSetResponse
+
+    @staticmethod
+    def from_service_lease(service_lease: ServiceLease, metadataset: MetaDataSetResponse):
+        return ServiceLeaseClaimResponse(
+                id               = get_identifier(service_lease),
+                service_id       = get_identifier(service_lease.service),
+                metadataset_id   = get_identifier(service_lease.metadataset),
+                expires          = service_lease.expires.isoformat() + '+00:00',  # Assuming UTC datetimes in the database
+                metadataset      = metadataset
+                )
+
+
+@view_config(
+    route_name="services_id_leases",
+    renderer='json',
+    request_method="POST",
+    openapi=True
+)
+def post(request: Request) -> List[ServiceLeaseClaimResponse]:
+    """Claim up to `count` metadatasets awaiting the execution of a service for
+    `duration` seconds. Metadatasets that are leased by another user or locked
+    by a concurrent claim are skipped."""
+    auth_user = security.revalidate_user(request)
+    db = request.dbsession
+
+    count = request.openapi_validated.body["count"]
+    duration = request.openapi_validated.body["duration"]
+
+    service = resource_query_by_id(db, Service, request.matchdict['id'])\
+            .options(joinedload(Service.users))\
+            .one_or_none()
+
+    if service is None:
+        raise HTTPNotFound()
+
+    # Check if the user is allowed to execute this service
+    if not authz.lease_service(auth_user, service):
+        raise HTTPForbidden()
+
+    now = datetime.datetime.utcnow()
+    expires = now + datetime.timedelta(seconds = duration)
+
+    # Query metadatasets that are awaiting this service and are not leased
+    # currently. Rows that are locked by concurrent claims are skipped.
+    query, metadata_with_access = query_submitted_metadatasets(db, auth_user, awaiting_service = service.site_id)
+    mset_ids = [ mset_id for (mset_id,) in query
+            .with_entities(MetaDataSet.id)
+            .filter(~exists().where(and_(
+                ServiceLease.metadataset_id == MetaDataSet.id,
+                ServiceLease.service_id == service.id,
+                ServiceLease.expires > now
+                )))
+            .limit(count)
+            .with_for_update(skip_locked = True, of = MetaDataSet) ]
+
+    if not mset_ids:
+        return []
+
+    # Remove expired leases of the claimed metadatasets
+    db.query(ServiceLease)\
+            .filter(and_(ServiceLease.service_id == service.id, ServiceLease.metadataset_id.in_(mset_ids)))\
+            .delete(synchronize_session = False)
+
+    # Lease the metadatasets. Metadatasets that were leased by a concurrent
+    # claim, which is not visible to this transaction, are skipped.
+    lease_ids = [ lease_id for (lease_id,) in db.execute(
+            insert(ServiceLease.__table__)
+            .values([
+                {
+                    "uuid"             : uuid.uuid4(),
+                    "service_id"       : service.id,
+                    "user_id"          : auth_user.id,
+                    "metadataset_id"   : mset_id,
+                    "expires"          : expires,
+                    }
+                for mset_id in mset_ids
+                ])
+            .on_conflict_do_nothing(index_elements = [ "service_id", "metadataset_id" ])
+            .returning(ServiceLease.id)
+            ) ]
+
+    if not lease_ids:
+        return []
+
+    mset_order = { mset_id : idx for idx, mset_id in enumerate(mset_ids) }
+    service_leases = sorted(
+            db.query(ServiceLease)
+            .filter(ServiceLease.id.in_(lease_ids))
+            .options(joinedload(ServiceLease.service), joinedload(ServiceLease.metadataset)),
+            key = lambda service_lease: mset_order[service_lease.metadataset_id]
+            )
+    mset_ids = [ service_lease.metadataset_id for service_lease in service_leases ]
+
+    # Load the leased metadatasets and the entities we're going to access
+    mdata_sets = db.query(MetaDataSet)\
+            .filter(MetaDataSet.id.in_(mset_ids))\
+            .options(joinedload(MetaDataSet.service_executions).joinedload(ServiceExecution.user))\
+            .options(joinedload(MetaDataSet.service_executions).joinedload(ServiceExecution.service).joinedload(Service.target_metadata))\
+            .options(joinedload(MetaDataSet.submission))\
+            .all()
+    load_file_metadatumrecords(db, mdata_sets, metadata_with_access)
+    mdata_sets_by_id = { mdata_set.id : mdata_set for mdata_set in mdata_sets }
+
+    log.info("Service leases claimed.", extra={"user_id": auth_user.id, "service_id": service.id, "n_leases": len(service_leases)})
+    return [
+            ServiceLeaseClaimResponse.from_service_lease(
+                service_lease,
+                MetaDataSetResponse.from_metadataset(mdata_sets_by_id[service_lease.metadataset_id], metadata_with_access)
+                )
+            for service_lease in service_leases
+            ]
+
+
+def get_own_lease(db, auth_user, lease_id: str, check_expiration = True) -> ServiceLease:
+    """Obtains the specified service lease and checks that it is held by the
+    specified user and, unless disabled, that it has not expired yet.
+
+    Raises:
+        HTTPNotFound - The lease does not exist
+        HTTPForbidden - The lease is held by another user
+        HTTPForbidden - The lease has expired (ResourceNotModifiableError)
+    """
+    service_lease = resource_by_id(db, ServiceLease, lease_id)
+
+    if service_lease is None:
+        raise HTTPNotFound()
+
+    if not authz.update_service_lease(auth_user, service_lease):
+        raise HTTPForbidden()
+
+    if check_expiration and service_lease.expires <= datetime.datetime.utcnow():
+        raise errors.get_not_modifiable_error()
+
+    return service_lease
+
+
+@view_config(
+    route_name="service_leases_id",
+    renderer='json',
+    request_method="PUT",
+    openapi=True
+)
+def put(request: Request) -> ServiceLeaseResponse:
+    """Renew a service lease"""
+    auth_user = security.revalidate_user(request)
+    db = request.dbsession
+
+    service_lease = get_own_lease(db, auth_user, request.matchdict['id'])
+    service_lease.expires = datetime.datetime.utcnow() + datetime.timedelta(seconds = request.openapi_validated.body["duration"])
+
+    return ServiceLeaseResponse.from_service_lease(service_lease)
+
+
+@view_config(
+    route_name="service_leases_id",
+    renderer='json',
+    request_method="DELETE",
+    openapi=True
+)
+def delete(request: Request) -> HTTPNoContent:
+    """Release a service lease"""
+    auth_user = security.revalidate_user(request)
+    db = request.dbsession
+
+    # Releasing an expired lease is a no-op from the perspective of the client
+    service_lease = get_own_lease(db, auth_user, request.matchdict['id'], check_expiration = False)
+    db.delete(service_lease)
+
+    return HTTPNoContent()
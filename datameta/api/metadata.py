@@ -12,41 +12,108 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import uuid
 from dataclasses import dataclass
-from typing import Optional, List
+from typing import Optional, List, Dict
 from pyramid.request import Request
 from pyramid.view import view_config
 from . import DataHolderBase
-from ..models import MetaDatum, User, Service, MetaDataSet, MetaDatumRecord
+from ..models import MetaDatum, User, Service, MetaDataSet, DateTimeMode
 from .. import resource, security
+from ..cache import VersionedCache
 from ..security import authz
 from ..resource import resource_by_id, get_identifier
 from pyramid.httpexceptions import HTTPForbidden, HTTPNotFound
 from sqlalchemy.orm import joinedload
+from sqlalchemy import func
 
 
-def get_all_metadata(db, include_service_metadata = True):
-    """Queries all metadata that are currently defined and returns the database
-    objects as a dictionary with the metadata names as keys.
+@dataclass(frozen=True)
+class ServiceDefinition:
+    """Immutable snapshot of the identifiers of a service"""
+    id                 : int
+    uuid               : uuid.UUID
+    site_id            : str
+
+
+@dataclass(frozen=True)
+class MetaDatumDefinition:
+    """Immutable snapshot of a metadatum definition"""
+    id                 : int
+    uuid               : uuid.UUID
+    name               : str
+    regexp             : Optional[str]
+    short_description  : Optional[str]
+    long_description   : Optional[str]
+    datetimefmt        : Optional[str]
+    datetimemode       : Optional[DateTimeMode]
+    mandatory          : bool
+    example            : str
+    order              : int
+    isfile             : bool
+    submission_unique  : bool
+    site_unique        : bool
+    service_id         : Optional[int]
+    service            : Optional[ServiceDefinition]
+
+
+def load_metadata_definitions(db) -> Dict[str, MetaDatumDefinition]:
+    """Loads snapshots of all metadata that are currently defined"""
+    services = {}
+    definitions = {}
+    for mdatum in db.query(MetaDatum).options(joinedload(MetaDatum.service)).order_by(MetaDatum.id):
+        if mdatum.service is not None and mdatum.service.id not in services:
+            services[mdatum.service.id] = ServiceDefinition(
+                    id       = mdatum.service.id,
+                    uuid     = mdatum.service.uuid,
+                    site_id  = mdatum.service.site_id
+                    )
+        definitions[mdatum.name] = MetaDatumDefinition(
+                id                 = mdatum.id,
+                uuid               = mdatum.uuid,
+                name               = mdatum.name,
+                regexp             = mdatum.regexp,
+                short_description  = mdatum.short_description,
+                long_description   = mdatum.long_description,
+                datetimefmt        = mdatum.datetimefmt,
+                datetimemode       = mdatum.datetimemode,
+                mandatory          = mdatum.mandatory,
+                example            = mdatum.example,
+                order              = mdatum.order,
+                isfile             = mdatum.isfile,
+                submission_unique  = mdatum.submission_unique,
+                site_unique        = mdatum.site_unique,
+                service_id         = mdatum.service_id,
+                service            = services.get(mdatum.service_id)
+                )
+    return definitions
+
+
+# Process-wide registry of the metadata definitions. Has to be invalidated by
+# every transaction that changes a metadatum.
+metadata_registry = VersionedCache("metadata", load_metadata_definitions)
+
+
+def get_all_metadata(db, include_service_metadata = True) -> Dict[str, MetaDatumDefinition]:
+    """Obtains all metadata that are currently defined from the metadata
+    registry and returns their immutable definitions as a dictionary with the
+    metadata names as keys.
 
     Arguments:
         include_service_metadata - If true, include metadata with a service reference,
         otherwise exclude those
     """
-    q = db.query(MetaDatum)
-    if not include_service_metadata:
-        q = q.filter(MetaDatum.service_id.is_(None))
-    return { mdata.name : mdata for mdata in q }
+    return { name : mdatum for name, mdatum in metadata_registry.get(db).items() if include_service_metadata or mdatum.service_id is None }
 
 
-def get_service_metadata(db):
-    """Queries all metadata that are currently defined and are service
+def get_service_metadata(db) -> Dict[str, MetaDatumDefinition]:
+    """Obtains all metadata that are currently defined and are service
     metadata."""
-    return { mdata.name : mdata for mdata in db.query(MetaDatum).filter(MetaDatum.service_id.isnot(None)) }
+    return { name : mdatum for name, mdatum in metadata_registry.get(db).items() if mdatum.service_id is not None }
 
 
-def get_metadata_with_access(db, user: User):
-    """Queries all metadata that are currently defined and reduces the set
+def get_metadata_with_access(db, user: User) -> Dict[str, MetaDatumDefinition]:
+    """Obtains all metadata that are currently defined and reduces the set
     according to the specified user's data access rights"""
     all_metadata = get_all_metadata(db, include_service_metadata = True)
     return authz.get_readable_metadata(all_metadata, user)
@@ -121,6 +188,15 @@ def put(request: Request) -> MetaDataResponseElement:
     db = request.dbsession
     target_metadatum = resource_by_id(db, MetaDatum, metadata_id)
 
+    # Rename the corresponding keys of the denormalized metadataset records
+    if body["name"] != target_metadatum.name:
+        db.query(MetaDataSet)\
+                .filter(MetaDataSet.record.has_key(target_metadatum.name))\
+                .update({
+                    MetaDataSet.record : MetaDataSet.record.op('-')(target_metadatum.name).op('||')(
+                        func.jsonb_build_object(body["name"], MetaDataSet.record[target_metadatum.name]))
+                    }, synchronize_session = False)
+
     target_metadatum.name                = body["name"]
     target_metadatum.short_description   = body["regexDescription"] if body["regexDescription"] else None
     target_metadatum.long_description    = body["longDescription"] if body["longDescription"] else None
@@ -143,6 +219,9 @@ def put(request: Request) -> MetaDataResponseElement:
     else:
         target_metadatum.service_id = None
 
+    # Make all processes reload the metadata definitions
+    metadata_registry.invalidate(db)
+
     return MetaDataResponseElement(
         id                    =  resource.get_identifier(target_metadatum),
         name                  =  target_metadatum.name,
@@ -194,12 +273,11 @@ def post(request: Request) -> MetaDataResponseElement:
     )
 
     db.add(metadatum)
-
-    # Add a NULL value for every metadataset
-    db.add_all(MetaDatumRecord(metadataset_id=mset_id, metadatum=metadatum) for (mset_id,) in db.query(MetaDataSet.id))
-
     db.flush()
 
+    # Make all processes reload the metadata definitions
+    metadata_registry.invalidate(db)
+
     return MetaDataResponseElement(
         id                    =  resource.get_identifier(metadatum),
         name                  =  metadatum.name,
@@ -18,19 +18,23 @@ from pyramid.httpexceptions import HTTPForbidden, HTTPNotFound, HTTPNoContent
 from pyramid.view import view_config
 from pyramid.request import Request
 from sqlalchemy.orm import joinedload
-from sqlalchemy import and_
-from typing import Optional, Dict, List
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import and_, tuple_, select, func
+from typing import Optional, Dict, List, Iterable
+from collections import Counter, defaultdict
 from ..linting import validate_metadataset_record
-from .. import security, siteid, resource, validation
-from ..models import MetaDatum, MetaDataSet, ServiceExecution, Service, MetaDatumRecord, Submission, File
+from .. import security, siteid, resource, validation, pagination
+from ..models import MetaDatum, MetaDataSet, ServiceExecution, ServiceLease, Service, MetaDatumRecord, Submission, File, User, ChangeEventType
 from ..security import authz
 import datetime
+import uuid
 from datetime import timezone
-from ..resource import resource_by_id, resource_query_by_id, get_identifier
-from ..utils import get_record_from_metadataset
+from ..resource import resource_query_by_id, get_identifier
+from ..utils import get_record_from_metadataset, get_record_from_values, render_record_values
 from . import DataHolderBase
 from .. import errors
-from .metadata import get_all_metadata, get_service_metadata, get_metadata_with_access
+from .metadata import get_all_metadata, get_metadata_with_access
+from .changes import record_change_events
 
 log = logging.getLogger(__name__)
 
@@ -59,21 +63,50 @@ class MetaDataSetResponse(DataHolderBase):
         a dictionary of metadata [MetaDatum.name, MetaDatum] that the receiving
         user has read access to."""
 
-        # Identify file ids associated with this metadataset for metadata with access
-        file_ids = { mdrec.metadatum.name : resource.get_identifier_or_none(mdrec.file)
-                for mdrec in metadataset.metadatumrecords
-                if mdrec.metadatum.isfile and mdrec.metadatum.name in metadata_with_access}
         # Build the metadataset response
         return MetaDataSetResponse(
                 id                 = get_identifier(metadataset),
                 record             = get_record_from_metadataset(metadataset, metadata_with_access),
-                file_ids           = file_ids,
+                file_ids           = get_file_ids_from_metadataset(metadataset, metadata_with_access),
                 user_id            = get_identifier(metadataset.user),
                 submission_id      = get_identifier(metadataset.submission) if metadataset.submission else None,
                 service_executions = collect_service_executions(metadata_with_access, metadataset)
                 )
 
 
+@dataclass
+class BulkServiceExecutionResponse(DataHolderBase):
+    """BulkServiceExecutionResponse container for OpenApi communication"""
+    metadataset_id         : dict
+    service_execution_id   : dict
+
+
+def get_file_ids_from_metadataset(mdata_set: MetaDataSet, metadata: Dict[str, MetaDatum]) -> Dict[str, Optional[dict]]:
+    """Identify the file IDs associated with the metadataset for the file
+    metadata among the specified metadata. Records are stored sparsely, file
+    metadata without a record are mapped to None."""
+    file_ids = { name : None for name, mdatum in metadata.items() if mdatum.isfile }
+    file_ids.update({ mdrec.metadatum.name : resource.get_identifier_or_none(mdrec.file)
+        for mdrec in mdata_set.metadatumrecords
+        if mdrec.metadatum.isfile and mdrec.metadatum.name in metadata })
+    return file_ids
+
+
+def set_metadatumrecord_values(db, mdata_set: MetaDataSet, metadata: Dict[str, MetaDatum], record: dict):
+    """Sets the values of the specified metadata in the records of the
+    metadataset and in its denormalized record. The metadatum records of the
+    metadataset have to be loaded. Records are stored sparsely, missing records
+    are only created for non-NULL values."""
+    mdatum_recs = { mdatum_rec.metadatum_id : mdatum_rec for mdatum_rec in mdata_set.metadatumrecords }
+    for name, value in record.items():
+        mdatum_rec = mdatum_recs.get(metadata[name].id)
+        if mdatum_rec is not None:
+            mdatum_rec.value = value
+        elif value is not None:
+            db.add(MetaDatumRecord(metadatum = metadata[name], metadataset = mdata_set, value = value))
+    mdata_set.record = { **mdata_set.record, **record }
+
+
 def record_to_strings(record: Dict[str, str]):
     return {
         k: str(v) if v is not None else None
@@ -81,44 +114,45 @@ def record_to_strings(record: Dict[str, str]):
     }
 
 
-def render_record_values(metadata: Dict[str, MetaDatum], record: dict) -> dict:
-    """Renders values of a metadataset record. Please note: the record should already have passed validation."""
-    record_rendered = record.copy()
-    for field in metadata:
-        if field not in record_rendered:
-            # if field is not contained in record, add it as None to the record:
-            record_rendered[field] = None
-            continue
-        elif record_rendered[field] and metadata[field].datetimefmt:
-            # if MetaDatum is a datetime field, render the value in isoformat
-            record_rendered[field] = datetime.datetime.strptime(
-                    record_rendered[field],
-                    metadata[field].datetimefmt
-                    ).isoformat()
-    return record_rendered
-
+def delete_staged_metadatasets_from_db(mdata_ids: Iterable[str], db, auth_user):
+    """Deletes the specified staged metadatasets and their records. The
+    metadatasets are resolved with a single query and deleted with one DELETE
+    statement per table.
 
-def delete_staged_metadataset_from_db(mdata_id, db, auth_user, request):
-    # Find the requested metadataset
-    mdata_set = resource_by_id(db, MetaDataSet, mdata_id)
+    Raises:
+        HTTPNotFound - One of the metadatasets does not exist
+        HTTPForbidden - One of the metadatasets is not owned by the user
+        HTTPForbidden - One of the metadatasets was already submitted (ResourceNotModifiableError)
+    """
+    # Find the requested metadatasets
+    mdata_sets = resource.resources_by_ids(db, MetaDataSet, mdata_ids)
 
-    # Check if the metadataset exists
-    if not mdata_set:
+    # Check if the metadatasets exist
+    if any(mdata_set is None for mdata_set in mdata_sets.values()):
         raise HTTPNotFound()
 
-    # Check if user owns this metadataset
-    if not authz.delete_mset(auth_user, mdata_set):
+    # The same metadataset may have been specified by UUID and site ID
+    mdata_sets = { mdata_set.id : mdata_set for mdata_set in mdata_sets.values() }
+
+    # Check if user owns these metadatasets
+    if not all(authz.delete_mset(auth_user, mdata_set) for mdata_set in mdata_sets.values()):
         raise HTTPForbidden()
 
-    # Check if the metadataset was already submitted
-    if mdata_set.submission:
+    # Check if any of the metadatasets was already submitted
+    if any(mdata_set.submission_id is not None for mdata_set in mdata_sets.values()):
         raise errors.get_not_modifiable_error()
 
-    # Delete the records
-    request.dbsession.query(MetaDatumRecord).filter(MetaDatumRecord.metadataset_id == mdata_set.id).delete()
+    # Delete the records and the metadatasets
+    mset_ids = list(mdata_sets.keys())
+    db.query(MetaDatumRecord).filter(MetaDatumRecord.metadataset_id.in_(mset_ids)).delete(synchronize_session = False)
+    db.query(MetaDataSet).filter(MetaDataSet.id.in_(mset_ids)).delete(synchronize_session = False)
+
+    for mdata_set in mdata_sets.values():
+        db.expunge(mdata_set)
+
 
-    # Delete the metadataset
-    db.delete(mdata_set)
+def delete_staged_metadataset_from_db(mdata_id, db, auth_user):
+    delete_staged_metadatasets_from_db([ mdata_id ], db, auth_user)
 
 
 @view_config(
@@ -133,8 +167,7 @@ def delete_metadatasets(request: Request) -> HTTPNoContent:
 
     db = request.dbsession
 
-    for mdata_id in set(request.openapi_validated.body["metadatasetIds"]):
-        delete_staged_metadataset_from_db(mdata_id, db, auth_user, request)
+    delete_staged_metadatasets_from_db(request.openapi_validated.body["metadatasetIds"], db, auth_user)
 
     return HTTPNoContent()
 
@@ -167,31 +200,21 @@ def post(request: Request) -> MetaDataSetResponse:
     mdata_set = MetaDataSet(
         site_id = siteid.generate(request, MetaDataSet),
         user_id = auth_user.id,
-        submission_id = None
+        submission_id = None,
+        record = record
     )
     db.add(mdata_set)
-    db.flush()
-
-    # Add NULL values for service metadata
-    service_metadata = get_service_metadata(db)
-    for s_mdatum in service_metadata.values():
-        mdatum_rec = MetaDatumRecord(
-                metadatum_id     = s_mdatum.id,
-                metadataset_id   = mdata_set.id,
-                file_id          = None,
-                value            = None
-                )
-        db.add(mdatum_rec)
 
-    # Add the non-service metadata as specified in the request body
+    # Add the non-service metadata as specified in the request body. Records
+    # are stored sparsely, NULL values are not stored.
     for name, value in record.items():
-        mdatum_rec = MetaDatumRecord(
-            metadatum_id     = metadata[name].id,
-            metadataset_id   = mdata_set.id,
-            file_id          = None,
-            value            = value
-        )
-        db.add(mdatum_rec)
+        if value is not None:
+            db.add(MetaDatumRecord(
+                metadatum_id     = metadata[name].id,
+                metadataset      = mdata_set,
+                file_id          = None,
+                value            = value
+            ))
 
     return MetaDataSetResponse(
         id              = get_identifier(mdata_set),
@@ -202,6 +225,51 @@ def post(request: Request) -> MetaDataSetResponse:
     )
 
 
+def stage_metadatasets(request: Request, auth_user, metadata: Dict[str, MetaDatum], records: List[dict]) -> List[int]:
+    """Creates staged metadatasets for the provided validated and rendered
+    records with one INSERT statement per table. Returns the IDs of the
+    created metadatasets."""
+    if not records:
+        return []
+    db = request.dbsession
+
+    # Allocate the primary keys up front, such that the metadatum records can
+    # be inserted without obtaining the keys row by row
+    site_ids = siteid.generate_many(request, MetaDataSet, len(records))
+    mset_ids = [ mset_id for (mset_id,) in db.execute(
+        select([ func.nextval(func.pg_get_serial_sequence(MetaDataSet.__tablename__, 'id')) ])
+        .select_from(func.generate_series(1, len(records)))
+        ) ]
+
+    db.bulk_insert_mappings(MetaDataSet, [
+        {
+            "id"              : mset_id,
+            "site_id"         : site_id,
+            "uuid"            : uuid.uuid4(),
+            "user_id"         : auth_user.id,
+            "submission_id"   : None,
+            "record"          : record
+            }
+        for mset_id, site_id, record in zip(mset_ids, site_ids, records)
+        ])
+
+    # Records are stored sparsely, NULL values are not stored.
+    db.bulk_insert_mappings(MetaDatumRecord, [
+        {
+            "uuid"             : uuid.uuid4(),
+            "metadatum_id"     : metadata[name].id,
+            "metadataset_id"   : mset_id,
+            "file_id"          : None,
+            "value"            : value
+            }
+        for mset_id, record in zip(mset_ids, records)
+        for name, value in record.items()
+        if value is not None
+        ])
+
+    return mset_ids
+
+
 def collect_service_executions(metadata_with_access: Dict[str, MetaDatum], mdata_set: MetaDataSet) -> Optional[Dict[str, Optional[MetaDataSetServiceExecution]]]:
     # Collect service metadata from provided metadata with access
     service_metadata = { name : mdatum for name, mdatum in metadata_with_access.items() if mdatum.service_id is not None }
@@ -234,32 +302,189 @@ def collect_service_executions(metadata_with_access: Dict[str, MetaDatum], mdata
     return service_executions
 
 
-@view_config(
-    route_name="metadatasets",
-    renderer='json',
-    request_method="GET",
-    openapi=True
-)
-def get_metadatasets(request: Request) -> List[MetaDataSetResponse]:
-    """Query metadatasets according to filtering critera"""
-    auth_user = security.revalidate_user(request)
-    db = request.dbsession
+def restrict_metadata(metadata: Dict[str, MetaDatum], fields: Iterable[str]) -> Dict[str, MetaDatum]:
+    """Reduces the provided dictionary of metadata to the requested fields.
+
+    Raises:
+        HTTPBadRequest - One of the requested fields is not among the provided metadata
+    """
+    fields = set(fields)
+    unknown_fields = sorted(fields.difference(metadata))
+    if unknown_fields:
+        raise errors.get_validation_error(
+                messages = [ f"Unknown field '{field}'" for field in unknown_fields ],
+                fields = [ 'fields' for _ in unknown_fields ]
+                )
+    return { name : mdatum for name, mdatum in metadata.items() if name in fields }
+
+
+def load_metadatumrecords(db, mdata_sets: List[MetaDataSet], metadata: Dict[str, MetaDatum], chunk_size = 1000):
+    """Loads the records of the specified metadata for the given metadatasets
+    and populates the `metadatumrecords` collections of the metadatasets with
+    them. Records of other metadata are not loaded. Instead of eager loading
+    the collections along with the metadatasets, the records are loaded with
+    one query per chunk of metadatasets."""
+    records_by_mset = { mdata_set.id : [] for mdata_set in mdata_sets }
+    mdata_ids = [ mdatum.id for mdatum in metadata.values() ]
+    if mdata_ids:
+        mset_ids = list(records_by_mset.keys())
+        for idx in range(0, len(mset_ids), chunk_size):
+            query = db.query(MetaDatumRecord).filter(and_(
+                MetaDatumRecord.metadataset_id.in_(mset_ids[idx:idx + chunk_size]),
+                MetaDatumRecord.metadatum_id.in_(mdata_ids)
+                ))
+            # Only join the files if file metadata were requested
+            if any(mdatum.isfile for mdatum in metadata.values()):
+                query = query.options(joinedload(MetaDatumRecord.file))
+            for mdatum_rec in query:
+                records_by_mset[mdatum_rec.metadataset_id].append(mdatum_rec)
+    for mdata_set in mdata_sets:
+        set_committed_value(mdata_set, 'metadatumrecords', records_by_mset[mdata_set.id])
+
+
+def load_file_metadatumrecords(db, mdata_sets: List[MetaDataSet], metadata: Dict[str, MetaDatum]):
+    """Loads the records of the file metadata among the specified metadata for
+    the given metadatasets. Only these are required to build responses, the
+    values of all records are read from the denormalized metadataset records."""
+    load_metadatumrecords(db, mdata_sets, { name : mdatum for name, mdatum in metadata.items() if mdatum.isfile })
+
+
+# The columns required to build metadataset responses from flat result rows
+# using `build_metadataset_responses`. Queries selecting these have to include
+# MetaDataSet, User and Submission.
+METADATASET_RESPONSE_COLUMNS = [
+        MetaDataSet.id.label('mset_id'),
+        MetaDataSet.uuid.label('mset_uuid'),
+        MetaDataSet.site_id.label('mset_site_id'),
+        MetaDataSet.record.label('mset_record'),
+        User.uuid.label('user_uuid'),
+        User.site_id.label('user_site_id'),
+        Submission.uuid.label('submission_uuid'),
+        Submission.site_id.label('submission_site_id'),
+        Submission.date.label('submission_date'),
+        ]
+
+
+def identifier(uuid_value, site_id: Optional[str] = None) -> dict:
+    """Builds the identifier dictionary from selected ID columns, see
+    `resource.get_identifier`"""
+    ids = { 'uuid' : str(uuid_value) }
+    if site_id is not None:
+        ids['site'] = site_id
+    return ids
+
+
+def select_file_ids(db, mset_ids: List[int], metadata: Dict[str, MetaDatum], chunk_size = 1000) -> Dict[int, Dict[str, Optional[dict]]]:
+    """Selects the IDs of the files associated with the specified metadatasets
+    for the file metadata among the specified metadata, one query per chunk of
+    metadatasets. Records are stored sparsely, file metadata without a linked
+    file are mapped to None."""
+    file_metadata = { mdatum.id : name for name, mdatum in metadata.items() if mdatum.isfile }
+    file_ids = { mset_id : { name : None for name in file_metadata.values() } for mset_id in mset_ids }
+    if file_metadata:
+        for idx in range(0, len(mset_ids), chunk_size):
+            stmt = select([ MetaDatumRecord.metadataset_id, MetaDatumRecord.metadatum_id, File.uuid, File.site_id ])\
+                    .select_from(MetaDatumRecord.__table__.join(File.__table__, MetaDatumRecord.file_id == File.id))\
+                    .where(and_(
+                        MetaDatumRecord.metadataset_id.in_(mset_ids[idx:idx + chunk_size]),
+                        MetaDatumRecord.metadatum_id.in_(list(file_metadata.keys()))
+                        ))
+            for mset_id, mdatum_id, file_uuid, file_site_id in db.execute(stmt):
+                file_ids[mset_id][file_metadata[mdatum_id]] = identifier(file_uuid, file_site_id)
+    return file_ids
+
+
+def select_service_executions(db, mset_ids: List[int], metadata_with_access: Dict[str, MetaDatum], chunk_size = 1000) -> Dict[int, Optional[Dict[str, Optional[MetaDataSetServiceExecution]]]]:
+    """Selects the service executions of the specified metadatasets, one query
+    per chunk of metadatasets, and maps them to the service metadata with
+    access like `collect_service_executions`."""
+    service_metadata_names = defaultdict(list)
+    for name, mdatum in metadata_with_access.items():
+        if mdatum.service_id is not None:
+            service_metadata_names[mdatum.service_id].append(name)
+
+    # If there are no service metadata among the metadata with access, we're returning None
+    if not service_metadata_names:
+        return { mset_id : None for mset_id in mset_ids }
+
+    service_executions = { mset_id : { name : None for names in service_metadata_names.values() for name in names } for mset_id in mset_ids }
+    for idx in range(0, len(mset_ids), chunk_size):
+        stmt = select([
+                    ServiceExecution.metadataset_id,
+                    ServiceExecution.service_id,
+                    ServiceExecution.uuid,
+                    ServiceExecution.datetime,
+                    Service.uuid,
+                    Service.site_id,
+                    User.uuid,
+                    User.site_id
+                    ])\
+                .select_from(ServiceExecution.__table__
+                    .join(Service.__table__, ServiceExecution.service_id == Service.id)
+                    .join(User.__table__, ServiceExecution.user_id == User.id))\
+                .where(and_(
+                    ServiceExecution.metadataset_id.in_(mset_ids[idx:idx + chunk_size]),
+                    ServiceExecution.service_id.in_(list(service_metadata_names.keys()))
+                    ))
+        for mset_id, service_id, sexec_uuid, sexec_datetime, service_uuid, service_site_id, user_uuid, user_site_id in db.execute(stmt):
+            sexec = MetaDataSetServiceExecution(
+                    service_execution_id   = identifier(sexec_uuid),
+                    execution_time         = sexec_datetime.isoformat() + '+00:00',  # Assuming UTC datetimes in the database
+                    service_id             = identifier(service_uuid, service_site_id),
+                    user_id                = identifier(user_uuid, user_site_id)
+                    )
+            for name in service_metadata_names[service_id]:
+                service_executions[mset_id][name] = sexec
+    return service_executions
 
-    # GET parameters
-    submitted_after = request.openapi_validated.parameters.query.get('submittedAfter')
-    submitted_before = request.openapi_validated.parameters.query.get('submittedBefore')
-    awaiting_service = request.openapi_validated.parameters.query.get('awaitingService')
 
-    # Query metadata sets and join entities that we are going to use.
+def build_metadataset_responses(db, rows, metadata_with_access: Dict[str, MetaDatum], file_metadata: Optional[Dict[str, MetaDatum]] = None, response_class = None, **row_fields) -> list:
+    """Builds metadataset responses from flat result rows of a Core select of
+    the METADATASET_RESPONSE_COLUMNS. File IDs and service executions are
+    selected with one query each per chunk of metadatasets.
+
+    Arguments:
+        rows                  - The result rows
+        metadata_with_access  - The metadata the receiving user has read access to
+        file_metadata         - The metadata to report file IDs for, defaults to `metadata_with_access`
+        response_class        - The response class, defaults to MetaDataSetResponse
+        row_fields            - Additional fields of the response class mapped to
+                                functions obtaining their values from a row
+    """
+    response_class = response_class if response_class is not None else MetaDataSetResponse
+    mset_ids = [ row.mset_id for row in rows ]
+    file_ids = select_file_ids(db, mset_ids, file_metadata if file_metadata is not None else metadata_with_access)
+    service_executions = select_service_executions(db, mset_ids, metadata_with_access)
+    return [
+            response_class(
+                id                   = identifier(row.mset_uuid, row.mset_site_id),
+                record               = get_record_from_values(row.mset_record, metadata_with_access),
+                file_ids             = file_ids[row.mset_id],
+                user_id              = identifier(row.user_uuid, row.user_site_id),
+                submission_id        = identifier(row.submission_uuid, row.submission_site_id),
+                service_executions   = service_executions[row.mset_id],
+                **{ field : get_value(row) for field, get_value in row_fields.items() }
+                )
+            for row in rows
+            ]
+
+
+def query_submitted_metadatasets(db, auth_user, submitted_after=None, submitted_before=None, awaiting_service=None):
+    """Builds a query for the submitted metadatasets visible to the specified
+    user, filtered according to the specified criteria and ordered by
+    submission date and metadataset ID. No loading options are applied to the
+    query.
+
+    Returns:
+        The query and a dictionary of the metadata the user has read access to
+
+    Raises:
+        HTTPBadRequest - The specified service ID is invalid
+    """
+    # Query metadata sets.
     # NOTE: JOINing 'Submission' reduces to submitted metadatasets and enables
     # filtering on Submission attributes
-    query = db.query(MetaDataSet)\
-            .join(Submission)\
-            .options(joinedload(MetaDataSet.service_executions).joinedload(ServiceExecution.user))\
-            .options(joinedload(MetaDataSet.service_executions).joinedload(ServiceExecution.service).joinedload(Service.target_metadata))\
-            .options(joinedload(MetaDataSet.metadatumrecords).joinedload(MetaDatumRecord.metadatum))\
-            .options(joinedload(MetaDataSet.metadatumrecords).joinedload(MetaDatumRecord.file))\
-            .options(joinedload(MetaDataSet.submission))
+    query = db.query(MetaDataSet).join(Submission)
 
     # Check which metadata of this metadataset the user is allowed to view
     metadata_with_access = get_metadata_with_access(db, auth_user)
@@ -288,18 +513,68 @@ def get_metadatasets(request: Request) -> List[MetaDataSetResponse]:
             ServiceExecution.service_id == readable_services_by_id[awaiting_service].id
             )).filter(ServiceExecution.id.is_(None))
 
+    # Apply a stable ordering
+    query = query.order_by(Submission.date, MetaDataSet.id)
+
+    return query, metadata_with_access
+
+
+@view_config(
+    route_name="metadatasets",
+    renderer='json',
+    request_method="GET",
+    openapi=True
+)
+def get_metadatasets(request: Request) -> List[MetaDataSetResponse]:
+    """Query metadatasets according to filtering critera"""
+    auth_user = security.revalidate_user(request)
+    db = request.dbsession
+
+    # GET parameters
+    submitted_after = request.openapi_validated.parameters.query.get('submittedAfter')
+    submitted_before = request.openapi_validated.parameters.query.get('submittedBefore')
+    awaiting_service = request.openapi_validated.parameters.query.get('awaitingService')
+    limit = request.openapi_validated.parameters.query.get('limit')
+    after = request.openapi_validated.parameters.query.get('after')
+    fields = request.openapi_validated.parameters.query.get('fields')
+
+    query, metadata_with_access = query_submitted_metadatasets(db, auth_user, submitted_after, submitted_before, awaiting_service)
+
+    # Restrict the metadata to the requested fields if specified
+    if fields is not None:
+        metadata_with_access = restrict_metadata(metadata_with_access, fields)
+
+    # Select flat rows instead of loading the metadatasets as ORM objects
+    query = query\
+            .join(User, MetaDataSet.user_id == User.id)\
+            .with_entities(*METADATASET_RESPONSE_COLUMNS)
+
+    # Continue after the cursor position if one was specified (keyset pagination)
+    if after is not None:
+        try:
+            after_date, after_id = pagination.decode_cursor(after, datetime.datetime.fromisoformat, int)
+        except pagination.CursorError:
+            raise errors.get_validation_error(messages=['Invalid cursor specified'], fields=['after'])
+        query = query.filter(tuple_(Submission.date, MetaDataSet.id) > tuple_(after_date, after_id))
+
+    # Fetch one additional row to determine whether there is a next page
+    if limit is not None:
+        query = query.limit(limit + 1)
+
     # Execute the query
-    mdata_sets = query.all()
+    rows = db.execute(query.statement).fetchall()
 
     # No results? Return 404
-    if not mdata_sets:
+    if not rows:
         raise HTTPNotFound()
 
+    # Provide the cursor for the next page if there is one
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        request.response.headers['X-Next-Cursor'] = pagination.encode_cursor(rows[-1].submission_date, rows[-1].mset_id)
+
     log.info("User queried MetaDataSets.", extra={"user_id": auth_user.id})
-    return [
-            MetaDataSetResponse.from_metadataset(mdata_set, metadata_with_access)
-            for mdata_set in mdata_sets
-            ]
+    return build_metadataset_responses(db, rows, metadata_with_access)
 
 
 @view_config(
@@ -313,13 +588,13 @@ def get_metadataset(request: Request) -> MetaDataSetResponse:
     auth_user = security.revalidate_user(request)
     db = request.dbsession
 
+    fields = request.openapi_validated.parameters.query.get('fields')
+
     # Query the targeted metadataset and join the related entities that we are
-    # going to access
+    # going to access. The records are loaded separately below.
     mdata_set = resource_query_by_id(db, MetaDataSet, request.matchdict['id'])\
             .options(joinedload(MetaDataSet.service_executions).joinedload(ServiceExecution.user))\
             .options(joinedload(MetaDataSet.service_executions).joinedload(ServiceExecution.service).joinedload(Service.target_metadata))\
-            .options(joinedload(MetaDataSet.metadatumrecords).joinedload(MetaDatumRecord.metadatum))\
-            .options(joinedload(MetaDataSet.metadatumrecords).joinedload(MetaDatumRecord.file))\
             .options(joinedload(MetaDataSet.submission))\
             .one_or_none()
 
@@ -337,6 +612,13 @@ def get_metadataset(request: Request) -> MetaDataSetResponse:
     else:
         metadata_with_access = get_metadata_with_access(db, auth_user)
 
+    # Restrict the metadata to the requested fields if specified
+    if fields is not None:
+        metadata_with_access = restrict_metadata(metadata_with_access, fields)
+
+    # Load the records of the metadata that are part of the response
+    load_file_metadatumrecords(db, [ mdata_set ], metadata_with_access)
+
     log.info("Returned a MetaDataSet by its ID.", extra={"user_id": auth_user.id, "metadataset_id": request.matchdict['id']})
     # Check and annotate service executions
     return MetaDataSetResponse.from_metadataset(mdata_set, metadata_with_access)
@@ -354,7 +636,7 @@ def delete_metadataset(request: Request) -> HTTPNoContent:
 
     db = request.dbsession
 
-    delete_staged_metadataset_from_db(request.matchdict['id'], db, auth_user, request)
+    delete_staged_metadataset_from_db(request.matchdict['id'], db, auth_user)
 
     return HTTPNoContent()
 
@@ -389,8 +671,6 @@ def set_metadata_via_service(request: Request) -> MetaDataSetResponse:
 
     service_metadata = { mdatum.name : mdatum for mdatum in service.target_metadata }
 
-    service_records = { rec.metadatum.name : rec for rec in metadataset.metadatumrecords if rec.metadatum.name in service_metadata }
-
     # Return 403 if the user has no permission to execute this service or the
     # service has already been executed for this metadataset
     if service.id in (sexec.service_id for sexec in metadataset.service_executions):
@@ -422,11 +702,7 @@ def set_metadata_via_service(request: Request) -> MetaDataSetResponse:
     validate_metadataset_record(service_metadata, records, return_err_message=False, rendered=False)
 
     # Update the metadatum records
-    records = render_record_values(service_metadata, records)
-    for record_name, record_value in records.items():
-        db_rec = service_records[record_name]
-        db_rec.value = record_value
-        db.add(db_rec)
+    set_metadatumrecord_values(db, metadataset, service_metadata, render_record_values(service_metadata, records))
 
     # Validate the associations between files and records
     fnames, ref_fnames, val_errors = validation.validate_submission_association(db_files, { metadataset.site_id : metadataset }, ignore_submitted_metadatasets=True)
@@ -454,7 +730,164 @@ def set_metadata_via_service(request: Request) -> MetaDataSetResponse:
 
     db.add(sexec)
 
+    # Release the leases for this service on this metadataset, if any
+    db.query(ServiceLease)\
+            .filter(and_(ServiceLease.service_id == service.id, ServiceLease.metadataset_id == metadataset.id))\
+            .delete(synchronize_session = False)
+
     # Check which metadata of this metadataset the user is allowed to view
     metadata_with_access = get_metadata_with_access(db, auth_user)
 
-    return MetaDataSetResponse.from_metadataset(metadataset, metadata_with_access)
+    response = MetaDataSetResponse.from_metadataset(metadataset, metadata_with_access)
+
+    # Announce the service execution on the change feed once everything else
+    # has been done, as the creation of change events is serialized
+    record_change_events(db, ChangeEventType.SERVICE_EXECUTION, [ metadataset.id ], service_id = service.id)
+
+    return response
+
+
+@view_config(
+    route_name="service_execution_bulk",
+    renderer='json',
+    request_method="POST",
+    openapi=True
+)
+def set_metadata_via_service_bulk(request: Request) -> List[BulkServiceExecutionResponse]:
+    """Endpoint for the submission of results of a service execution for
+    multiple metadatasets at once. The results are validated as a batch and are
+    either all stored or, if any of them is invalid, none of them."""
+
+    # Check authentication or raise 401
+    auth_user = security.revalidate_user(request)
+    db = request.dbsession
+
+    service = resource.resource_query_by_id(db, Service, request.matchdict['serviceId'])\
+            .options(joinedload(Service.target_metadata))\
+            .options(joinedload(Service.users))\
+            .one_or_none()
+
+    # Return 404 if the service could not be found
+    if service is None:
+        raise HTTPNotFound()
+
+    # Return 403 if the user has no permission to execute this service
+    if not authz.execute_service(auth_user, service):
+        raise HTTPForbidden(json_body={})
+
+    service_metadata = { mdatum.name : mdatum for mdatum in service.target_metadata }
+    executions = request.openapi_validated.body["executions"]
+
+    # Query all specified metadatasets and files at once
+    mset_ids = [ execution["metadatasetId"] for execution in executions ]
+    db_msets = resource.resources_by_ids(db, MetaDataSet, mset_ids)
+    db_files = resource.resources_by_ids(
+            db,
+            File,
+            ( file_id for execution in executions for file_id in execution["fileIds"] ),
+            joinedload(File.metadatumrecord)
+            )
+
+    # Validate submission access to the specified files
+    validation.validate_submission_access(db, db_files, {}, auth_user)
+
+    # Load the service records of the metadatasets and determine which of them
+    # the service has already been executed for
+    found_msets = { db_mset.id : db_mset for db_mset in db_msets.values() if db_mset is not None }
+    load_metadatumrecords(db, list(found_msets.values()), service_metadata)
+    executed_mset_ids = { mset_id for (mset_id,) in db.query(ServiceExecution.metadataset_id).filter(and_(
+        ServiceExecution.service_id == service.id,
+        ServiceExecution.metadataset_id.in_(list(found_msets.keys()))
+        )) } if found_msets else set()
+
+    # The files of every execution, a file may have been referenced by more
+    # than one identifier
+    exec_files_all = [ { db_files[file_id].id : (file_id, db_files[file_id]) for file_id in execution["fileIds"] } for execution in executions ]
+
+    # Count the occurrences of the metadatasets and files, which may have been
+    # referenced by different identifiers
+    mset_id_counts = Counter(db_msets[mset_id].id for mset_id in mset_ids if db_msets[mset_id] is not None)
+    file_id_counts = Counter(file_id for exec_files in exec_files_all for file_id in exec_files)
+
+    val_errors = []  # tuples (entity, field, message)
+    valid_executions = []
+    for execution, exec_files in zip(executions, exec_files_all):
+        mset_id = execution["metadatasetId"]
+        db_mset = db_msets[mset_id]
+        item_errors = []
+
+        if db_mset is None:
+            val_errors.append((resource.get_identifier_from_idstring(mset_id), None, "Not found"))
+            continue
+        if mset_id_counts[db_mset.id] > 1:
+            item_errors.append((db_mset, None, "Metadataset occurs multiple times among provided results"))
+        if db_mset.id in executed_mset_ids:
+            item_errors.append((db_mset, None, "Service has already been executed for this metadataset"))
+        item_errors += [ (db_file, None, "File occurs in multiple results") for file_id, (_, db_file) in exec_files.items() if file_id_counts[file_id] > 1 ]
+
+        # Try to associate all metadata in the record with the service metadata
+        records = record_to_strings(execution["record"])
+        item_errors += [ (db_mset, mdatum_name, "Metadatum unknown or not associated with the specified service.")
+                for mdatum_name in records if mdatum_name not in service_metadata ]
+
+        # Validate the provided records
+        if not item_errors:
+            item_errors += [ (db_mset, mset_error['field'], mset_error['message'])
+                    for mset_error in validate_metadataset_record(service_metadata, records, return_err_message=True, rendered=False) ]
+
+        if item_errors:
+            val_errors += item_errors
+        else:
+            valid_executions.append((db_mset, records, dict(exec_files.values())))
+
+    # Update the metadatum records and validate the associations between files
+    # and records of every individual metadataset
+    ref_fnames_all = []
+    for db_mset, records, exec_files in valid_executions:
+        set_metadatumrecord_values(db, db_mset, service_metadata, render_record_values(service_metadata, records))
+
+        fnames, ref_fnames, assoc_errors = validation.validate_submission_association(exec_files, { db_mset.site_id : db_mset }, ignore_submitted_metadatasets=True)
+        val_errors += assoc_errors
+        ref_fnames_all.append((fnames, ref_fnames))
+
+    # If there were any validation errors, return 400
+    if val_errors:
+        entities, fields, messages = zip(*val_errors)
+        raise errors.get_validation_error(messages=messages, fields=fields, entities=entities)
+
+    # Given that validation hasn't failed, we know that file names are unique.
+    # Associate the files with the metadata
+    for fnames, ref_fnames in ref_fnames_all:
+        for fname, mdatrec in ref_fnames.items():
+            mdatrec.file = fnames[fname][0]
+
+    # Create the service executions with a single insert
+    now = datetime.datetime.utcnow()
+    sexecs = [
+            {
+                "uuid"             : uuid.uuid4(),
+                "service_id"       : service.id,
+                "user_id"          : auth_user.id,
+                "metadataset_id"   : db_mset.id,
+                "datetime"         : now,
+                }
+            for db_mset, _, _ in valid_executions
+            ]
+    db.bulk_insert_mappings(ServiceExecution, sexecs)
+
+    # Release the leases for this service on these metadatasets, if any
+    db.query(ServiceLease)\
+            .filter(and_(ServiceLease.service_id == service.id, ServiceLease.metadataset_id.in_(list(found_msets.keys()))))\
+            .delete(synchronize_session = False)
+
+    # Announce the service executions on the change feed
+    record_change_events(db, ChangeEventType.SERVICE_EXECUTION, [ db_mset.id for db_mset, _, _ in valid_executions ], service_id = service.id)
+
+    log.info("Service execution results submitted.", extra={"user_id": auth_user.id, "service_id": service.id, "n_msets": len(sexecs)})
+    return [
+            BulkServiceExecutionResponse(
+                metadataset_id         = get_identifier(db_mset),
+                service_execution_id   = { "uuid" : str(sexec["uuid"]) }
+                )
+            for (db_mset, _, _), sexec in zip(valid_executions, sexecs)
+            ]
@@ -73,6 +73,7 @@ def put(request):
 
     # Set the new password
     auth_user.pwhash = security.register_password(db, auth_user.id, request_newPassword)
+    security.invalidate_user(db, auth_user.id)
 
     # Delete the password token if any
     if token:
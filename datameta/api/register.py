@@ -17,7 +17,7 @@ from pyramid.request import Request
 from pyramid.httpexceptions import HTTPNoContent
 
 from dataclasses import dataclass
-from ..models import Group, ApplicationSetting, User, RegRequest
+from ..models import Group, User, RegRequest
 from . import DataHolderBase
 from .. import email, errors
 from ..resource import get_identifier, resource_by_id
@@ -46,11 +46,11 @@ def get(request: Request) -> RegisterOptionsResponse:
 
     db = request.dbsession
 
-    user_agreement = db.query(ApplicationSetting).filter(ApplicationSetting.key == "user_agreement").first()
+    user_agreement = get_setting(db, "user_agreement")
     groups = db.query(Group)
 
     if user_agreement is not None:
-        user_agreement = str(user_agreement.str_value)
+        user_agreement = str(user_agreement)
 
     return RegisterOptionsResponse(
         user_agreement = user_agreement,
@@ -88,9 +88,9 @@ def post(request):
     check_user_agreement = request.openapi_validated.body['check_user_agreement']
 
     # check, if a user agreement exists
-    user_agreement = db.query(ApplicationSetting).filter(ApplicationSetting.key == "user_agreement").first()
+    user_agreement = get_setting(db, "user_agreement")
 
-    if str(user_agreement.str_value) == '':
+    if str(user_agreement) == '':
         check_user_agreement = True
 
     # Check, if the user accepted the user agreement
@@ -20,8 +20,9 @@ from pyramid.request import Request
 from pyramid.httpexceptions import HTTPNoContent
 from typing import List
 from .. import security, resource, validation, siteid
-from ..models import Submission
+from ..models import Submission, Group, ChangeEventType
 from . import DataHolderBase
+from .changes import record_change_events
 
 log = logging.getLogger(__name__)
 
@@ -104,6 +105,17 @@ def post(request: Request) -> SubmissionResponse:
     db.add(submission)
     db.flush()
 
+    # A metadataset may have been referenced by more than one identifier
+    mset_ids = { db_mset.id for db_mset in db_msets.values() }
+
+    # Maintain the number of submitted metadatasets of the group
+    db.query(Group)\
+            .filter(Group.id == auth_user.group_id)\
+            .update({ Group.n_metadatasets : Group.n_metadatasets + len(mset_ids) }, synchronize_session = False)
+
+    # Announce the submitted metadatasets on the change feed
+    record_change_events(db, ChangeEventType.SUBMISSION, sorted(mset_ids), submission_id = submission.id)
+
     log.info("Created new Submission.", extra={"user_id": auth_user.id, "submission_label": label})
     return SubmissionResponse(
             id = resource.get_identifier(submission),
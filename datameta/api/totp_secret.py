@@ -40,5 +40,6 @@ def delete_totp_secret(request: Request):
 
     target_user.tfa_secret = None
     db.flush()
+    security.invalidate_user(db, target_user.id)
 
     return HTTPOk()
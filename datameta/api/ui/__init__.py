@@ -19,6 +19,7 @@ def includeme(config: Configurator) -> None:
     """Pyramid knob."""
     config.add_route("pending", "/api/ui/pending")
     config.add_route("convert", "/api/ui/convert")
+    config.add_route("import_samplesheet", "/api/ui/import")
     config.add_route('admin_get', '/api/ui/admin')
     config.add_route('admin_put_request', '/api/ui/admin/request')
     config.add_route('forgot_api', '/api/ui/forgot')
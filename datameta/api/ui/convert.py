@@ -12,106 +12,292 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from pyramid.httpexceptions import HTTPOk
 from pyramid.request import Request
+from pyramid.response import Response
 from pyramid.view import view_config
+from dataclasses import dataclass
+from typing import List, Optional
 import webob
 import logging
-import csv
+import tempfile
+import hashlib
+import shutil
+import json
+import zlib
+import os
 
-import pandas as pd
-
-from ... import security, samplesheet, errors
-from ...utils import formatted_mrec_value_str
-from ..metadata import get_all_metadata
+from ... import security, samplesheet, errors, workerpool
+from ...cache import LRUCache, MemcachedCache, get_definition_version
+from .. import DataHolderBase
+from ..metadata import get_all_metadata, metadata_registry
+from ..metadatasets import stage_metadatasets
 
 log = logging.getLogger(__name__)
 
+WORKER_POOL_ERROR_MESSAGES = {
+        workerpool.WorkerPoolBusyError   : "The server is busy converting other sample sheets, please try again later.",
+        workerpool.WorkerTimeoutError    : "The conversion of the sample sheet took too long.",
+        workerpool.WorkerMemoryError     : "The sample sheet is too large to be converted.",
+        }
 
-def get_samplesheet_reader(file_like_obj):
-    """Given a file with tabular data which is either in delimited plain text
-    format or in XLS(X) format, returns a function capable of reading the file
-    and returning a pandas.DataFrame"""
-    # https://readxl.tidyverse.org/reference/excel_format.html
-    xlsx_sig    = b'PK\x03\x04'
-    xls_sig     = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
-    magic_bytes = file_like_obj.read(8)
 
-    file_like_obj.seek(0)
+class ConvertedSampleSheet:
+    """The result of the conversion of a sample sheet in a worker process,
+    which is stored in a temporary file that is removed when the object is
+    closed, or held in memory if it was obtained from the conversion cache.
+    Iterating yields the converted chunks."""
 
-    if magic_bytes.startswith(xlsx_sig) or magic_bytes.startswith(xls_sig):
-        def create_excel_reader(sheet):
-            return pd.read_excel(sheet, dtype="object")
-        return create_excel_reader
-    else:
-        dialect = csv.Sniffer().sniff(file_like_obj.read(1024).decode())
+    def __init__(self, path: Optional[str] = None, content: Optional[bytes] = None):
+        self.path = path
+        self.content = content
 
-        def create_table_reader(sheet, sep=dialect.delimiter):
-            return pd.read_table(sheet, dtype="object", sep=sep)
-        file_like_obj.seek(0)
-        return create_table_reader
+    def __iter__(self):
+        if self.content is not None:
+            for line in self.content.splitlines():
+                yield json.loads(line)
+            return
+        with open(self.path) as converted_file:
+            for line in converted_file:
+                yield json.loads(line)
 
+    def close(self):
+        if self.path is not None:
+            os.remove(self.path)
+            self.path = None
 
-####################################################################################################
 
+def get_conversion_cache(registry):
+    """Returns the cache of sample sheet conversion results of the application,
+    creating it on first use based on the application settings. The cache is
+    shared via memcached if servers are configured. Returns None if caching is
+    disabled."""
+    cache = registry.get("samplesheet_cache")
+    if cache is None:
+        settings = registry.settings
+        ttl = int(settings.get("datameta.samplesheet_cache.ttl", 3600))
+        if ttl <= 0:
+            return None
+        servers = settings.get("datameta.samplesheet_cache.url", "").split()
+        if servers:
+            cache = MemcachedCache(servers, ttl, key_prefix = "datameta.samplesheet.")
+        else:
+            cache = LRUCache(int(settings.get("datameta.samplesheet_cache.max_size", 256)) * 1024 * 1024, ttl)
+        cache = registry.setdefault("samplesheet_cache", cache)
+    return cache
 
-def convert_samplesheet(db, file_like_obj, filename, user):
-    # Try to read the sample sheet
-    try:
-        reader = get_samplesheet_reader(file_like_obj)
-        submitted_metadata = reader(file_like_obj)
-    except Exception as e:
-        log.info("Sample sheet conversion failed.", extra={"file_name": filename, "error": e})
-        raise samplesheet.SampleSheetReadError("Unable to parse the sample sheet.")
 
-    # Query column names that we expect to see in the sample sheet (intra-submission duplicates)
-    metadata               = get_all_metadata(db, include_service_metadata = False)
-    metadata_names         = list(metadata.keys())
-    metadata_datetimefmt   = { datum.name : datum.datetimefmt for datum in metadata.values() }
+def get_conversion_cache_key(db, input_file, validate: bool) -> Optional[str]:
+    """Returns the key of the conversion result of the uploaded sample sheet,
+    which is derived from the content of the sample sheet and the version of
+    the metadata definitions. Returns None if no version was recorded for the
+    metadata definitions."""
+    version = get_definition_version(db, metadata_registry.name)
+    if version is None:
+        return None
+
+    sheet_hash = hashlib.sha256()
+    for block in iter(lambda: input_file.file.read(1024 * 1024), b""):
+        sheet_hash.update(block)
+    input_file.file.seek(0)
+
+    return f"{sheet_hash.hexdigest()}.{version.hex}.{'validated' if validate else 'converted'}"
 
-    missing_columns  = [ metadata_name for metadata_name in metadata_names if metadata_name not in submitted_metadata.columns ]
-    if missing_columns:
-        raise samplesheet.SampleSheetReadError(f"Missing columns: {', '.join(missing_columns)}.")
 
-    # Limit the sample sheet to the columns of interest and drop duplicates
-    submitted_metadata = submitted_metadata[metadata_names].drop_duplicates()
+def compress_converted_samplesheet(path: str, max_size: int) -> Optional[bytes]:
+    """Compresses the converted sample sheet stored at `path` for the
+    conversion cache. Returns None if the result exceeds `max_size` bytes."""
+    compressor = zlib.compressobj(1)
+    compressed, size = [], 0
+    with open(path, "rb") as converted_file:
+        for block in iter(lambda: converted_file.read(1024 * 1024), b""):
+            compressed.append(compressor.compress(block))
+            size += len(compressed[-1])
+            if size > max_size:
+                return None
+    compressed.append(compressor.flush())
+    return None if size + len(compressed[-1]) > max_size else b"".join(compressed)
 
-    # Convert all data to strings
-    samplesheet.string_conversion(submitted_metadata, list(metadata.values()))
+
+def convert_samplesheet(request: Request, input_file, validate: bool = False) -> ConvertedSampleSheet:
+    """Converts an uploaded sample sheet to metadataset records in a worker
+    process. See samplesheet.convert_samplesheet_file() for the format of the
+    result. Results are cached by the content of the sample sheet, such that
+    repeated uploads of the same sample sheet are not converted again.
+
+    Raises:
+        SampleSheetReadError - The sample sheet could not be converted
+    """
+    cache = get_conversion_cache(request.registry)
+    cache_key = get_conversion_cache_key(request.dbsession, input_file, validate) if cache is not None else None
+    if cache_key is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            log.debug("Sample sheet conversion result obtained from cache.", extra={"file_name": input_file.filename})
+            return ConvertedSampleSheet(content = zlib.decompress(cached))
+
+    # Query column names that we expect to see in the sample sheet (intra-submission duplicates)
+    metadata = get_all_metadata(request.dbsession, include_service_metadata = False)
+
+    # The worker process reads the sample sheet from and writes the records
+    # to temporary files
+    with tempfile.NamedTemporaryFile(prefix = "samplesheet-", delete = False) as sheet_file:
+        shutil.copyfileobj(input_file.file, sheet_file)
+    converted_fd, converted_path = tempfile.mkstemp(prefix = "samplesheet-", suffix = ".ndjson")
+    os.close(converted_fd)
 
     try:
-        # Datetimes are converted according to the format string. Empty strings
-        # are converted to None aka null, i.e. setting metadata to an empty
-        # string value is not possible through the convert API.
-        return [ { mdname : None if not row[mdname] else formatted_mrec_value_str(row[mdname], metadata_datetimefmt[mdname]) for mdname in metadata_names } for _, row in submitted_metadata.iterrows() ]
+        workerpool.get_worker_pool(request.registry).run(
+                samplesheet.convert_samplesheet_file,
+                sheet_file.name,
+                converted_path,
+                metadata,
+                input_file.filename,
+                validate
+                )
     except Exception as e:
-        log.error("Unexpected error during sample sheet conversion.", extra={"file_name": filename, "error": e})
+        os.remove(converted_path)
+        if type(e) in WORKER_POOL_ERROR_MESSAGES:
+            raise samplesheet.SampleSheetReadError(WORKER_POOL_ERROR_MESSAGES[type(e)])
+        if isinstance(e, samplesheet.SampleSheetReadError):
+            raise
+        log.error("Unexpected error during sample sheet conversion.", extra={"file_name": input_file.filename, "error": e})
         raise samplesheet.SampleSheetReadError("Unknown error")
+    finally:
+        os.remove(sheet_file.name)
+
+    if cache_key is not None:
+        max_entry_size = int(request.registry.settings.get("datameta.samplesheet_cache.max_entry_size", 1)) * 1024 * 1024
+        compressed = compress_converted_samplesheet(converted_path, max_entry_size)
+        if compressed is not None:
+            cache.set(cache_key, compressed)
+
+    return ConvertedSampleSheet(converted_path)
+
+
+class SampleSheetRecords:
+    """WSGI application iterator streaming the records converted from a sample
+    sheet as a JSON array. Removes the converted sample sheet once the response
+    is sent or aborted."""
+
+    def __init__(self, converted: ConvertedSampleSheet):
+        self.converted = converted
+
+    def __iter__(self):
+        try:
+            yield b"["
+            separator = b""
+            for chunk in self.converted:
+                if chunk["records"]:
+                    yield separator + ",".join(json.dumps(record) for record in chunk["records"]).encode()
+                    separator = b","
+            yield b"]"
+        finally:
+            self.close()
+
+    def close(self):
+        self.converted.close()
 
 
 ####################################################################################################
 
 
+@dataclass
+class SampleSheetImportResponse(DataHolderBase):
+    """SampleSheetImportResponse container for OpenApi communication"""
+    n_staged              : int
+    failed_metadatasets   : List[dict]
+    errors                : List[dict]
+
+
+def get_uploaded_samplesheet(request: Request):
+    """Returns the sample sheet file uploaded with the request
+
+    Raises:
+        HTTPBadRequest - No file was uploaded
+    """
+    # Parse the request body
+    if 'file' not in request.POST or not isinstance(request.POST['file'], webob.compat.cgi_FieldStorage):
+        raise errors.get_validation_error(messages = [ "Invalid request" ])
+    # Extract the submitted file from request body
+    input_file = request.POST['file']
+    input_file.file.seek(0)
+    return input_file
+
+
 @view_config(
     route_name      = "convert",
-    renderer        = "json",
     request_method  = "POST",
 )
-def post(request: Request) -> HTTPOk:
+def post(request: Request) -> Response:
     """Convert a spreadsheet to JSON metadatasets"""
+    # Validate authorization or raise HTTPUnauthorized
+    security.revalidate_user(request)
+
+    input_file = get_uploaded_samplesheet(request)
+
+    try:
+        converted = convert_samplesheet(request, input_file)
+    except samplesheet.SampleSheetReadError as e:
+        log.warning("Unable to read sample sheet.", extra={"file_name": input_file.filename, "error": e})
+        raise errors.get_validation_error(messages = [ str(e) ])
+
+    # The records are sent chunk by chunk
+    return Response(
+            app_iter       = SampleSheetRecords(converted),
+            content_type   = "application/json",
+            charset        = "utf-8",
+            )
+
+
+@view_config(
+    route_name      = "import_samplesheet",
+    renderer        = "json",
+    request_method  = "POST",
+)
+def import_samplesheet(request: Request) -> SampleSheetImportResponse:
+    """Convert a spreadsheet and stage its rows as metadatasets. Rows that fail
+    validation are not staged but returned along with their validation errors,
+    identified by placeholder IDs."""
     db = request.dbsession
     # Validate authorization or raise HTTPUnauthorized
     auth_user = security.revalidate_user(request)
 
-    # Parse the request body
-    if 'file' not in request.POST or not isinstance(request.POST['file'], webob.compat.cgi_FieldStorage):
-        raise errors.get_validation_error(messages = [ "Invalid request" ])
-    # Extract the submitted file from request body
-    input_file = request.POST['file']
-    input_file.file.seek(0)
+    input_file = get_uploaded_samplesheet(request)
 
+    metadata = get_all_metadata(db, include_service_metadata = False)
+
+    # The sample sheet is converted and validated in a worker process
     try:
-        return convert_samplesheet(db, input_file.file, input_file.filename, auth_user)
+        converted = convert_samplesheet(request, input_file, validate = True)
     except samplesheet.SampleSheetReadError as e:
         log.warning("Unable to read sample sheet.", extra={"file_name": input_file.filename, "error": e})
         raise errors.get_validation_error(messages = [ str(e) ])
+
+    n_staged = 0
+    failed_msets, val_errors = [], []
+    try:
+        for chunk in converted:
+            # Stage the valid rows chunk by chunk
+            n_staged += len(stage_metadatasets(request, auth_user, metadata, chunk["records"]))
+
+            for failed in chunk["failed"]:
+                failed_mset = { "id" : { "uuid" : f"FAIL-{len(failed_msets)}" }, "record" : failed["record"] }
+                failed_msets.append(failed_mset)
+                val_errors += [
+                        {
+                            "exception"   : "ValidationError",
+                            "message"     : mset_error["message"],
+                            "field"       : mset_error.get("field"),
+                            "entity"      : failed_mset["id"]
+                            }
+                        for mset_error in failed["errors"]
+                        ]
+    finally:
+        converted.close()
+
+    log.info("Sample sheet imported.", extra={"user_id": auth_user.id, "file_name": input_file.filename, "n_staged": n_staged, "n_failed": len(failed_msets)})
+    return SampleSheetImportResponse(
+            n_staged              = n_staged,
+            failed_metadatasets   = failed_msets,
+            errors                = val_errors
+            )
@@ -35,7 +35,7 @@ def get_pending_metadatasets(dbsession, user, metadata: Dict[str, MetaDatum]):
         MetaDataSet.user == user,
         MetaDataSet.submission_id.is_(None))
         ).options(
-                joinedload(MetaDataSet.metadatumrecords).joinedload(MetaDatumRecord.metadatum)
+                joinedload(MetaDataSet.user)
                 ).all()
     return [
             MetaDataSetResponse(
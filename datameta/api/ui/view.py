@@ -12,28 +12,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from sqlalchemy.orm import joinedload, aliased
-from sqlalchemy import func, and_, or_, desc, asc
+from sqlalchemy.orm import aliased
+from sqlalchemy import func, and_, or_, desc, asc, tuple_
 
 from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.request import Request
 from pyramid.view import view_config
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, List, Callable, Any
+import datetime
 import shlex
 import logging
 
-from ... import security, errors, resource
+from ... import security, errors, pagination
 from ...security import authz
-from ...resource import get_identifier
-from ...models import MetaDatum, MetaDataSet, MetaDatumRecord, User, Group, Submission, ServiceExecution, Service
-from ...utils import get_record_from_metadataset
+from ...models import MetaDataSet, MetaDatumRecord, User, Group, Submission, record_values_text
 
 from ..metadata import get_all_metadata
-from ..metadatasets import MetaDataSetResponse, collect_service_executions
+from ..metadatasets import MetaDataSetResponse, METADATASET_RESPONSE_COLUMNS, build_metadataset_responses, identifier
 
 log = logging.getLogger(__name__)
 
+# The maximum number of search terms accepted by the view
+MAX_SEARCH_TERMS = 10
+
 
 @dataclass
 class ViewTableResponse(MetaDataSetResponse):
@@ -45,11 +47,66 @@ class ViewTableResponse(MetaDataSetResponse):
     user_name: Optional[str] = None
 
 
-def metadata_index_to_name(db, idx):
-    name = db.query(MetaDatum.name).order_by(MetaDatum.order).limit(1).offset(idx).scalar()
-    if not name:
-        errors.get_validation_error(["Invalid sort column index"])
-    return name
+# The columns selected for the view table in addition to the columns of the
+# metadataset response
+VIEW_COLUMNS = [
+        User.fullname.label('user_fullname'),
+        Submission.label.label('submission_label'),
+        Group.uuid.label('group_uuid'),
+        Group.site_id.label('group_site_id'),
+        Group.name.label('group_name'),
+        ]
+
+
+def metadata_index_to_id(db, idx):
+    metadata = sorted(get_all_metadata(db).values(), key = lambda mdatum: mdatum.order)
+    if not 0 <= idx < len(metadata):
+        raise errors.get_validation_error(["Invalid sort column index"])
+    return metadata[idx].id
+
+
+def decode_view_cursor(cursor: Optional[str], start: int, sort_idx: int, sort_asc: bool, search_value: str, converters: List[Callable[[Any], Any]]):
+    """Decodes a cursor returned with a previous page of the view table.
+
+    Returns:
+        The sort key values of the last row of the previous page if the cursor
+        was issued for the page preceding the requested one using the same
+        ordering and search, None otherwise
+    """
+    if not cursor:
+        return None
+    try:
+        values = pagination.decode_cursor(cursor, int, int, bool, str, *converters)
+    except pagination.CursorError:
+        return None
+    if values[:4] != [ start, sort_idx, sort_asc, search_value ]:
+        return None
+    return values[4:]
+
+
+def metadataset_search_query(db, search: str):
+    """Builds a query for the IDs of the metadatasets matching the specified
+    search term. A metadataset matches if the term occurs in any of its record
+    values, its site ID, the site ID or label of its submission, the site ID
+    or name of the submission's group or the site ID or name of the submitting
+    user. The metadataset record values and site IDs are trigram indexed,
+    submissions, groups and users are matched by joining on the indexed
+    foreign keys."""
+    pattern = f"%{search}%"
+
+    mdata_set_query = db.query(MetaDataSet.id)\
+            .filter(or_(record_values_text(MetaDataSet.record).ilike(pattern), MetaDataSet.site_id.ilike(pattern)))
+
+    submission_query = db.query(MetaDataSet.id)\
+            .join(Submission)\
+            .join(Group, Submission.group_id == Group.id)\
+            .filter(or_(*( field.ilike(pattern) for field in [ Submission.site_id, Submission.label, Group.site_id, Group.name ])))
+
+    user_query = db.query(MetaDataSet.id)\
+            .join(User, MetaDataSet.user_id == User.id)\
+            .filter(or_(User.site_id.ilike(pattern), User.fullname.ilike(pattern)))
+
+    return mdata_set_query.union(submission_query, user_query)
 
 
 @view_config(
@@ -81,7 +138,7 @@ def post(request: Request):
         start    = int(request.POST['start'])
         # Search patterns the user entered in the search field of the table,
         # may be empty
-        searches = request.POST['search[value]']
+        search_value = request.POST['search[value]']
         # The column index for sorting
         sort_idx = int(request.POST['order[0][column]'])
         # The sorting direction
@@ -103,135 +160,136 @@ def post(request: Request):
     if not authz.view_mset_any(auth_user):
         and_filters.append(Submission.group_id == auth_user.group_id)
 
-    # Additionally, if a search pattern was requested, we create a clause
-    # implementing the the search and add it to the AND clause
-    if searches:
+    # Additionally, if search patterns were requested, we AND link a clause
+    # for every search term restricting the results to metadatasets matching
+    # the term.
+    if search_value:
         # Split the search patterns into strings using a shell-like quoting
-        # logic. We will have to JOIN MetaDatumRecord for every search term to
-        # be able to AND link the search terms, thus we are also creating a
-        # MetaDatumRecord table alias for every search term.
-        searches = [ (search, aliased(MetaDatumRecord)) for search in shlex.split(searches) ]
+        # logic.
+        searches = shlex.split(search_value)
 
-        # Since every search term requires a JOIN, we limit the number of search terms
-        if len(searches) > 3:
+        if len(searches) > MAX_SEARCH_TERMS:
             return {
                     'draw' : draw,
-                    'error' : "Please enter at most 3 search terms"
+                    'error' : f"Please enter at most {MAX_SEARCH_TERMS} search terms"
                     }
 
-        # For every search term, we build a disjunctive clause ILIKEing the
-        # search term with the metadataset and submission site_ids, the
-        # submission label and the MetaDatumRecord value, using the table alias
-        # that was constructed for the search term before.
-        search_clauses = [ or_(*( field.ilike(f"%{search}%") for field in [ User.site_id, User.fullname, Group.site_id, Group.name, MetaDataSetFilter.site_id, Submission.site_id, Submission.label, MetaDatumRecordFilter.value ])) for search, MetaDatumRecordFilter in searches ]
-        and_filters += search_clauses
+        and_filters += [ MetaDataSetFilter.id.in_(metadataset_search_query(db, search).subquery()) for search in searches ]
 
     # Finally, the filter query, which will be added to the main query as a
     # subquery using EXISTS, is built
     filter_query = db.query(MetaDataSetFilter)
 
-    # As mentioned above, we have to join MetaDatumRecord for every search term
-    # that was entered. We're using the table aliases that we prepared above.
-    for _, MetaDatumRecordFilter in searches:
-        filter_query = filter_query.join(MetaDatumRecordFilter)
-
-    # Beyond MetaDatumRecord, we're joining Submission and Group and adding the
-    # WHERE clause by AND linking the clauses prepared above.
+    # We're joining Submission and adding the WHERE clause by AND linking the
+    # clauses prepared above.
     filter_query = filter_query\
             .join(Submission)\
-            .join(Group, Submission.group_id == Group.id)\
-            .join(User, MetaDataSetFilter.user_id == User.id)\
             .filter(and_(*and_filters))
 
-    # Query the matching metadatasets, adding the total number of records as an
-    # additional column by using COUNT() as a window function. This enables us
-    # to use OFFSET and LIMIT as specified in the request and yet get the total
-    # number of matching records as required by datatables.
-    mdatasets_base_query = db.query(MetaDataSet, func.count().over())
-
-    mdata_name = None
+    # Query the matching metadatasets. Besides the metadataset, the values of
+    # the sort keys are selected to build the cursor for the following page.
+    # The metadataset ID is added as the last sort key to obtain a total order.
+    # Nullable sort columns are complemented by an IS NULL key, which retains
+    # the NULL ordering of PostgreSQL (NULLS LAST for ascending, NULLS FIRST for
+    # descending order) while keeping the sort keys comparable.
     if   sort_idx == 0:  # The submission label
-        mdatasets_base_query = mdatasets_base_query.join(Submission).order_by(direction(Submission.label))
+        sort_keys = [ Submission.label.is_(None), func.coalesce(Submission.label, '') ]
+        converters = [ bool, str ]
     elif sort_idx == 1:  # The submission time
-        mdatasets_base_query = mdatasets_base_query.join(Submission).order_by(direction(Submission.date))
+        sort_keys = [ Submission.date.is_(None), func.coalesce(Submission.date, datetime.datetime.min) ]
+        converters = [ bool, datetime.datetime.fromisoformat ]
     elif sort_idx == 2:  # The user full name
-        mdatasets_base_query = mdatasets_base_query.join(User).order_by(direction(User.fullname))  # TODO FIX
-    elif sort_idx == 3:  # The submission group name
-        mdatasets_base_query = mdatasets_base_query.join(Submission).join(Group).order_by(direction(Group.site_id))  # TODO FIX
+        sort_keys = [ User.fullname.is_(None), func.coalesce(User.fullname, '') ]
+        converters = [ bool, str ]
+    elif sort_idx == 3:  # The submission group, ordered by its site ID
+        sort_keys = [ Group.site_id ]
+        converters = [ str ]
     elif sort_idx == 4:  # The metadataset site ID
-        mdatasets_base_query = mdatasets_base_query.order_by(direction(MetaDataSet.site_id))
+        sort_keys = [ MetaDataSet.site_id ]
+        converters = [ str ]
     else:  # Sorting by a metadatum value
-        mdata_name = metadata_index_to_name(db, sort_idx - 5)
-        # [WARNING] The following JOIN assumes that an inner join between MetaDatumRecord
-        # and MetaDatum does not result in a loss of rows if the JOIN is restricted to one
-        # particular MetaDatum.name. Put differently, this query requires that we always
-        # store a MetaDatumRecord for every MetaDatum known, even if it is NULL.
+        mdatum_id = metadata_index_to_id(db, sort_idx - 5)
+        sort_keys = [ MetaDatumRecord.value.is_(None), func.coalesce(MetaDatumRecord.value, '') ]
+        converters = [ bool, str ]
+
+    sort_keys.append(MetaDataSet.id)
+    converters.append(int)
+
+    # The view table is built from flat rows selected with the columns of the
+    # metadataset response, the additional columns of the view and the sort
+    # keys, no ORM objects are loaded.
+    columns = METADATASET_RESPONSE_COLUMNS + VIEW_COLUMNS
+    mdatasets_base_query = db.query(*columns, *( sort_key.label(f"sort_key_{idx}") for idx, sort_key in enumerate(sort_keys) ))\
+            .select_from(MetaDataSet)\
+            .join(Submission)\
+            .join(Group, Submission.group_id == Group.id)\
+            .join(User, MetaDataSet.user_id == User.id)
+
+    if sort_idx > 4:
+        # Records are stored sparsely, a missing MetaDatumRecord represents a
+        # NULL value. The OUTER JOIN keeps metadatasets without a record for
+        # the sort column.
         mdatasets_base_query = mdatasets_base_query\
-                .join(MetaDatumRecord)\
-                .join(MetaDatum, and_(MetaDatumRecord.metadatum_id == MetaDatum.id, MetaDatum.name == mdata_name))\
-                .order_by(direction(MetaDatumRecord.value))
+                .outerjoin(MetaDatumRecord, and_(MetaDatumRecord.metadataset_id == MetaDataSet.id, MetaDatumRecord.metadatum_id == mdatum_id))
 
-    # Add the EXISTS statement the query, specify the relationships that we want to JOIN for fast
-    # attribute access and specify the LIMIT / OFFSET as implied by the datatable page that is
-    # currently being viewed
+    # Add the EXISTS statement and the ordering to the query
     mdatasets_base_query = mdatasets_base_query\
             .filter(filter_query.exists())\
-            .options(joinedload(MetaDataSet.submission).joinedload(Submission.group))\
-            .options(joinedload(MetaDataSet.metadatumrecords).joinedload(MetaDatumRecord.metadatum))\
-            .options(joinedload(MetaDataSet.metadatumrecords).joinedload(MetaDatumRecord.file))\
-            .options(joinedload(MetaDataSet.user))\
-            .options(joinedload(MetaDataSet.service_executions).joinedload(ServiceExecution.user))\
-            .options(joinedload(MetaDataSet.service_executions).joinedload(ServiceExecution.service).joinedload(Service.target_metadata))\
-            .offset(start)\
-            .limit(length)\
-
-    mdata_sets = mdatasets_base_query.all()
-
-    # Extract the total number of matching records from the first record in the
-    # window if any, otherwise assume 0
-    records_filtered = 0 if not mdata_sets else mdata_sets[0][1]
-
-    # Query the total number of records
+            .order_by(*( direction(sort_key) for sort_key in sort_keys ))
+
+    # If the client passed the cursor of the preceding page, we continue after
+    # its last row (keyset pagination). Otherwise, e.g. when jumping to an
+    # arbitrary page, we fall back to OFFSET.
+    after_keys = decode_view_cursor(request.POST.get('cursor'), start, sort_idx, sort_asc, search_value, converters)
+    if after_keys is not None:
+        seek = tuple_(*sort_keys) > tuple_(*after_keys) if sort_asc else tuple_(*sort_keys) < tuple_(*after_keys)
+        mdatasets_base_query = mdatasets_base_query.filter(seek)
+    else:
+        mdatasets_base_query = mdatasets_base_query.offset(start)
+
+    rows = db.execute(mdatasets_base_query.limit(length).statement).fetchall()
+
+    # Query the number of matching records
+    records_filtered = db.query(func.count(MetaDataSet.id))\
+            .filter(filter_query.exists())\
+            .scalar()
+
+    # Query the total number of records from the counters of submitted
+    # metadatasets maintained per group
     # Note:
     # There seems to be little benefit of providing this number to datatables.
     # If different from records_filtered, the footer shows a summary as in
     # "Showing 1 to 25 of 502 entries (filtered from 1, 800 total entries)"
-    # otherwise only the first part of the message is shown. The query should
-    # be rather fast, but may be a waste of resources.
-    records_total = db.query(func.count(MetaDataSet.id))\
-            .select_from(MetaDataSet)\
-            .join(Submission)\
-            .filter(Submission.group_id == auth_user.group_id)\
-            .scalar()
+    # otherwise only the first part of the message is shown.
+    if authz.view_mset_any(auth_user):
+        records_total = db.query(func.coalesce(func.sum(Group.n_metadatasets), 0)).scalar()
+    else:
+        records_total = db.query(Group.n_metadatasets).filter(Group.id == auth_user.group_id).scalar()
 
     # Check which metadata of this metadataset the user is allowed to view
     all_metadata           = get_all_metadata(db, include_service_metadata = True)
     metadata_with_access   = authz.get_readable_metadata(all_metadata, auth_user)
 
-    service_executions_all = [ collect_service_executions(metadata_with_access, mdata_set) for mdata_set, _ in mdata_sets ]
-
     # Build the 'data' response
-    data = [
-            ViewTableResponse(
-                id                    = get_identifier(mdata_set),
-                record                = get_record_from_metadataset(mdata_set, metadata_with_access),
-                file_ids              = { mdrec.metadatum.name : resource.get_identifier_or_none(mdrec.file) for mdrec in mdata_set.metadatumrecords if mdrec.metadatum.isfile },
-                user_id               = get_identifier(mdata_set.user),
-                user_name             = mdata_set.user.fullname,
-                group_id              = get_identifier(mdata_set.submission.group),
-                group_name            = mdata_set.submission.group.name,
-                submission_id         = get_identifier(mdata_set.submission) if mdata_set.submission else None,
-                submission_datetime   = mdata_set.submission.date.isoformat(),
-                submission_label      = mdata_set.submission.label,
-                service_executions    = service_executions,
-                )
-            for (mdata_set, _), service_executions in zip(mdata_sets, service_executions_all)
-            ]
-
-    # Return the response as specified by the datatables API
+    data = build_metadataset_responses(
+            db,
+            rows,
+            metadata_with_access,
+            file_metadata         = all_metadata,
+            response_class        = ViewTableResponse,
+            user_name             = lambda row: row.user_fullname,
+            group_id              = lambda row: identifier(row.group_uuid, row.group_site_id),
+            group_name            = lambda row: row.group_name,
+            submission_datetime   = lambda row: row.submission_date.isoformat(),
+            submission_label      = lambda row: row.submission_label
+            )
+
+    # Return the response as specified by the datatables API. The cursor has
+    # to be passed with the request for the following page.
     return {
             "draw"              : draw,
             "recordsTotal"      : records_total,
             "recordsFiltered"   : records_filtered,
-            "data"              : data
+            "data"              : data,
+            "cursor"            : pagination.encode_cursor(start + len(rows), sort_idx, sort_asc, search_value, *rows[-1][len(columns):]) if rows else None
             }
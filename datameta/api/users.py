@@ -193,4 +193,6 @@ def put(request: Request):
     if name is not None:
         target_user.fullname = name
 
+    security.invalidate_user(db, target_user.id)
+
     return HTTPNoContent()
@@ -0,0 +1,157 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+import pylibmc
+from sqlalchemy.dialects.postgresql import insert
+
+from .models import DefinitionVersion
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def get_definition_version(db, name: str) -> Optional[uuid.UUID]:
+    """Returns the current version of the specified definitions as seen by the
+    transaction of the specified session or None if no version was recorded"""
+    return db.query(DefinitionVersion.version).filter(DefinitionVersion.name == name).scalar()
+
+
+def renew_definition_version(db, name: str):
+    """Assigns a new version to the specified definitions"""
+    version = uuid.uuid4()
+    db.execute(insert(DefinitionVersion.__table__)
+            .values(name = name, version = version)
+            .on_conflict_do_update(index_elements = [ DefinitionVersion.name ], set_ = { 'version' : version }))
+
+
+class VersionedCache:
+    """A process-wide cache of definitions that are stored in the database and
+    change rarely. The cached value is loaded by the specified loader function
+    and is validated against the version of the definitions recorded in the
+    database once per database session. The loaded values are shared between
+    threads and must not be modified.
+
+    Sessions observe the value matching the snapshot of their transaction.
+    Values loaded by sessions that changed the definitions are not shared, as
+    their transaction may not be committed. If no version was recorded for the
+    definitions, values are not cached."""
+
+    def __init__(self, name: str, loader: Callable[[Any], Any]):
+        self.name = name
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._cached : Optional[Tuple[uuid.UUID, Any]] = None
+        self._session_key = f"versioned_cache.{name}"
+        self._modified_key = f"versioned_cache.{name}.modified"
+
+    def get(self, db):
+        """Returns the value for the specified session"""
+        if self._session_key in db.info:
+            return db.info[self._session_key]
+
+        version = get_definition_version(db, self.name)
+        with self._lock:
+            cached = self._cached
+
+        if version is not None and cached is not None and cached[0] == version:
+            value = cached[1]
+        else:
+            value = self.loader(db)
+            if version is not None and not db.info.get(self._modified_key):
+                log.debug("Loaded cached definitions.", extra={"name": self.name, "version": version})
+                with self._lock:
+                    self._cached = (version, value)
+
+        db.info[self._session_key] = value
+        return value
+
+    def invalidate(self, db):
+        """Has to be called by sessions changing the definitions. Assigns a new
+        version to the definitions, such that all processes reload them once
+        the transaction has been committed."""
+        renew_definition_version(db, self.name)
+        db.info.pop(self._session_key, None)
+        db.info[self._modified_key] = True
+
+
+class LRUCache:
+    """A process-wide cache of byte strings. Entries expire after `ttl` seconds
+    and the least recently used entries are evicted once the total size of the
+    entries exceeds `max_size` bytes."""
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries : OrderedDict = OrderedDict()  # key -> (expires, value)
+        self._size = 0
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self._size -= len(value)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes):
+        if len(value) > self.max_size:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._size += len(value)
+            while self._size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+
+class MemcachedCache:
+    """A cache of byte strings shared between processes via memcached. Entries
+    expire after `ttl` seconds, eviction is up to the memcached servers.
+    Failures to reach the servers are logged and treated as cache misses."""
+
+    def __init__(self, servers: List[str], ttl: int, key_prefix: str):
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        # pylibmc clients must not be shared between threads
+        self._pool = pylibmc.ThreadMappedPool(pylibmc.Client(servers, binary = True))
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with self._pool.reserve() as client:
+                return client.get(self.key_prefix + key)
+        except pylibmc.Error as e:
+            log.warning("Memcached lookup failed.", extra={"error": e})
+            return None
+
+    def set(self, key: str, value: bytes):
+        try:
+            with self._pool.reserve() as client:
+                client.set(self.key_prefix + key, value, time = self.ttl)
+        except pylibmc.Error as e:
+            log.warning("Memcached update failed.", extra={"error": e})
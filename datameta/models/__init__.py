@@ -31,14 +31,19 @@ from .db import (
         MetaDatumRecord,
         MetaDataSet,
         ApplicationSetting,
+        DefinitionVersion,
         DateTimeMode,
+        ChangeEventType,
+        ChangeEvent,
         ApiKey,
         DownloadToken,
         Service,
         ServiceExecution,
+        ServiceLease,
         TfaToken,
         LoginAttempt,
-        UsedPassword
+        UsedPassword,
+        record_values_text
         )
 
 # run configure_mappers after defining all of the models to ensure
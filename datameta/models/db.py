@@ -25,9 +25,16 @@ from sqlalchemy import (
     Time,
     DateTime,
     String,
-    Table
+    Table,
+    UniqueConstraint,
+    Index,
+    DDL,
+    text,
+    cast,
+    event,
+    func
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship, backref
 
 from .meta import Base
@@ -51,6 +58,12 @@ class DateTimeMode(enum.Enum):
             return datetime.time
 
 
+class ChangeEventType(enum.Enum):
+    SUBMISSION          = 0
+    SERVICE_EXECUTION   = 1
+    DEPRECATION         = 2
+
+
 user_service_table = Table('service_user', Base.metadata,
     Column('user_id', Integer, ForeignKey('users.id')),
     Column('service_id', Integer, ForeignKey('services.id'))
@@ -63,6 +76,8 @@ class Group(Base):
     uuid             = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, nullable=False)
     site_id          = Column(String(50), unique=True, nullable=False, index=True)
     name             = Column(Text, nullable=False, unique=True)
+    # The number of submitted metadatasets, maintained at submission time
+    n_metadatasets   = Column(Integer, nullable=False, default=0, server_default=text('0'))
     # Relationships
     user             = relationship('User', back_populates='group')
     submissions      = relationship('Submission', back_populates='group')
@@ -92,6 +107,7 @@ class User(Base):
     apikeys              = relationship('ApiKey', back_populates='user')
     services             = relationship('Service', secondary=user_service_table, back_populates='users')
     service_executions   = relationship('ServiceExecution', back_populates='user')
+    service_leases       = relationship('ServiceLease', back_populates='user')
     tfatokens            = relationship('TfaToken', back_populates='user')
     used_passwords       = relationship('UsedPassword', back_populates='user')
     login_attempts       = relationship("LoginAttempt", back_populates='user', cascade="all, delete-orphan")
@@ -99,6 +115,7 @@ class User(Base):
 
 class LoginAttempt(Base):
     __tablename__    = 'loginattempts'
+    __table_args__   = (Index('ix_loginattempts_user_id_timestamp', 'user_id', 'timestamp'),)
     id               = Column(Integer, primary_key=True)
     uuid             = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, nullable=False)
     user_id          = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -200,12 +217,13 @@ class Submission(Base):
     id               = Column(Integer, primary_key=True)
     site_id          = Column(String(50), unique=True, nullable=False, index=True)
     uuid             = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, nullable=False)
-    date             = Column(DateTime)
+    date             = Column(DateTime, index=True)
     label            = Column(String(100), nullable=True)
     group_id         = Column(Integer, ForeignKey('groups.id'), nullable=False)
     # Relationships
     metadatasets     = relationship('MetaDataSet', back_populates='submission')
     group            = relationship('Group', back_populates='submissions')
+    change_events    = relationship('ChangeEvent', back_populates='submission')
 
 
 class MetaDatum(Base):
@@ -245,22 +263,51 @@ class MetaDatumRecord(Base):
 
 
 class MetaDataSet(Base):
-    """A MetaDataSet represents all metadata associated with *one* record"""
+    """A MetaDataSet represents all metadata associated with *one* record. The
+    values of the metadatum records are additionally stored denormalized in
+    the `record` column, mapping metadatum names to values."""
     __tablename__  = 'metadatasets'
+    __table_args__ = (Index('ix_metadatasets_record', 'record', postgresql_using='gin', postgresql_ops={'record': 'jsonb_path_ops'}),)
     id               = Column(Integer, primary_key=True)
     site_id          = Column(String(50), unique=True, nullable=False, index=True)
     uuid             = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, nullable=False)
-    user_id          = Column(Integer, ForeignKey('users.id'), nullable=False)
-    submission_id    = Column(Integer, ForeignKey('submissions.id'), nullable=True)
+    user_id          = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    submission_id    = Column(Integer, ForeignKey('submissions.id'), nullable=True, index=True)
     is_deprecated    = Column(Boolean, default=False)
     deprecated_label = Column(String, nullable=True)
     replaced_by_id   = Column(Integer, ForeignKey('metadatasets.id'), nullable=True)
+    record           = Column(JSONB, nullable=False, default=dict, server_default=text("'{}'::jsonb"))
     # Relationships
     user                 = relationship('User', back_populates='metadatasets')
     submission           = relationship('Submission', back_populates='metadatasets')
     metadatumrecords     = relationship('MetaDatumRecord', back_populates='metadataset')
     replaces             = relationship('MetaDataSet', backref=backref('replaced_by', remote_side=[id]))
     service_executions   = relationship('ServiceExecution', back_populates = 'metadataset')
+    service_leases       = relationship('ServiceLease', back_populates = 'metadataset')
+    change_events        = relationship('ChangeEvent', back_populates = 'metadataset')
+
+
+def record_values_text(record):
+    """Returns an SQL expression rendering the non-NULL values of the
+    specified metadataset record column as text. The expression is indexed
+    using trigrams to serve substring searches across all values."""
+    return cast(func.jsonb_path_query_array(record, '$.* ? (@ != null)'), Text)
+
+
+# Trigram indexes serving substring searches on metadatasets
+Index('ix_metadatasets_record_values', record_values_text(MetaDataSet.record).label('record_values'), postgresql_using='gin', postgresql_ops={'record_values': 'gin_trgm_ops'})
+Index('ix_metadatasets_site_id_trgm', MetaDataSet.site_id, postgresql_using='gin', postgresql_ops={'site_id': 'gin_trgm_ops'})
+event.listen(MetaDataSet.__table__, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+
+
+class DefinitionVersion(Base):
+    """A DefinitionVersion stamps the version of a set of rarely changing
+    definitions that are cached by the application processes. Every
+    transaction that changes the definitions assigns a new random version."""
+    __tablename__    = 'definitionversions'
+    id               = Column(Integer, primary_key=True)
+    name             = Column(String(50), unique=True, nullable=False)
+    version          = Column(UUID(as_uuid=True), nullable=False, default=uuid.uuid4)
 
 
 class ApplicationSetting(Base):
@@ -285,6 +332,8 @@ class Service(Base):
     users           = relationship('User', secondary=user_service_table, back_populates='services')
     # unfortunately, 'metadata' is a reserved keyword for sqlalchemy classes
     service_executions   = relationship('ServiceExecution', back_populates = 'service')
+    service_leases       = relationship('ServiceLease', back_populates = 'service')
+    change_events        = relationship('ChangeEvent', back_populates = 'service')
     target_metadata      = relationship('MetaDatum', back_populates = 'service')
     users                = relationship('User',
             secondary=user_service_table,
@@ -293,6 +342,7 @@ class Service(Base):
 
 class ServiceExecution(Base):
     __tablename__    = 'serviceexecutions'
+    __table_args__   = (UniqueConstraint('service_id', 'metadataset_id'),)
     id               = Column(Integer, primary_key=True)
     uuid             = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, nullable=False)
     service_id       = Column(Integer, ForeignKey('services.id'), nullable=False)
@@ -303,3 +353,37 @@ class ServiceExecution(Base):
     metadataset      = relationship('MetaDataSet', back_populates='service_executions')
     service          = relationship('Service', back_populates='service_executions')
     user             = relationship('User', back_populates='service_executions')
+
+
+class ServiceLease(Base):
+    """A ServiceLease represents the claim of a service user to execute a
+    service for a metadataset until the lease expires"""
+    __tablename__    = 'serviceleases'
+    __table_args__   = (UniqueConstraint('service_id', 'metadataset_id'),)
+    id               = Column(Integer, primary_key=True)
+    uuid             = Column(UUID(as_uuid=True), unique=True, default=uuid.uuid4, nullable=False)
+    service_id       = Column(Integer, ForeignKey('services.id'), nullable=False)
+    user_id          = Column(Integer, ForeignKey('users.id'), nullable=False)
+    metadataset_id   = Column(Integer, ForeignKey('metadatasets.id'), nullable=False)
+    expires          = Column(DateTime, nullable=False)
+    # Relationships
+    metadataset      = relationship('MetaDataSet', back_populates='service_leases')
+    service          = relationship('Service', back_populates='service_leases')
+    user             = relationship('User', back_populates='service_leases')
+
+
+class ChangeEvent(Base):
+    """A ChangeEvent records a change to a submitted metadataset. Change events
+    are created in commit order, their IDs serve as the sequence numbers of the
+    change feed"""
+    __tablename__    = 'changeevents'
+    id               = Column(BigInteger, primary_key=True)
+    event            = Column(Enum(ChangeEventType), nullable=False)
+    datetime         = Column(DateTime, nullable=False)
+    metadataset_id   = Column(Integer, ForeignKey('metadatasets.id'), nullable=False)
+    submission_id    = Column(Integer, ForeignKey('submissions.id'), nullable=True)
+    service_id       = Column(Integer, ForeignKey('services.id'), nullable=True)
+    # Relationships
+    metadataset      = relationship('MetaDataSet', back_populates='change_events')
+    submission       = relationship('Submission', back_populates='change_events')
+    service          = relationship('Service', back_populates='change_events')
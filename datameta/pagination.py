@@ -0,0 +1,47 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import binascii
+import datetime
+import json
+from typing import Any, Callable, List
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(*values) -> str:
+    """Encodes the sort key values of the last element of a page into an
+    opaque, URL-safe cursor string. Datetimes are encoded in ISO format."""
+    payload = [ value.isoformat() if isinstance(value, datetime.datetime) else value for value in values ]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *converters: Callable[[Any], Any]) -> List[Any]:
+    """Decodes a cursor previously created with `encode_cursor`. The decoded
+    values are passed through the specified converters, one per value.
+
+    Raises:
+        CursorError - If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        if not isinstance(values, list) or len(values) != len(converters):
+            raise CursorError("Invalid cursor")
+        return [ converter(value) for converter, value in zip(converters, values) ]
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise CursorError("Invalid cursor") from e
@@ -33,6 +33,15 @@ def get_identifier_or_none(db_obj):
     return get_identifier(db_obj)
 
 
+def get_identifier_from_idstring(idstring):
+    """Given an ID provided by a client, return it as an identifier dictionary
+    holding the ID as a UUID if it is one and as a site ID otherwise"""
+    try:
+        return { 'uuid' : str(UUID(idstring)) }
+    except ValueError:
+        return { 'site' : idstring }
+
+
 def resource_query_by_id(db, model, idstring):
     """Returns a database query that returns an entity based on it's uuid or
     site_id as specified by idstring.
@@ -73,3 +82,42 @@ def resource_by_id(dbsession, model, idstring):
         The database entity or None if no match could be found"""
 
     return resource_query_by_id(dbsession, model, idstring).one_or_none()
+
+
+def resources_by_ids(db, model, idstrings, *options):
+    """Tries to find a set of resources using the provided ids with a single
+    query. Every id is matched against the resources UUID property and, if
+    available, the site_id property.
+
+    Args:
+        db: A database session
+        model: The model class describing the resource
+        idstrings: The UUIDs or site_ids to be found
+        options: Loader options to be applied to the query
+
+    Returns:
+        A dictionary mapping every id to the database entity or None if no match
+        could be found"""
+
+    idstrings = set(idstrings)
+    uuids = {}
+    for idstring in idstrings:
+        try:
+            uuids[idstring] = UUID(idstring)
+        except ValueError:
+            pass
+
+    or_clause = [ model.uuid.in_(list(uuids.values())) ] if uuids else []
+    if 'site_id' in model.__dict__:
+        or_clause += [ model.site_id.in_(idstrings) ]
+
+    by_uuid, by_site_id = {}, {}
+    if or_clause:
+        for db_obj in db.query(model).filter(or_(*or_clause)).options(*options):
+            by_uuid[db_obj.uuid] = db_obj
+            by_site_id[getattr(db_obj, 'site_id', None)] = db_obj
+
+    return {
+            idstring : by_uuid.get(uuids.get(idstring)) or by_site_id.get(idstring)
+            for idstring in idstrings
+            }
@@ -14,7 +14,31 @@
 
 import pandas as pd
 import pandas.api.types as pdtypes
+import numpy as np
+import openpyxl
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.io.parsers import TextParser
 import datetime
+import itertools
+import json
+import csv
+
+# Optional faster engines and columnar sample sheet formats
+try:
+    import pyarrow
+    import pyarrow.csv
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import python_calamine
+except ImportError:
+    python_calamine = None
+
+from .linting import validate_metadataset_record
+from .utils import render_record_values
 
 import logging
 log = logging.getLogger(__name__)
@@ -33,44 +57,315 @@ class SampleSheetReadError(RuntimeError):
 # The `datetimefmt` string provided in the application config is used to parse
 # dates / times / datetimes from text-based sample sheet submissions (TSV, CSV)
 # or when Excel files are submitted but the corresponding column is of type
-# "text" rather than datetime.
+# "text" rather than datetime. The sample sheet conversion returns them
+# formatted according to the same format string.
+#
+# The conversion operates on entire columns. Values that pandas fails to parse
+# are retried with `datetime.strptime`, which accepts a wider range of dates.
 
 
-def strptime_iso_or_empty(s, datetimefmt):
+def strftime_or_empty(s, datetimefmt):
+    """Parses a string using the provided datetime format string and formats
+    the result using the same format string. Returns an empty string if the
+    value cannot be parsed."""
     try:
-        return datetime.datetime.strptime(s, datetimefmt).isoformat()
+        return datetime.datetime.strptime(s, datetimefmt).strftime(datetimefmt)
     except (ValueError, TypeError):
         return ""
 
 
-def datetime_iso_or_empty(x):
-    try:
-        return "" if pd.isna(x) else x.isoformat()
-    except Exception as e:
-        log.error("Failed to convert datetime.", extra={"error": e})
-        return ""
-
+def string_conversion_dates(series, datetimefmt):
+    """Converts a series of dates to strings in the provided datetime format.
+    The dates can either be provided as datetime objects or as strings, which
+    are parsed using the provided datetime format string. Values that cannot
+    be parsed are converted to empty strings.
+    """
+    if pdtypes.is_datetime64_any_dtype(series):
+        return series.dt.strftime(datetimefmt).astype(object).fillna("")
 
-def to_str(x):
-    """Converts to str unless pd.isna() is true, then converts to an empty string"""
-    return "" if pd.isna(x) else str(x)
+    # Only string values are parsed
+    text = series.where(series.map(type).eq(str))
 
+    try:
+        parsed = pd.to_datetime(text, format=datetimefmt, errors="coerce")
+        formatted = parsed.dt.strftime(datetimefmt).astype(object)
+    except (ValueError, TypeError):
+        # E.g. mixed time zones, which cannot be represented by a single column
+        return text.map(lambda x : strftime_or_empty(x, datetimefmt), na_action="ignore").astype(object).fillna("")
 
-def string_conversion_dates(series, datetimefmt):
-    """Converts a series of dates to ISO format strings. The dates can either
-    be provided as datetime objects or will otherwise be casted to `str` and
-    parsed using the provided datetime format string.
-    """
-    if pdtypes.is_datetime64_dtype(series):
-        return series.map(datetime_iso_or_empty)
-    return series.map(lambda x : strptime_iso_or_empty(x, datetimefmt))
+    retry = parsed.isna() & text.notna()
+    if retry.any():
+        formatted[retry] = text[retry].map(lambda x : strftime_or_empty(x, datetimefmt))
+    return formatted.fillna("")
 
 
 def string_conversion(data, metadata):
-    """Converts all columns of the provided sample sheet to strings.
+    """Converts all columns of the provided sample sheet to strings. Missing
+    values are converted to empty strings.
     """
     for mdat in metadata:
         if mdat.datetimefmt is not None:
-            data[mdat.name] = string_conversion_dates(data[mdat.name], mdat.datetimefmt).fillna("")
+            data[mdat.name] = string_conversion_dates(data[mdat.name], mdat.datetimefmt)
         else:
-            data[mdat.name] = data[mdat.name].map(to_str)
+            series = data[mdat.name]
+            data[mdat.name] = series.astype(object).where(series.notna(), "").astype(str).astype(object)
+
+
+####################################################################################################
+
+
+# Maximum number of sample sheet rows that are parsed and converted at once
+SAMPLESHEET_CHUNK_SIZE = 10000
+
+# Values recognized as missing in delimited plain text sample sheets by either
+# reader, i.e. the default of pandas.read_table as of pandas 2
+SAMPLESHEET_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+
+def convert_xlsx_cell(cell):
+    """Converts an openpyxl cell to a value the same way pandas.read_excel
+    does"""
+    if cell.value is None:
+        return ""
+    elif cell.data_type == TYPE_ERROR:
+        return np.nan
+    elif cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        if value == cell.value:
+            return value
+        return float(cell.value)
+    return cell.value
+
+
+def read_xlsx_chunks(file_like_obj, chunksize):
+    """Reads the first worksheet of an XLSX workbook in read-only mode and
+    yields pandas.DataFrame chunks of at most `chunksize` rows. The rows are
+    parsed the way pandas.read_excel parses them, but only one chunk of rows
+    is held in memory at a time."""
+    workbook = openpyxl.load_workbook(file_like_obj, read_only = True, data_only = True, keep_links = False)
+    try:
+        worksheet = workbook.worksheets[0]
+        worksheet.reset_dimensions()
+
+        def trimmed_rows():
+            for row in worksheet.rows:
+                converted_row = [ convert_xlsx_cell(cell) for cell in row ]
+                while converted_row and converted_row[-1] == "":
+                    converted_row.pop()
+                yield converted_row
+
+        def parse_chunk(header, rows):
+            # Extend the rows to the width of the widest one
+            rows = [ header ] + rows
+            width = max(len(row) for row in rows)
+            rows = [ row + [ "" ] * (width - len(row)) for row in rows ]
+            return TextParser(rows, header = 0, dtype = "object").read()
+
+        rows = trimmed_rows()
+        header = next(rows, [])
+        if not header:
+            yield pd.DataFrame()
+            return
+
+        chunk, n_empty_rows, n_chunks = [], 0, 0
+        for row in rows:
+            # Empty rows are only retained if they are followed by data
+            if not row:
+                n_empty_rows += 1
+                continue
+            for pending_row in itertools.chain(itertools.repeat([], n_empty_rows), [ row ]):
+                chunk.append(pending_row)
+                if len(chunk) >= chunksize:
+                    yield parse_chunk(header, chunk)
+                    chunk, n_chunks = [], n_chunks + 1
+            n_empty_rows = 0
+        if chunk or not n_chunks:
+            yield parse_chunk(header, chunk)
+    finally:
+        workbook.close()
+
+
+def read_delimited_chunks_arrow(file_like_obj, sep):
+    """Reads delimited plain text with the multithreaded pyarrow CSV reader and
+    yields pandas.DataFrame chunks, one per block read. All values are read as
+    strings and missing values are recognized the way pandas.read_table
+    recognizes them."""
+    parse_options = pyarrow.csv.ParseOptions(delimiter = sep)
+    column_names = pyarrow.csv.open_csv(file_like_obj, parse_options = parse_options).schema.names
+    file_like_obj.seek(0)
+
+    convert_options = pyarrow.csv.ConvertOptions(
+            column_types          = { name : pyarrow.string() for name in column_names },
+            null_values           = SAMPLESHEET_NA_VALUES,
+            strings_can_be_null   = True
+            )
+    reader = pyarrow.csv.open_csv(file_like_obj, parse_options = parse_options, convert_options = convert_options)
+    for chunk in read_arrow_chunks(reader, reader.schema):
+        yield chunk.astype(object)
+
+
+def read_arrow_chunks(batches, schema):
+    """Yields pandas.DataFrame chunks for Arrow record batches. Typed columns
+    are retained, dates are converted to datetime columns and integer columns
+    with missing values are converted to objects rather than floats."""
+    n_batches = 0
+    for batch in batches:
+        yield batch.to_pandas(date_as_object = False, integer_object_nulls = True)
+        n_batches += 1
+    if not n_batches:
+        yield schema.empty_table().to_pandas()
+
+
+def read_parquet_chunks(file_like_obj, chunksize):
+    """Reads a Parquet file batch by batch"""
+    parquet_file = pyarrow.parquet.ParquetFile(file_like_obj)
+    return read_arrow_chunks(parquet_file.iter_batches(batch_size = chunksize), parquet_file.schema_arrow)
+
+
+def read_arrow_ipc_chunks(file_like_obj, stream_format):
+    """Reads an Arrow IPC file or stream batch by batch"""
+    if stream_format:
+        reader = pyarrow.ipc.open_stream(file_like_obj)
+        return read_arrow_chunks(reader, reader.schema)
+    reader = pyarrow.ipc.open_file(file_like_obj)
+    return read_arrow_chunks(( reader.get_batch(idx) for idx in range(reader.num_record_batches) ), reader.schema)
+
+
+def get_samplesheet_reader(file_like_obj, chunksize = SAMPLESHEET_CHUNK_SIZE):
+    """Given a file with tabular data which is either in delimited plain text
+    format, in XLS(X) format or in Parquet or Arrow IPC format, returns a
+    function capable of reading the file and returning an iterator over
+    pandas.DataFrame chunks. Faster engines are used if they are installed.
+
+    Raises:
+        SampleSheetReadError - Parquet or Arrow IPC input without pyarrow
+    """
+    # https://readxl.tidyverse.org/reference/excel_format.html
+    xlsx_sig          = b'PK\x03\x04'
+    xls_sig           = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+    parquet_sig       = b'PAR1'
+    arrow_file_sig    = b'ARROW1'
+    arrow_stream_sig  = b'\xff\xff\xff\xff'
+    magic_bytes = file_like_obj.read(8)
+
+    file_like_obj.seek(0)
+
+    if magic_bytes.startswith(xlsx_sig):
+        # The XLSX reader streams the worksheet with bounded memory, even
+        # though faster readers exist that load the entire worksheet
+        def create_xlsx_reader(sheet):
+            return read_xlsx_chunks(sheet, chunksize)
+        return create_xlsx_reader
+    elif magic_bytes.startswith(xls_sig):
+        # The legacy XLS format cannot be read incrementally
+        def create_excel_reader(sheet):
+            data = pd.read_excel(sheet, dtype="object", engine="calamine" if python_calamine else None)
+            return ( data.iloc[idx:idx + chunksize] for idx in range(0, max(len(data), 1), chunksize) )
+        return create_excel_reader
+    elif magic_bytes.startswith(parquet_sig) or magic_bytes.startswith(arrow_file_sig) or magic_bytes.startswith(arrow_stream_sig):
+        if pyarrow is None:
+            raise SampleSheetReadError("Parquet and Arrow sample sheets are not supported by this installation.")
+        if magic_bytes.startswith(parquet_sig):
+            def create_parquet_reader(sheet):
+                return read_parquet_chunks(sheet, chunksize)
+            return create_parquet_reader
+
+        def create_arrow_reader(sheet):
+            return read_arrow_ipc_chunks(sheet, stream_format = magic_bytes.startswith(arrow_stream_sig))
+        return create_arrow_reader
+    else:
+        dialect = csv.Sniffer().sniff(file_like_obj.read(1024).decode())
+
+        if pyarrow is not None:
+            def create_table_reader(sheet, sep=dialect.delimiter):
+                return read_delimited_chunks_arrow(sheet, sep)
+        else:
+            def create_table_reader(sheet, sep=dialect.delimiter):
+                return pd.read_table(sheet, dtype="object", sep=sep, chunksize=chunksize, keep_default_na=False, na_values=SAMPLESHEET_NA_VALUES)
+        file_like_obj.seek(0)
+        return create_table_reader
+
+
+def convert_chunks(chunks, metadata, filename):
+    """Converts the chunks of a sample sheet to lists of metadataset records.
+    Rows that duplicate a preceding row are dropped."""
+    metadata_names = list(metadata.keys())
+
+    # The converted rows of preceding chunks, used to drop duplicates across
+    # chunks
+    seen_rows = set()
+
+    while True:
+        try:
+            submitted_metadata = next(chunks, None)
+        except Exception as e:
+            log.info("Sample sheet conversion failed.", extra={"file_name": filename, "error": e})
+            raise SampleSheetReadError("Unable to parse the sample sheet.")
+
+        if submitted_metadata is None:
+            return
+
+        missing_columns  = [ metadata_name for metadata_name in metadata_names if metadata_name not in submitted_metadata.columns ]
+        if missing_columns:
+            raise SampleSheetReadError(f"Missing columns: {', '.join(missing_columns)}.")
+
+        # Limit the sample sheet to the columns of interest and convert all
+        # data to strings
+        submitted_metadata = submitted_metadata[metadata_names].copy()
+        string_conversion(submitted_metadata, list(metadata.values()))
+
+        # Drop duplicates based on the converted values, such that rows are
+        # compared the same way regardless of the types inferred for a chunk
+        is_new = []
+        for row in submitted_metadata.itertuples(index = False, name = None):
+            is_new.append(row not in seen_rows)
+            seen_rows.add(row)
+        submitted_metadata = submitted_metadata[np.array(is_new, dtype = bool)]
+
+        try:
+            # Datetimes are converted according to the format string. Empty strings
+            # are converted to None aka null, i.e. setting metadata to an empty
+            # string value is not possible through the convert API.
+            records = submitted_metadata.where(submitted_metadata != "", None).to_dict("records")
+        except Exception as e:
+            log.error("Unexpected error during sample sheet conversion.", extra={"file_name": filename, "error": e})
+            raise SampleSheetReadError("Unknown error")
+
+        yield records
+
+
+def convert_samplesheet_file(input_path: str, output_path: str, metadata: dict, filename: str, validate: bool = False):
+    """Converts the sample sheet stored at `input_path` to metadataset records
+    and writes them to `output_path` as one JSON object per line and chunk.
+    The objects hold the converted `records` and, if `validate` is set, the
+    `failed` records along with their validation errors, in which case the
+    valid records are rendered. Intended to be run in a worker process.
+
+    Raises:
+        SampleSheetReadError - The sample sheet could not be converted
+    """
+    with open(input_path, "rb") as input_file, open(output_path, "w") as output_file:
+        try:
+            reader = get_samplesheet_reader(input_file)
+            chunks = iter(reader(input_file))
+        except SampleSheetReadError:
+            raise
+        except Exception as e:
+            log.info("Sample sheet conversion failed.", extra={"file_name": filename, "error": e})
+            raise SampleSheetReadError("Unable to parse the sample sheet.")
+
+        for records in convert_chunks(chunks, metadata, filename):
+            failed = []
+            if validate:
+                valid_records = []
+                for record in records:
+                    mset_errors = validate_metadataset_record(metadata, record, return_err_message = True)
+                    if mset_errors:
+                        failed.append({ "record" : record, "errors" : mset_errors })
+                    else:
+                        valid_records.append(render_record_values(metadata, record))
+                records = valid_records
+            output_file.write(json.dumps({ "records" : records, "failed" : failed }) + "\n")
@@ -12,26 +12,60 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from typing import Optional
 from random import choice
 from string import ascii_letters, digits, punctuation
 
+import os
 import bcrypt
+import itertools
 import secrets
+import threading
 from pyramid.httpexceptions import HTTPFound, HTTPUnauthorized
+from pyramid.threadlocal import get_current_registry
 
-from sqlalchemy import and_
+from sqlalchemy import and_, exists, func
+from sqlalchemy.orm import contains_eager
 
 from .tokenz import hash_token
+from .authcache import get_auth_cache, invalidate_user
 
 
 from ..models import User, ApiKey, PasswordToken, Session, UsedPassword, LoginAttempt
-from ..settings import get_setting
+from ..settings import get_app_settings
 
 import logging
 log = logging.getLogger(__name__)
 
+# Period in which failed login attempts are counted
+LOGIN_ATTEMPT_WINDOW = timedelta(hours=1)
+
+_bcrypt_executor = None
+_bcrypt_executor_lock = threading.Lock()
+
+
+def get_bcrypt_threads() -> int:
+    """Returns the size of the bcrypt thread pool, which defaults to the number
+    of CPUs"""
+    settings = get_current_registry().settings or {}
+    return int(settings.get("datameta.bcrypt.threads") or 0) or os.cpu_count()
+
+
+def get_bcrypt_executor() -> ThreadPoolExecutor:
+    """Returns the thread pool that computes bcrypt hashes. bcrypt releases
+    the GIL, such that hashes are computed in parallel while the number of
+    concurrent computations is bounded by the size of the pool."""
+    global _bcrypt_executor
+    with _bcrypt_executor_lock:
+        if _bcrypt_executor is None:
+            _bcrypt_executor = ThreadPoolExecutor(
+                    max_workers          = get_bcrypt_threads(),
+                    thread_name_prefix   = "bcrypt"
+                    )
+        return _bcrypt_executor
+
 
 def register_password(db, user_id, password):
     """ Hashes an accepted password string, adds the hash to the user's password hash history.
@@ -46,19 +80,38 @@ def register_password(db, user_id, password):
 
 
 def is_used_password(db, user_id, password):
-    """ Checks a password string against a user's password hash history.
+    """ Checks a password string against a user's password hash history. Only the
+    most recent passwords are checked as configured by the application setting
+    `security_password_history_depth`. The hashes are checked in parallel, but
+    at most half of the bcrypt thread pool is occupied, such that logins are
+    not queued behind the checks of a long password history.
 
     Returns:
         - True, if password has been used before by the user
         - False, otherwise
     """
+    history_depth = get_app_settings(db).get_int("security_password_history_depth")
 
-    used_passwords = db.query(UsedPassword).filter(UsedPassword.user_id == user_id).all()
-    for pw in used_passwords:
-        if check_password_by_hash(password, pw.pwhash):
-            return True
+    query = db.query(UsedPassword.pwhash).filter(UsedPassword.user_id == user_id).order_by(UsedPassword.id.desc())
+    if history_depth is not None:
+        query = query.limit(history_depth)
 
-    return False
+    executor = get_bcrypt_executor()
+    max_pending = max(1, get_bcrypt_threads() // 2)
+    pwhashes = iter(query.all())
+    pending = set()
+    try:
+        while True:
+            for (pwhash,) in itertools.islice(pwhashes, max_pending - len(pending)):
+                pending.add(executor.submit(bcrypt.checkpw, password.encode('utf8'), pwhash.encode('utf8')))
+            if not pending:
+                return False
+            done, pending = wait(pending, return_when = FIRST_COMPLETED)
+            if any(check.result() for check in done):
+                return True
+    finally:
+        for check in pending:
+            check.cancel()
 
 
 def generate_token():
@@ -121,11 +174,12 @@ def verify_password(db, user_id, password):
     if is_used_password(db, user_id, password):
         return "The password has already been used."
 
-    pw_min_length = get_setting(db, "security_password_minimum_length")
-    pw_min_ucase = get_setting(db, "security_password_minimum_uppercase_characters")
-    pw_min_lcase = get_setting(db, "security_password_minimum_lowercase_characters")
-    pw_min_digits = get_setting(db, "security_password_minimum_digits")
-    pw_min_punctuation = get_setting(db, "security_password_minimum_punctuation_characters")
+    app_settings = get_app_settings(db)
+    pw_min_length = app_settings.get_int("security_password_minimum_length")
+    pw_min_ucase = app_settings.get_int("security_password_minimum_uppercase_characters")
+    pw_min_lcase = app_settings.get_int("security_password_minimum_lowercase_characters")
+    pw_min_digits = app_settings.get_int("security_password_minimum_digits")
+    pw_min_punctuation = app_settings.get_int("security_password_minimum_punctuation_characters")
 
     if len(password) < pw_min_length:
         return f"The password must be at least {pw_min_length} characters long."
@@ -152,33 +206,38 @@ def verify_password(db, user_id, password):
 
 def hash_password(pw):
     """Hash a password and return the salted hash."""
-    pwhash = bcrypt.hashpw(pw.encode('utf8'), bcrypt.gensalt())
+    pwhash = get_bcrypt_executor().submit(bcrypt.hashpw, pw.encode('utf8'), bcrypt.gensalt()).result()
     return pwhash.decode('utf8')
 
 
 def check_password_by_hash(pw, hashed_pw):
     """Check a password against a salted hash."""
     expected_hash = hashed_pw.encode('utf8')
-    return bcrypt.checkpw(pw.encode('utf8'), expected_hash)
+    return get_bcrypt_executor().submit(bcrypt.checkpw, pw.encode('utf8'), expected_hash).result()
 
 
 def register_failed_login_attempt(db, user):
     """ Registers a failed login attempt and disables user if this has happened too often in the last hour."""
 
     now = datetime.utcnow()
-    max_allowed_failed_logins = get_setting(db, "security_max_failed_login_attempts")
+    window_start = now - LOGIN_ATTEMPT_WINDOW
+    max_allowed_failed_logins = get_app_settings(db).get_int("security_max_failed_login_attempts")
 
+    # Attempts outside of the window are no longer relevant
+    db.query(LoginAttempt)\
+            .filter(and_(LoginAttempt.user_id == user.id, LoginAttempt.timestamp <= window_start))\
+            .delete(synchronize_session=False)
     db.add(LoginAttempt(user_id=user.id, timestamp=now))
     db.flush()
-    n_failed_logins = sum(
-        now - attempt.timestamp <= timedelta(hours=1)
-        for attempt in db.query(LoginAttempt).filter(LoginAttempt.user_id == user.id).all()
-    )
+    n_failed_logins = db.query(func.count(LoginAttempt.id))\
+            .filter(and_(LoginAttempt.user_id == user.id, LoginAttempt.timestamp > window_start))\
+            .scalar()
 
     log.warning("Failed login attempt.", extra={"user_id": user.id, "failed_logins_last_hour": n_failed_logins})
     if n_failed_logins >= max_allowed_failed_logins:
         db.query(User).filter(user.id == User.id).update({User.enabled: False})
         db.flush()
+        invalidate_user(db, user.id)
         log.warning("User blocked due to repeated failed login attempts.", extra={"user_id": user.id, "user_enabled": user.enabled, "failed_logins_last_hour": n_failed_logins})
 
     return None
@@ -223,14 +282,21 @@ def get_password_reset_token(db: Session, token: str):
 
 
 def revalidate_user_token_based(request, token):
-    """Revalidates user during token-based operations."""
+    """Revalidates user during token-based operations. Users that were
+    authenticated recently are obtained from the authentication cache without
+    querying the database."""
     db = request.dbsession
 
     token_hash = hash_token(token)
+    auth_cache = get_auth_cache(request.registry)
+    cached = auth_cache.get(token_hash) if auth_cache is not None else None
+    if cached is not None and not check_expiration(cached.expires):
+        return db.merge(cached.user, load=False)
+
     apikey = db.query(ApiKey).join(User).filter(and_(
         ApiKey.value == token_hash,
         User.enabled.is_(True)
-    )).one_or_none()
+    )).options(contains_eager(ApiKey.user)).one_or_none()
 
     if apikey is not None:
         apikey_expired = check_expiration(apikey.expires)
@@ -243,6 +309,8 @@ def revalidate_user_token_based(request, token):
             request.tm.commit()
             request.tm.begin()
         else:
+            if auth_cache is not None:
+                auth_cache.add(db, token_hash, apikey)
             clear_failed_login_attempts(user=user, dbsession=db)
             return user
 
@@ -306,11 +374,12 @@ def revalidate_admin(request):
 
 
 def clear_failed_login_attempts(dbsession, user: User) -> None:
-    """Sets number of login attempts to 0."""
-    now = datetime.utcnow()
-    attempts = dbsession.query(LoginAttempt).filter(LoginAttempt.user_id == user.id).all()
-    logins_failed = len([now - attempt.timestamp <= timedelta(hours=1) for attempt in attempts])
-
-    if logins_failed > 0:
-        log.warning("Clearing failed login attempts.", extra={"user_id": user.id, "logins_failed": logins_failed})
-        user.login_attempts.clear()
+    """Removes the failed login attempts of the user. Only writes to the
+    database if there are any."""
+    if not dbsession.query(exists().where(LoginAttempt.user_id == user.id)).scalar():
+        return
+
+    logins_failed = dbsession.query(LoginAttempt)\
+            .filter(LoginAttempt.user_id == user.id)\
+            .delete(synchronize_session=False)
+    log.warning("Clearing failed login attempts.", extra={"user_id": user.id, "logins_failed": logins_failed})
@@ -0,0 +1,182 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Short-lived cache of the users authenticated by API keys. Cache hits are
+attached to the request session without querying the database.
+
+Changes to users and API keys are announced on a notification channel when
+the changing transaction is committed, such that every process drops the
+affected entries. The notifications are received on a dedicated connection
+that is polled without a round trip to the database."""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import make_transient_to_detached
+
+from ..models import ApiKey, User
+
+import logging
+log = logging.getLogger(__name__)
+
+# Channel on which changes to users and API keys are announced
+AUTH_CACHE_CHANNEL = "datameta_auth"
+
+# Session info key holding the cache generation at the start of the transaction
+_GENERATION_KEY = "auth_cache.generation"
+
+
+@dataclass(frozen=True)
+class CachedApiKey:
+    """The user authenticated by an API key. The user is a detached snapshot
+    that is shared between threads and must not be modified."""
+    user            : User
+    expires         : Optional[datetime]  # Expiration of the API key
+    cached_until    : float
+
+
+def get_user_snapshot(user: User) -> User:
+    """Returns a detached copy of the column attributes of the specified user,
+    which can be attached to sessions without querying the database"""
+    snapshot = User(**{ attr.key : getattr(user, attr.key) for attr in inspect(User).column_attrs })
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+def invalidate_user(db, user_id: Optional[int] = None):
+    """Has to be called by sessions changing a user or their API keys. Drops the
+    cached authentications of the specified user or of all users if none is
+    specified in all processes once the transaction has been committed."""
+    db.execute(select([ func.pg_notify(AUTH_CACHE_CHANNEL, '' if user_id is None else str(user_id)) ]))
+
+
+class AuthCache:
+    """A process-wide cache of the users authenticated by API keys, keyed by
+    the API key hashes. Entries expire after `ttl` seconds and the least
+    recently used entries are evicted beyond `max_entries` entries.
+
+    Every processed invalidation increments the generation of the cache.
+    Authentications are only cached if the generation did not change since
+    the transaction that loaded them began, as they may predate the
+    invalidation. The cache is bypassed while no notifications can be
+    received."""
+
+    def __init__(self, engine, ttl: int, max_entries: int):
+        self.engine = engine
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries : OrderedDict = OrderedDict()  # API key hash -> CachedApiKey
+        self._generation = 0
+        self._listener = None
+
+    def on_session_begin(self, session, transaction, connection):
+        session.info.setdefault(_GENERATION_KEY, self._generation)
+
+    def _drop(self, payload: str):
+        if payload:
+            user_id = int(payload)
+            for key in [ key for key, entry in self._entries.items() if entry.user.id == user_id ]:
+                del self._entries[key]
+        else:
+            self._entries.clear()
+
+    def _reset_listener(self):
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except Exception:
+                pass
+            self._listener = None
+        self._entries.clear()
+        self._generation += 1
+
+    def _poll(self) -> bool:
+        """Processes pending notifications. Returns False if notifications
+        cannot be received, in which case the cache must not be used."""
+        try:
+            if self._listener is None:
+                listener = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+                listener.execute(f"LISTEN {AUTH_CACHE_CHANNEL}")
+                self._listener = listener
+            dbapi_conn = self._listener.connection
+            dbapi_conn.poll()
+        except Exception as e:
+            log.warning("Authentication cache notifications unavailable.", extra={"error": e})
+            self._reset_listener()
+            return False
+
+        if dbapi_conn.notifies:
+            for notify in dbapi_conn.notifies:
+                self._drop(notify.payload)
+            dbapi_conn.notifies.clear()
+            self._generation += 1
+        return True
+
+    def get(self, token_hash: str) -> Optional[CachedApiKey]:
+        """Returns the cached authentication of the specified API key hash"""
+        with self._lock:
+            if not self._poll():
+                return None
+            entry = self._entries.get(token_hash)
+            if entry is None:
+                return None
+            if entry.cached_until <= time.monotonic():
+                del self._entries[token_hash]
+                return None
+            self._entries.move_to_end(token_hash)
+            return entry
+
+    def add(self, db, token_hash: str, apikey: ApiKey):
+        """Caches the authentication of the specified API key loaded by the
+        specified session"""
+        entry = CachedApiKey(
+                user           = get_user_snapshot(apikey.user),
+                expires        = apikey.expires,
+                cached_until   = time.monotonic() + self.ttl
+                )
+        with self._lock:
+            if not self._poll() or db.info.get(_GENERATION_KEY) != self._generation:
+                return
+            self._entries[token_hash] = entry
+            self._entries.move_to_end(token_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+
+
+def get_auth_cache(registry) -> Optional[AuthCache]:
+    """Returns the authentication cache of the application or None if it is
+    disabled"""
+    return registry.get("auth_cache")
+
+
+def includeme(config):
+    settings = config.get_settings()
+    ttl = int(settings.get("datameta.auth_cache.ttl", 60))
+    if ttl <= 0:
+        return
+
+    session_factory = config.registry['dbsession_factory']
+    auth_cache = AuthCache(
+            engine        = session_factory.kw['bind'],
+            ttl           = ttl,
+            max_entries   = int(settings.get("datameta.auth_cache.max_entries", 10000))
+            )
+    event.listen(session_factory, "after_begin", auth_cache.on_session_begin)
+    config.registry['auth_cache'] = auth_cache
@@ -139,6 +139,10 @@ def view_mset_any(user):
     return user.site_read
 
 
+def view_service_executions(user):
+    return user.site_read
+
+
 def view_mset(user, mds_obj):
     was_submitted = bool(mds_obj.submission_id is not None)
     group_id = mds_obj.submission.group_id if was_submitted else None
@@ -198,3 +202,11 @@ def view_services(user):
 
 def execute_service(user, service):
     return user.id in (service_user.id for service_user in service.users)
+
+
+def lease_service(user, service):
+    return execute_service(user, service)
+
+
+def update_service_lease(user, service_lease):
+    return user.id == service_lease.user_id
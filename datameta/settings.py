@@ -15,9 +15,12 @@
 import datetime
 import pkgutil
 import yaml
-from typing import List
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, List, Mapping, Optional
 
 import transaction
+from .cache import VersionedCache
 from .models import ApplicationSetting, get_engine, get_tm_session, get_session_factory
 
 import logging
@@ -48,24 +51,72 @@ def get_setting_value_type(setting):
     return value, value_type
 
 
+def get_setting_value(setting):
+    """Returns the value of the setting as the first value field that contains
+    a value or None if no value was set"""
+    for value in (setting.int_value, setting.str_value, setting.float_value, setting.date_value, setting.time_value):
+        if value is not None:
+            return value
+    return None
+
+
+@dataclass(frozen=True)
+class AppSettings:
+    """An immutable snapshot of the application settings, mapping the setting
+    keys to their values. The typed accessors return `None` if the setting
+    couldn't be found or no value was set and raise a TypeError if the value
+    is of a different type."""
+    values : Mapping[str, Any]
+
+    def get(self, name: str, default: Any = None) -> Any:
+        value = self.values.get(name)
+        return default if value is None else value
+
+    def _get_typed(self, name: str, value_type: type):
+        value = self.values.get(name)
+        if value is not None and not isinstance(value, value_type):
+            raise TypeError(f"The application setting '{name}' is not of type {value_type.__name__}.")
+        return value
+
+    def get_int(self, name: str) -> Optional[int]:
+        return self._get_typed(name, int)
+
+    def get_str(self, name: str) -> Optional[str]:
+        return self._get_typed(name, str)
+
+    def get_float(self, name: str) -> Optional[float]:
+        return self._get_typed(name, float)
+
+    def get_date(self, name: str) -> Optional[datetime.date]:
+        return self._get_typed(name, datetime.date)
+
+    def get_time(self, name: str) -> Optional[datetime.time]:
+        return self._get_typed(name, datetime.time)
+
+    def keys_startswith(self, prefix: str) -> List[str]:
+        return [ key for key in self.values if key.startswith(prefix) ]
+
+
+def load_app_settings(db) -> AppSettings:
+    return AppSettings(MappingProxyType({ setting.key : get_setting_value(setting) for setting in db.query(ApplicationSetting) }))
+
+
+app_settings_registry = VersionedCache("appsettings", load_app_settings)
+
+
+def get_app_settings(db) -> AppSettings:
+    """Obtains a snapshot of all application settings from the application
+    settings registry. The snapshot is shared between threads and only
+    reloaded after the settings were changed."""
+    return app_settings_registry.get(db)
+
+
 def get_setting(db, name):
     """Given a setting name, obtains the corresponding setting from the
-    database and returns the value. The return type varies. Returns `None` if
-    the setting couldn't be found or no value was set."""
-    setting = db.query(ApplicationSetting).filter(ApplicationSetting.key == name).one_or_none()
-    if not setting:
-        return None
-    elif setting.int_value is not None:
-        return setting.int_value
-    elif setting.str_value is not None:
-        return setting.str_value
-    elif setting.float_value is not None:
-        return setting.float_value
-    elif setting.date_value is not None:
-        return setting.date_value
-    elif setting.time_value is not None:
-        return setting.time_value
-    return None
+    application settings registry and returns the value. The return type
+    varies. Returns `None` if the setting couldn't be found or no value was
+    set."""
+    return get_app_settings(db).get(name)
 
 
 def get_settings_startswith(
@@ -73,8 +124,7 @@ def get_settings_startswith(
     prefix: str,
 ) -> List[str]:
     """Return all appsettings which starts with given prefix."""
-    settings = db.query(ApplicationSetting).filter(ApplicationSetting.key.startswith(prefix)).all()
-    return [setting.key for setting in settings]
+    return get_app_settings(db).keys_startswith(prefix)
 
 
 class SettingUpdateError(RuntimeError):
@@ -125,6 +175,7 @@ def set_setting(db, name, value):
             raise SettingUpdateError(cast_params["error_msg"])
 
         setattr(target_setting, cast_params["target"], casted_value)
+        app_settings_registry.invalidate(db)
 
     return None
 
@@ -138,7 +189,9 @@ def includeme(config):
     with transaction.manager:
         db = get_tm_session(session_factory, transaction.manager)
         existing = [ setting.key for setting in db.query(ApplicationSetting) ]
-        for key, value in defaults.items():
-            if key not in existing:
-                db.add(ApplicationSetting(key=key, **value))
-                log.info("No application setting found, inserting default value", extra={"key": key})
+        missing = [ key for key in defaults if key not in existing ]
+        for key in missing:
+            db.add(ApplicationSetting(key=key, **defaults[key]))
+            log.info("No application setting found, inserting default value", extra={"key": key})
+        if missing:
+            app_settings_registry.invalidate(db)
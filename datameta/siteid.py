@@ -47,3 +47,20 @@ def generate(request, BaseClass):
             log.warning("Site ID collision, ID space may be saturating.", extra={"tablename": BaseClass.__tablename__})
         else:
             return new_id
+
+
+def generate_many(request, BaseClass, count: int):
+    """Generates `count` new site IDs for the specified database entity,
+    checking for collisions with a single query per round"""
+    digits = _digits[BaseClass.__tablename__]
+    prefix = _prefix[BaseClass.__tablename__]
+    new_ids = set()
+    for _ in range(10):
+        candidates = { prefix + str(random.randint(0, pow(10, digits))).rjust(digits, "0") for _ in range(count - len(new_ids)) } - new_ids
+        collisions = { site_id for (site_id,) in request.dbsession.query(BaseClass.site_id).filter(BaseClass.site_id.in_(candidates)) } if candidates else set()
+        if collisions:
+            log.warning("Site ID collision, ID space may be saturating.", extra={"tablename": BaseClass.__tablename__})
+        new_ids |= candidates - collisions
+        if len(new_ids) == count:
+            return list(new_ids)
+    raise RuntimeError(f"Unable to generate {count} site IDs for '{BaseClass.__tablename__}'.")
@@ -308,7 +308,8 @@ function process_result_data(json) {
                 return;
             }
 
-            fetch('/api/ui/convert', {
+            // The sample sheet is converted, validated and staged server-side
+            fetch('/api/ui/import', {
                 method: "POST",
                 credentials: 'same-origin',
                 body: formdata
@@ -317,7 +318,7 @@ function process_result_data(json) {
                 if (response.status==400) throw new DataMeta.AnnotatedError(response);
                 throw new Error();
             }).then(function(json) {
-                var mdata_upload = new CustomEvent("mdata_upload", { detail : { msets : json , form : form, failed_msets : [], errors : []} });
+                var mdata_upload = new CustomEvent("mdata_upload", { detail : { msets : [] , form : form, failed_msets : json.failedMetadatasets, errors : json.errors} });
                 document.dispatchEvent(mdata_upload);
             }).catch(function(error) {
                 if (error instanceof DataMeta.AnnotatedError) {
@@ -76,6 +76,9 @@ DataMeta.view.initTable = function() {
         { title: '<i class="bi bi-house-door"></i> ID', data: "id.site", className: "id_col", render: data => '<span class="text-accent">' + data + '</span>'}
       ].concat(DataMeta.view.buildColumns(mdata))
 
+    // The cursor returned with the last page
+    var cursor = null;
+
     // Build table based on field names
     $('#table_view').DataTable({
       dom: "<'row'<'col-sm-12 col-md-6'l><'col-sm-12 col-md-6'f>><'row'<'col-sm-12'tr>><'row'<'col-sm-12 col-md-5'i><'col-sm-12 col-md-7'p>>",
@@ -89,7 +92,16 @@ DataMeta.view.initTable = function() {
       scrollX: true,
       ajax: {
         url: "/api/ui/view",
-        type: "POST"
+        type: "POST",
+        // Pass the cursor of the last page to enable keyset pagination when
+        // advancing to the following page
+        data: function(d) {
+          if (cursor) d.cursor = cursor;
+        },
+        dataSrc: function(json) {
+          cursor = json.cursor;
+          return json.data;
+        }
       },
       serverSide : true,
       columns : columns
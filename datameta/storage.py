@@ -16,6 +16,7 @@ import os
 import shutil
 import logging
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pyramid.request import Request
 from typing import Optional
@@ -24,6 +25,9 @@ from .api import base_url
 
 log = logging.getLogger(__name__)
 
+# Maximum number of concurrent storage operations of a single request
+MAX_CONCURRENT_STORAGE_OPS = 16
+
 
 class ChecksumMismatchError(RuntimeError):
     pass
@@ -53,6 +57,18 @@ def rm(request, storage_path):
         log.debug("Did not delete, demo mode.")
 
 
+def rm_all(request, storage_paths):
+    """Remove multiple files from storage by local storage file name. The files
+    are removed concurrently, the first error encountered is raised after all
+    removals have been attempted."""
+    if not storage_paths:
+        return
+    with ThreadPoolExecutor(max_workers = min(MAX_CONCURRENT_STORAGE_OPS, len(storage_paths))) as executor:
+        futures = [ executor.submit(rm, request, storage_path) for storage_path in storage_paths ]
+    for future in futures:
+        future.result()
+
+
 def get_local_storage_path(request, storage_uri):
     """Given a request and a database File object, determine the local storage path for the given storage_uri"""
     if storage_uri is None:
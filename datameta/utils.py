@@ -15,22 +15,7 @@
 from typing import Dict, Optional
 from datetime import datetime
 
-from .models import MetaDataSet, MetaDatum, MetaDatumRecord
-
-
-def formatted_mrec_value(mrec: MetaDatumRecord) -> str:
-    """Returns the formatted value of a metadatum record. That is, in case the
-    corresponding metadatum has a datetimefmt set, it will apply the format to
-    the value of the metadatum and return the result, otherwise the value of
-    the metadatum is returned unchanged.
-
-    Arguments:
-        mrec: The metadatum record
-    """
-    if mrec.value and mrec.metadatum.datetimefmt is not None:
-        return datetime.fromisoformat(mrec.value).strftime(mrec.metadatum.datetimefmt)
-    else:
-        return mrec.value
+from .models import MetaDataSet, MetaDatum
 
 
 def formatted_mrec_value_str(value: str, datetimefmt: str) -> str:
@@ -51,10 +36,34 @@ def formatted_mrec_value_str(value: str, datetimefmt: str) -> str:
     return value
 
 
+def get_record_from_values(values: dict, metadata: Dict[str, MetaDatum], render = True) -> Dict[str, Optional[str]]:
+    """ Construct a dict containing all records for the specified metadata
+    from a denormalized metadataset record"""
+    record = {}
+    for name, mdatum in metadata.items():
+        value = values.get(name)
+        record[name] = formatted_mrec_value_str(value, mdatum.datetimefmt) if render and value else value
+    return record
+
+
 def get_record_from_metadataset(mdata_set: MetaDataSet, metadata: Dict[str, MetaDatum], render = True) -> Dict[str, Optional[str]]:
-    """ Construct a dict containing all records of that MetaDataSet"""
-    mdata_ids = [ mdatum.id for mdatum in metadata.values() ]
-    return {
-            rec.metadatum.name: formatted_mrec_value(rec) if render else rec.value
-            for rec in mdata_set.metadatumrecords if rec.metadatum.id in mdata_ids
-            }
+    """ Construct a dict containing all records of that MetaDataSet for the
+    specified metadata from the denormalized record of the MetaDataSet"""
+    return get_record_from_values(mdata_set.record, metadata, render)
+
+
+def render_record_values(metadata: Dict[str, MetaDatum], record: dict) -> dict:
+    """Renders values of a metadataset record. Please note: the record should already have passed validation."""
+    record_rendered = record.copy()
+    for field in metadata:
+        if field not in record_rendered:
+            # if field is not contained in record, add it as None to the record:
+            record_rendered[field] = None
+            continue
+        elif record_rendered[field] and metadata[field].datetimefmt:
+            # if MetaDatum is a datetime field, render the value in isoformat
+            record_rendered[field] = datetime.strptime(
+                    record_rendered[field],
+                    metadata[field].datetimefmt
+                    ).isoformat()
+    return record_rendered
@@ -13,7 +13,7 @@
 # limitations under the License.
 
 from sqlalchemy.orm import joinedload
-from sqlalchemy import or_, and_
+from sqlalchemy import and_
 from collections import defaultdict, Counter
 
 from . import resource, linting, errors
@@ -128,9 +128,9 @@ def validate_submission_uniquekeys(
     errors = []
 
     # Submission unique keys (includes those that are globally unique)
-    keys_submission_unique = [ md.name for md in db.query(MetaDatum).filter(or_(MetaDatum.submission_unique.is_(True), MetaDatum.site_unique.is_(True))) ]
+    keys_submission_unique = [ md.name for md in get_all_metadata(db).values() if md.submission_unique or md.site_unique ]
     # Globally unique keys
-    keys_site_unique        = [ md.name for md in db.query(MetaDatum).filter(MetaDatum.site_unique.is_(True)) ]
+    keys_site_unique        = [ md.name for md in get_all_metadata(db).values() if md.site_unique ]
 
     # Validate the set of metadatasets with regard to submission unique key constraints
     for key in keys_submission_unique:
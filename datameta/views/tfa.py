@@ -21,7 +21,7 @@ from pyramid.view import view_config
 from sqlalchemy import and_
 
 from .. import errors
-from ..security import register_failed_login_attempt, tfaz, clear_failed_login_attempts
+from ..security import register_failed_login_attempt, tfaz, clear_failed_login_attempts, invalidate_user
 from ..models import User
 
 import logging
@@ -50,6 +50,7 @@ def setup_tfa(request):
             raise errors.get_validation_error([error])
 
         dbtoken.user.tfa_secret = dbtoken.secret
+        invalidate_user(request.dbsession, dbtoken.user_id)
 
         request.dbsession.delete(dbtoken)
 
@@ -0,0 +1,155 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded process pool for CPU heavy jobs, e.g. the conversion of sample
+sheets. Jobs run in separate processes such that they don't hold the GIL of
+the processes serving requests. Every job is subject to a timeout and the
+worker processes are subject to a memory limit."""
+
+import multiprocessing
+import resource
+import signal
+import threading
+import logging
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+log = logging.getLogger(__name__)
+
+# Additional time granted to a job before the worker processes are terminated,
+# the job itself is interrupted after the configured timeout
+TERMINATION_GRACE_PERIOD = 10
+
+
+class WorkerPoolError(RuntimeError):
+    pass
+
+
+class WorkerPoolBusyError(WorkerPoolError):
+    pass
+
+
+class WorkerTimeoutError(WorkerPoolError):
+    pass
+
+
+class WorkerMemoryError(WorkerPoolError):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise WorkerTimeoutError()
+
+
+def _init_worker(memory_limit):
+    """Initializes a worker process, limiting its address space to
+    `memory_limit` bytes"""
+    # The worker processes shouldn't handle the signals the server handles
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_limit:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, hard))
+
+
+def _run_job(timeout, func, *args, **kwargs):
+    """Runs a job in a worker process, interrupting it after `timeout`
+    seconds"""
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.alarm(timeout)
+    try:
+        return func(*args, **kwargs)
+    except MemoryError:
+        raise WorkerMemoryError()
+    finally:
+        signal.alarm(0)
+
+
+class WorkerPool:
+    """A pool of `size` worker processes. At most `size` jobs are queued in
+    addition to the running jobs, further jobs are rejected."""
+
+    def __init__(self, size: int, timeout: int, memory_limit: int):
+        self.size           = size
+        self.timeout        = timeout
+        self.memory_limit   = memory_limit
+        self._slots         = threading.BoundedSemaphore(2 * size)
+        self._lock          = threading.Lock()
+        self._executor      = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking the multithreaded server process is unsafe, the
+                # worker processes are forked from a dedicated server process
+                self._executor = ProcessPoolExecutor(
+                        max_workers   = self.size,
+                        mp_context    = multiprocessing.get_context("forkserver"),
+                        initializer   = _init_worker,
+                        initargs      = (self.memory_limit,)
+                        )
+            return self._executor
+
+    def _reset_executor(self, executor: ProcessPoolExecutor):
+        """Terminates the worker processes of the specified executor, the next
+        job starts a new executor"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        for process in list(executor._processes.values()):
+            process.terminate()
+        executor.shutdown(wait = False, cancel_futures = True)
+
+    def run(self, func, *args, **kwargs):
+        """Runs `func` with the specified arguments in a worker process and
+        returns the result. Exceptions raised by `func` are re-raised.
+
+        Raises:
+            WorkerPoolBusyError - All workers are busy and the queue is full
+            WorkerTimeoutError - The job did not finish in time
+            WorkerMemoryError - The job exceeded the memory limit
+            WorkerPoolError - The worker process died
+        """
+        if not self._slots.acquire(blocking = False):
+            raise WorkerPoolBusyError()
+        try:
+            executor = self._get_executor()
+            future = executor.submit(_run_job, self.timeout, func, *args, **kwargs)
+            try:
+                # Only the execution time of the job is limited, waiting for a
+                # worker is bounded by the size of the queue
+                return future.result(timeout = 2 * self.timeout + TERMINATION_GRACE_PERIOD)
+            except FutureTimeoutError:
+                log.error("Worker did not respond, terminating the worker pool.", extra={"func": func.__name__})
+                self._reset_executor(executor)
+                raise WorkerTimeoutError()
+            except BrokenProcessPool:
+                log.error("Worker process died, restarting the worker pool.", extra={"func": func.__name__})
+                self._reset_executor(executor)
+                raise WorkerPoolError()
+        finally:
+            self._slots.release()
+
+
+def get_worker_pool(registry) -> WorkerPool:
+    """Returns the worker pool of the application, creating it on first use
+    based on the application settings"""
+    pool = registry.get("worker_pool")
+    if pool is None:
+        settings = registry.settings
+        pool = registry.setdefault("worker_pool", WorkerPool(
+            size           = int(settings.get("datameta.workers.size", 2)),
+            timeout        = int(settings.get("datameta.workers.timeout", 300)),
+            memory_limit   = int(settings.get("datameta.workers.memory_limit", 4096)) * 1024 * 1024,
+            ))
+    return pool
@@ -65,6 +65,13 @@ tests_require = [
     "mypy",
 ]
 
+# Faster sample sheet engines and support for Parquet / Arrow IPC sample sheets
+samplesheet_requires = [
+    'pandas >= 2.2',
+    'pyarrow',
+    'python-calamine',
+]
+
 setup(
     name                   = 'datameta',
     version                = '1.1.1',
@@ -81,6 +88,7 @@ setup(
     install_requires       = requires,
     extras_require={
         'testing': tests_require,
+        'samplesheets': samplesheet_requires,
     },
     classifiers=[
         'Programming Language :: Python',
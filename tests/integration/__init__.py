@@ -23,7 +23,9 @@ from .fixtures import (
 
 from .utils import get_auth_header
 
-from datameta.settings import set_setting
+from datameta.settings import set_setting, app_settings_registry
+from datameta.cache import renew_definition_version
+from datameta.api.metadata import metadata_registry
 
 
 class BaseIntegrationTest(unittest.TestCase):
@@ -49,6 +51,12 @@ class BaseIntegrationTest(unittest.TestCase):
         # create models:
         Base.metadata.create_all(self.engine)
 
+        # record versions of the cached definitions as the migrations do
+        with transaction.manager:
+            db = get_tm_session(self.session_factory, transaction.manager)
+            for registry in (metadata_registry, app_settings_registry):
+                renew_definition_version(db, registry.name)
+
     def setUp(self):
         """Setup Test Server"""
         self.settings = default_settings
@@ -23,7 +23,8 @@ import datetime
 
 from datameta.models import get_tm_session
 from datameta.models.meta import Base as DatabaseModel
-from datameta.models import MetaDatum, MetaDatumRecord, File
+from datameta.models import MetaDatum, MetaDatumRecord, MetaDataSet, File, Group, Submission
+from sqlalchemy import func
 from ..utils import get_file_path
 
 
@@ -189,11 +190,12 @@ class FixtureManager:
                 # Check if the fixture is a metadataset and if it was loaded
                 # with database insert (id is set)
                 if fixture.__db_class__ == 'MetaDataSet' and fixture.id is not None:
+                    # Records are stored sparsely, NULL values are omitted
                     mdat_records = { mdat_name : MetaDatumRecord(
                         metadatum_id     = metadata[mdat_name].id,
                         metadataset_id   = fixture.id,
                         value            = mdat_value
-                        ) for mdat_name, mdat_value in fixture.records.items() }
+                        ) for mdat_name, mdat_value in fixture.records.items() if mdat_value is not None }
                     # Link the file if submitted and the fixture was loaded with DB insert (id is set)
                     if fixture.submission is not None and fixture.id is not None:
                         for mdat_name in [ name for name, mdat in metadata.items() if mdat.isfile ]:
@@ -207,6 +209,14 @@ class FixtureManager:
                                     raise RuntimeError(f"Could not populate metadataset '{fixture_name}' from fixture set '{fixture_set}': Metadataset is linked to a submission, but referenced files cannot be found. Did you load the necessary file fixtures?")
                                 rec.file_id = files[rec.value].id
                     db.add_all(mdat_records.values())
+                    # Populate the denormalized record of the metadataset
+                    db.query(MetaDataSet).filter(MetaDataSet.id == fixture.id).update({
+                        MetaDataSet.record : { mdat_name : str(mdat_value) if mdat_value is not None else None for mdat_name, mdat_value in fixture.records.items() }
+                        }, synchronize_session = False)
+            # Populate the number of submitted metadatasets of the groups
+            db.query(Group).update({
+                Group.n_metadatasets : db.query(func.count(MetaDataSet.id)).join(Submission).filter(Submission.group_id == Group.id).as_scalar()
+                }, synchronize_session = False)
 
     def copy_files_to_storage(self):
         with transaction.manager:
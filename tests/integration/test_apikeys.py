@@ -108,3 +108,22 @@ class TestApiKeyUsageSenario(BaseIntegrationTest):
             expected_key_id = token_id,
             status = 401
         )
+
+    def test_cached_authentication_is_invalidated(self):
+        self.fixture_manager.load_fixtureset('apikeys')
+        user = self.fixture_manager.get_fixture('users', 'user_a')
+        token = self.fixture_manager.get_fixture('apikeys', 'user_a').value_plain
+
+        # Repeated authentications are served from the authentication cache
+        self.get_all_keys(user_id = user.site_id, token = token)
+        self.get_all_keys(user_id = user.site_id, token = token)
+        assert len(self.testapp.app.registry["auth_cache"]._entries) == 1
+
+        # Disabling the user takes effect immediately
+        self.testapp.put_json(
+            base_url + f"/users/{user.site_id}",
+            headers = self.apikey_auth(self.fixture_manager.get_fixture('users', 'admin')),
+            params = {"enabled": False},
+            status = 204
+        )
+        self.get_all_keys(user_id = user.site_id, token = token, status = 401)
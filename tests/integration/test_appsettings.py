@@ -0,0 +1,52 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datameta.api import base_url
+
+from . import BaseIntegrationTest
+
+
+class AppSettingsTest(BaseIntegrationTest):
+    def setUp(self):
+        super().setUp()
+        self.fixture_manager.load_fixtureset('groups')
+        self.fixture_manager.load_fixtureset('users')
+        self.fixture_manager.load_fixtureset('apikeys')
+
+    def put_appsetting(self, key: str, value: str):
+        headers = self.apikey_auth(self.fixture_manager.get_fixture('users', 'admin'))
+        appsettings = self.testapp.get(
+            url       = f"{base_url}/appsettings",
+            headers   = headers,
+            status    = 200
+        ).json
+        setting_id = next(setting['id']['uuid'] for setting in appsettings if setting['key'] == key)
+        self.testapp.put_json(
+            url       = f"{base_url}/appsettings/{setting_id}",
+            headers   = headers,
+            params    = {"value": value},
+            status    = 204
+        )
+
+    def get_user_agreement(self):
+        return self.testapp.get(url = f"{base_url}/registrationsettings", status = 200).json['userAgreement']
+
+    def test_changes_are_visible_immediately(self):
+        self.put_appsetting("user_agreement", "First agreement")
+        assert self.get_user_agreement() == "First agreement"
+
+        # The cached settings are reloaded after a change
+        self.put_appsetting("user_agreement", "Second agreement")
+        assert self.get_user_agreement() == "Second agreement"
+        assert self.get_user_agreement() == "Second agreement"
@@ -44,3 +44,43 @@ class BulkDeletionTest(BaseIntegrationTest):
             headers=auth_headers,
             status=204
         )
+
+    def test_mds_deletion_mixed_ids(self):
+        self.fixture_manager.load_fixtureset('metadatasets_a_unsubmitted')
+
+        user           = self.fixture_manager.get_fixture('users', 'user_a')
+        msets          = self.fixture_manager.get_fixtureset('metadatasets_a_unsubmitted')
+        auth_headers   = self.apikey_auth(user)
+
+        # The same metadatasets specified both by site ID and UUID
+        metadataset_ids = [ mset.site_id for mset in msets.values() ] + [ str(mset.uuid) for mset in msets.values() ]
+
+        self.testapp.post_json(
+            f"{base_url}/rpc/delete-metadatasets",
+            params={"metadatasetIds": metadataset_ids},
+            headers=auth_headers,
+            status=204
+        )
+
+        for mset_name in msets:
+            assert self.fixture_manager.get_fixture_db('metadatasets_a_unsubmitted', mset_name) is None
+
+    def test_mds_deletion_not_found(self):
+        self.fixture_manager.load_fixtureset('metadatasets_a_unsubmitted')
+
+        user           = self.fixture_manager.get_fixture('users', 'user_a')
+        msets          = self.fixture_manager.get_fixtureset('metadatasets_a_unsubmitted')
+        auth_headers   = self.apikey_auth(user)
+
+        metadataset_ids = [ mset.site_id for mset in msets.values() ] + [ "mset_does_not_exist" ]
+
+        self.testapp.post_json(
+            f"{base_url}/rpc/delete-metadatasets",
+            params={"metadatasetIds": metadataset_ids},
+            headers=auth_headers,
+            status=404
+        )
+
+        # None of the metadatasets must have been deleted
+        for mset_name in msets:
+            assert self.fixture_manager.get_fixture_db('metadatasets_a_unsubmitted', mset_name) is not None
@@ -0,0 +1,69 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datameta.api import base_url
+
+from . import BaseIntegrationTest
+
+
+class ChangeFeedTest(BaseIntegrationTest):
+    def setUp(self):
+        super().setUp()
+        self.fixture_manager.load_fixtureset('groups')
+        self.fixture_manager.load_fixtureset('users')
+        self.fixture_manager.load_fixtureset('apikeys')
+        self.fixture_manager.load_fixtureset('services')
+        self.fixture_manager.load_fixtureset('metadata')
+        self.fixture_manager.load_fixtureset('files_msets')
+        self.fixture_manager.load_fixtureset('submissions')
+        self.fixture_manager.load_fixtureset('metadatasets')
+        self.fixture_manager.load_fixtureset('serviceexecutions')
+        self.fixture_manager.copy_files_to_storage()
+        self.fixture_manager.populate_metadatasets()
+
+    def get_changes(self, executing_user: str, query_string: str = "", status: int = 200):
+        user = self.fixture_manager.get_fixture('users', executing_user) if executing_user else None
+        return self.testapp.get(
+            url       = f"{base_url}/changes?{query_string}",
+            headers   = self.apikey_auth(user) if user else {},
+            status    = status
+        )
+
+    def test_unauthenticated(self):
+        self.get_changes("", status = 401)
+
+    def test_service_execution_events(self):
+        self.testapp.post_json(
+            url       = f"{base_url}/service-execution/service_0/mset_a",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'service_user_0')),
+            status    = 200,
+            params    = {
+                "record": {"ServiceMeta0": 313, "ServiceMeta1": "test_file_unreferenced.txt"},
+                "fileIds": ["test_file_unreferenced"]
+            }
+        )
+
+        # The service execution is announced to users who can read service metadata
+        response = self.get_changes("service_user_0")
+        assert [ (event['event'], event['metadatasetId']['site'], event['serviceId']['site']) for event in response.json['events'] ] == [ ("serviceExecution", "mset_a", "service_0") ]
+        last_sequence = response.json['lastSequence']
+        assert last_sequence == response.json['events'][-1]['sequence']
+
+        # Resuming from the last sequence number yields no further events
+        response = self.get_changes("service_user_0", f"after={last_sequence}&wait=1")
+        assert response.json == { "events": [], "lastSequence": last_sequence }
+
+        # Regular users don't see service executions
+        response = self.get_changes("user_a")
+        assert response.json['events'] == []
@@ -0,0 +1,66 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import io
+import json
+
+from parameterized import parameterized
+
+from datameta.api import base_url
+from . import BaseIntegrationTest
+
+
+class TestExportMetaDataSets(BaseIntegrationTest):
+
+    def setUp(self):
+        super().setUp()
+        self.fixture_manager.load_fixtureset('groups')
+        self.fixture_manager.load_fixtureset('users')
+        self.fixture_manager.load_fixtureset('apikeys')
+        self.fixture_manager.load_fixtureset('services')
+        self.fixture_manager.load_fixtureset('metadata')
+        self.fixture_manager.load_fixtureset('files_msets')
+        self.fixture_manager.load_fixtureset('submissions')
+        self.fixture_manager.load_fixtureset('metadatasets')
+        self.fixture_manager.load_fixtureset('serviceexecutions')
+        self.fixture_manager.copy_files_to_storage()
+        self.fixture_manager.populate_metadatasets()
+
+    @parameterized.expand([
+        ("unauthenticated", None, "format=ndjson", set(), 401),
+        ("regular_user_ndjson", "user_a", "format=ndjson", {'mset_a', 'mset_a_sexec', 'mset_b_sexec'}, 200),
+        ("regular_user_tsv", "user_a", "format=tsv", {'mset_a', 'mset_a_sexec', 'mset_b_sexec'}, 200),
+        ("unauthorized_empty", "user_c", "format=ndjson", set(), 200),
+        ("regular_user_service", "user_a", "awaitingService=service_0", set(), 400),
+        ("service_user_combined", "service_user_0", "format=tsv&awaitingService=service_0&submittedBefore=2021-01-02T00:00:00%2B00:00", {'mset_a'}, 200),
+        ])
+    def test_export_metadatasets(self, _, executing_user: str, query_string: str, expected_mset_ids: set, expected_status: int):
+        user = self.fixture_manager.get_fixture('users', executing_user) if executing_user else None
+        auth_headers = self.apikey_auth(user) if user else {}
+
+        response = self.testapp.get(
+            url       = f"{base_url}/rpc/export-metadatasets?{query_string}",
+            headers   = auth_headers,
+            status    = expected_status
+        )
+
+        if expected_status == 200:
+            if response.content_type == "text/tab-separated-values":
+                rows = list(csv.DictReader(io.StringIO(response.text), delimiter="\t"))
+                returned_mset_ids = { row['id'] for row in rows }
+            else:
+                assert response.content_type == "application/x-ndjson"
+                returned_mset_ids = { json.loads(line)['id']['site'] for line in response.text.splitlines() }
+            assert returned_mset_ids == expected_mset_ids, "Exported metadatasets did not match expected ones"
@@ -12,9 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import transaction
+
 from . import BaseIntegrationTest
 from parameterized import parameterized
 from datameta.api import base_url
+from datameta.models import MetaDatum, MetaDatumRecord, get_tm_session
+from datameta.api.metadata import metadata_registry
 
 no_service_metadata   = {'ZIP Code', 'ID', 'FileR1', 'Date', 'FileR2'}
 all_metadata          = no_service_metadata.union({ 'ServiceMeta0' , 'ServiceMeta1' })
@@ -55,6 +59,16 @@ class TestGetMetaDataSets(BaseIntegrationTest):
         ("service_user_after", "service_user_0", "submittedAfter=2021-01-02T00:00:00%2B00:00", {'mset_b_sexec'}, all_metadata, True, 200),
         # A service user queries part of the metadatasets by specifying a submission time boundary and an awaitingService constraint
         ("service_user_combined", "service_user_0", "awaitingService=service_0&submittedBefore=2021-01-02T00:00:00%2B00:00", {'mset_a'}, all_metadata, True, 200),
+        # A regular user restricts the returned fields
+        ("regular_user_fields", "user_a", "fields=ID,Date", {'mset_a', 'mset_a_sexec', 'mset_b_sexec'}, {'ID', 'Date'}, False, 200),
+        # A regular user requests a field they have no read access to
+        ("regular_user_fields_service", "user_a", "fields=ID,ServiceMeta0", None, None, False, 400),
+        # A regular user requests an unknown field
+        ("regular_user_fields_unknown", "user_a", "fields=ID,Unknown", None, None, False, 400),
+        # A service user restricts the returned fields to include a service metadatum
+        ("service_user_fields_service", "service_user_0", "fields=ID,ServiceMeta0", {'mset_a', 'mset_a_sexec', 'mset_b_sexec'}, {'ID', 'ServiceMeta0'}, True, 200),
+        # A service user restricts the returned fields to non-service metadata
+        ("service_user_fields", "service_user_0", "fields=FileR1", {'mset_a', 'mset_a_sexec', 'mset_b_sexec'}, {'FileR1'}, False, 200),
         ])
     def test_query_metadatasets(self, _,
             executing_user: str,
@@ -89,3 +103,167 @@ class TestGetMetaDataSets(BaseIntegrationTest):
                 assert all(isinstance(mset['serviceExecutions'], dict) for mset in response.json)
             else:
                 assert all(mset['serviceExecutions'] is None for mset in response.json)
+
+    def test_query_metadatasets_paginated(self):
+        user = self.fixture_manager.get_fixture('users', 'service_user_0')
+        auth_headers = self.apikey_auth(user)
+
+        # Page through all metadatasets one at a time using the cursor
+        returned_mset_ids, n_pages, query_string = [], 0, "limit=1"
+        while query_string is not None:
+            response = self.testapp.get(
+                url       = f"{base_url}/metadatasets?{query_string}",
+                headers   = auth_headers,
+                status    = 200
+            )
+            n_pages += 1
+            assert len(response.json) == 1, "Page size did not match the specified limit"
+            returned_mset_ids += [ mset['id']['site'] for mset in response.json ]
+            next_cursor = response.headers.get('X-Next-Cursor')
+            query_string = f"limit=1&after={next_cursor}" if next_cursor else None
+
+        assert n_pages == 3, "Unexpected number of pages"
+        assert set(returned_mset_ids) == {'mset_a', 'mset_a_sexec', 'mset_b_sexec'}, "Returned metadatasets did not match expected ones"
+        assert len(returned_mset_ids) == len(set(returned_mset_ids)), "Metadatasets were returned on more than one page"
+
+    def test_query_metadatasets_invalid_cursor(self):
+        user = self.fixture_manager.get_fixture('users', 'service_user_0')
+
+        self.testapp.get(
+            url       = f"{base_url}/metadatasets?limit=1&after=invalid",
+            headers   = self.apikey_auth(user),
+            status    = 400
+        )
+
+    def test_query_metadataset_fields(self):
+        user = self.fixture_manager.get_fixture('users', 'service_user_0')
+
+        response = self.testapp.get(
+            url       = f"{base_url}/metadatasets/mset_a_sexec?fields=FileR1,ServiceMeta0",
+            headers   = self.apikey_auth(user),
+            status    = 200
+        )
+
+        assert set(response.json['record']) == {'FileR1', 'ServiceMeta0'}, "Returned metadata did not match requested fields"
+        assert set(response.json['fileIds']) == {'FileR1'}, "Returned file IDs did not match requested fields"
+        assert set(response.json['serviceExecutions']) == {'ServiceMeta0'}, "Returned service executions did not match requested fields"
+
+    def test_query_metadataset_renamed_metadatum(self):
+        admin = self.fixture_manager.get_fixture('users', 'admin')
+        mdatum = self.fixture_manager.get_fixture('metadata', 'ZIP Code')
+
+        self.testapp.put_json(
+            url       = f"{base_url}/metadata/{mdatum.uuid}",
+            headers   = self.apikey_auth(admin),
+            status    = 200,
+            params    = {
+                "name": "Postal Code",
+                "regexDescription": "",
+                "longDescription": "",
+                "example": "123",
+                "regExp": "",
+                "dateTimeFmt": "",
+                "isMandatory": True,
+                "order": 300,
+                "isFile": False,
+                "isSubmissionUnique": False,
+                "isSiteUnique": False,
+                "serviceId": None
+            }
+        )
+
+        response = self.testapp.get(
+            url       = f"{base_url}/metadatasets/mset_a",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'user_a')),
+            status    = 200
+        )
+
+        assert 'ZIP Code' not in response.json['record']
+        assert response.json['record']['Postal Code'] == "123", "Record was not renamed along with the metadatum"
+
+    def test_query_metadataset_added_metadatum(self):
+        admin = self.fixture_manager.get_fixture('users', 'admin')
+
+        self.testapp.post_json(
+            url       = f"{base_url}/metadata",
+            headers   = self.apikey_auth(admin),
+            status    = 200,
+            params    = {
+                "name": "Country",
+                "regexDescription": "",
+                "longDescription": "",
+                "example": "Germany",
+                "regExp": "",
+                "dateTimeFmt": "",
+                "isMandatory": False,
+                "order": 600,
+                "isFile": False,
+                "isSubmissionUnique": False,
+                "isSiteUnique": False,
+                "serviceId": None
+            }
+        )
+
+        # Adding a metadatum doesn't materialize records for existing metadatasets
+        db = self.session_factory()
+        try:
+            assert db.query(MetaDatumRecord).join(MetaDatum).filter(MetaDatum.name == "Country").count() == 0
+        finally:
+            db.close()
+
+        response = self.testapp.get(
+            url       = f"{base_url}/metadatasets/mset_a",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'user_a')),
+            status    = 200
+        )
+
+        assert response.json['record']['Country'] is None, "Added metadatum was not reported as unset"
+
+    def test_metadata_cache_invalidation(self):
+        def get_record_keys():
+            return set(self.testapp.get(
+                url       = f"{base_url}/metadatasets/mset_a",
+                headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'user_a')),
+                status    = 200
+            ).json['record'])
+
+        assert 'ZIP Code' in get_record_keys()
+
+        # Changes that bypass the invalidation are not seen, the cached
+        # definitions are served
+        with transaction.manager:
+            db = get_tm_session(self.session_factory, transaction.manager)
+            db.query(MetaDatum).filter(MetaDatum.name == 'ZIP Code').update({ MetaDatum.name : 'Postal Code' }, synchronize_session = False)
+        assert 'ZIP Code' in get_record_keys()
+
+        # Changing a metadatum through the API invalidates the cached
+        # definitions
+        mdatum = self.fixture_manager.get_fixture('metadata', 'ZIP Code')
+        self.testapp.put_json(
+            url       = f"{base_url}/metadata/{mdatum.uuid}",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'admin')),
+            status    = 200,
+            params    = {
+                "name": "Zip",
+                "regexDescription": "",
+                "longDescription": "",
+                "example": "123",
+                "regExp": "",
+                "dateTimeFmt": "",
+                "isMandatory": True,
+                "order": 300,
+                "isFile": False,
+                "isSubmissionUnique": False,
+                "isSiteUnique": False,
+                "serviceId": None
+            }
+        )
+        record_keys = get_record_keys()
+        assert 'Zip' in record_keys and 'ZIP Code' not in record_keys and 'Postal Code' not in record_keys
+
+        # Invalidations committed by other sessions are observed as well
+        with transaction.manager:
+            db = get_tm_session(self.session_factory, transaction.manager)
+            db.query(MetaDatum).filter(MetaDatum.name == 'Zip').update({ MetaDatum.name : 'Postal Code' }, synchronize_session = False)
+            metadata_registry.invalidate(db)
+        assert 'Postal Code' in get_record_keys()
@@ -14,10 +14,14 @@
 
 """Testing tracking of failed login attempts
 """
+from datetime import datetime, timedelta
+
+import transaction
 from parameterized import parameterized
 
 from . import BaseIntegrationTest
 from datameta.api import base_url
+from datameta.models import LoginAttempt, get_tm_session
 from .utils import get_auth_header
 
 from datameta.security.tfaz import get_user_2fa_secret, generate_otp
@@ -132,3 +136,27 @@ class TestLoginTracking(BaseIntegrationTest):
         db_user = self.fixture_manager.get_fixture_db("users", executing_user)
 
         assert (response.status_int, db_user.enabled) == expected_outcome
+
+    def test_login_tracking_window(self):
+        n_attempts = 2
+        self.set_application_setting("security_max_failed_login_attempts", n_attempts)
+
+        # Attempts older than an hour don't count towards blocking the user
+        user = self.fixture_manager.get_fixture('users', 'user_a')
+        with transaction.manager:
+            db = get_tm_session(self.session_factory, transaction.manager)
+            db.add_all([ LoginAttempt(user_id = user.id, timestamp = datetime.utcnow() - timedelta(hours = 2)) for _ in range(n_attempts) ])
+
+        form = self.testapp.get("/login").forms[0]
+        form["input_email"] = user.email
+        form["input_password"] = user.password + "_somenonsense"
+        form.submit("form.submitted")
+
+        assert self.fixture_manager.get_fixture_db("users", "user_a").enabled
+
+        # The outdated attempts were pruned
+        db = self.session_factory()
+        try:
+            assert db.query(LoginAttempt).filter(LoginAttempt.user_id == user.id).count() == 1
+        finally:
+            db.close()
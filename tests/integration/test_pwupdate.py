@@ -80,3 +80,25 @@ class TestPasswordUpdate(BaseIntegrationTest):
             f"{base_url}/users/{user_id}/password",
             **req_json
         )
+
+    def test_password_history_depth(self):
+        self.set_application_setting("security_password_history_depth", 1)
+
+        user = self.fixture_manager.get_fixture('users', 'user_d')
+        auth_header = get_auth_header(self.fixture_manager.get_fixture('apikeys', 'user_d').value_plain)
+
+        def change_password(current_password: str, new_password: str, status: int):
+            self.testapp.put_json(
+                f"{base_url}/users/{user.site_id}/password",
+                headers = auth_header,
+                params = {"passwordChangeCredential": current_password, "newPassword": new_password},
+                status = status
+            )
+
+        # The most recent password is checked
+        change_password(user.password, user.password, 400)
+        change_password(user.password, "Ab.012345678910", 200)
+
+        # The password used before the most recent one may be reused
+        change_password("Ab.012345678910", user.password, 200)
+        change_password(user.password, user.password, 400)
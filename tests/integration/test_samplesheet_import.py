@@ -0,0 +1,237 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import io
+import json
+import statistics
+import threading
+import time
+
+import openpyxl
+import unittest
+from webtest import TestApp
+
+from datameta.api import base_url
+from datameta.api.ui.convert import ConvertedSampleSheet, SampleSheetRecords
+from datameta.samplesheet import pyarrow
+
+from . import BaseIntegrationTest
+
+
+class SampleSheetImportTest(BaseIntegrationTest):
+    def setUp(self):
+        super().setUp()
+        self.fixture_manager.load_fixtureset('groups')
+        self.fixture_manager.load_fixtureset('users')
+        self.fixture_manager.load_fixtureset('apikeys')
+        self.fixture_manager.load_fixtureset('services')
+        self.fixture_manager.load_fixtureset('metadata')
+
+    def import_samplesheet(self, content: bytes, status: int = 200):
+        return self.testapp.post(
+            url            = "/api/ui/import",
+            headers        = self.apikey_auth(self.fixture_manager.get_fixture('users', 'user_a')),
+            upload_files   = [("file", "samplesheet.csv", content)],
+            status         = status
+        )
+
+    def convert_samplesheet(self, content: bytes, filename: str = "samplesheet.csv", status: int = 200):
+        return self.testapp.post(
+            url            = "/api/ui/convert",
+            headers        = self.apikey_auth(self.fixture_manager.get_fixture('users', 'user_a')),
+            upload_files   = [("file", filename, content)],
+            status         = status
+        )
+
+    def get_pending(self):
+        return self.testapp.get(
+            url       = "/api/ui/pending",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'user_a')),
+            status    = 200
+        )
+
+    def test_import(self):
+        response = self.import_samplesheet(
+                b"ID,Date,ZIP Code,FileR1,FileR2\n"
+                b"ID1,2021-01-05,123,a_R1.fastq.gz,a_R2.fastq.gz\n"
+                b"ID2,2021-1-6,456,b_R1.fastq.gz,b_R2.fastq.gz\n"
+                b"ID1,2021-01-05,123,a_R1.fastq.gz,a_R2.fastq.gz\n"
+                b"ID3,not a date,789,c_R1.fastq.gz,c_R2.fastq.gz\n"
+                )
+
+        # The duplicate row is dropped, the row with the invalid date is reported
+        assert response.json['nStaged'] == 2
+        assert [ mset['record']['ID'] for mset in response.json['failedMetadatasets'] ] == [ 'ID3' ]
+        assert [ (error['field'], error['entity']) for error in response.json['errors'] ] == [ ('Date', { 'uuid' : 'FAIL-0' }) ]
+
+        pending = self.get_pending().json['metadatasets']
+        assert sorted((mset['record']['ID'], mset['record']['Date']) for mset in pending) == [ ('ID1', '2021-01-05'), ('ID2', '2021-01-06') ]
+
+    def test_missing_columns(self):
+        response = self.import_samplesheet(b"ID,Date\nID1,2021-01-05\n", status = 400)
+        assert response.json[0]['message'] == "Missing columns: ZIP Code, FileR1, FileR2."
+        assert self.get_pending().json['metadatasets'] == []
+
+    def test_convert(self):
+        response = self.convert_samplesheet(
+                b"ID,Date,ZIP Code,FileR1,FileR2,Other\n"
+                b"ID1,2021-1-5,123,a_R1.fastq.gz,a_R2.fastq.gz,x\n"
+                b"ID2,,,b_R1.fastq.gz,b_R2.fastq.gz,y\n"
+                b"ID1,2021-1-5,123,a_R1.fastq.gz,a_R2.fastq.gz,z\n"
+                b"ID3,not a date,789,c_R1.fastq.gz,c_R2.fastq.gz,x\n"
+                )
+
+        assert response.content_type == "application/json"
+        assert json.loads(response.body) == [
+                { "ID" : "ID1", "Date" : "2021-01-05", "ZIP Code" : "123", "FileR1" : "a_R1.fastq.gz", "FileR2" : "a_R2.fastq.gz" },
+                { "ID" : "ID2", "Date" : None, "ZIP Code" : None, "FileR1" : "b_R1.fastq.gz", "FileR2" : "b_R2.fastq.gz" },
+                { "ID" : "ID3", "Date" : None, "ZIP Code" : "789", "FileR1" : "c_R1.fastq.gz", "FileR2" : "c_R2.fastq.gz" },
+                ]
+
+    def test_convert_empty(self):
+        header = [ "ID", "Date", "ZIP Code", "FileR1", "FileR2" ]
+        workbook = openpyxl.Workbook()
+        workbook.active.append(header)
+        xlsx_content = io.BytesIO()
+        workbook.save(xlsx_content)
+
+        for filename, content in [ ("samplesheet.csv", ",".join(header).encode() + b"\n"), ("samplesheet.xlsx", xlsx_content.getvalue()) ]:
+            response = self.convert_samplesheet(content, filename)
+            assert json.loads(response.body) == []
+
+    def test_convert_streams_chunks(self):
+        chunks = [
+                { "records" : [], "failed" : [] },
+                { "records" : [ { "ID" : "ID1" }, { "ID" : "ID2" } ], "failed" : [] },
+                { "records" : [], "failed" : [] },
+                { "records" : [ { "ID" : "ID3" } ], "failed" : [] },
+                { "records" : [], "failed" : [] },
+                ]
+        content = "".join(json.dumps(chunk) + "\n" for chunk in chunks).encode()
+        assert json.loads(b"".join(SampleSheetRecords(ConvertedSampleSheet(content = content)))) == [ { "ID" : "ID1" }, { "ID" : "ID2" }, { "ID" : "ID3" } ]
+        assert json.loads(b"".join(SampleSheetRecords(ConvertedSampleSheet(content = content[:content.index(b"\n") + 1])))) == []
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_convert_columnar_formats(self):
+        table = pyarrow.table({
+            "ID"         : pyarrow.array([ "ID1", "ID2", "ID1", None ], pyarrow.string()),
+            "Date"       : pyarrow.array([ datetime.date(2021, 1, 5), None, datetime.date(2021, 1, 5), datetime.date(1999, 12, 31) ], pyarrow.date32()),
+            "ZIP Code"   : pyarrow.array([ 123, None, 123, 456 ], pyarrow.int64()),
+            "FileR1"     : pyarrow.array([ "a_R1.fastq.gz", "b_R1.fastq.gz", "a_R1.fastq.gz", "c_R1.fastq.gz" ], pyarrow.string()),
+            "FileR2"     : pyarrow.array([ "a_R2.fastq.gz", "b_R2.fastq.gz", "a_R2.fastq.gz", None ], pyarrow.string()),
+            })
+        csv_content = (
+                b"ID,Date,ZIP Code,FileR1,FileR2\n"
+                b"ID1,2021-01-05,123,a_R1.fastq.gz,a_R2.fastq.gz\n"
+                b"ID2,,,b_R1.fastq.gz,b_R2.fastq.gz\n"
+                b"ID1,2021-01-05,123,a_R1.fastq.gz,a_R2.fastq.gz\n"
+                b",1999-12-31,456,c_R1.fastq.gz,\n"
+                )
+        expected = json.loads(self.convert_samplesheet(csv_content).body)
+        assert expected == [
+                { "ID" : "ID1", "Date" : "2021-01-05", "ZIP Code" : "123", "FileR1" : "a_R1.fastq.gz", "FileR2" : "a_R2.fastq.gz" },
+                { "ID" : "ID2", "Date" : None, "ZIP Code" : None, "FileR1" : "b_R1.fastq.gz", "FileR2" : "b_R2.fastq.gz" },
+                { "ID" : None, "Date" : "1999-12-31", "ZIP Code" : "456", "FileR1" : "c_R1.fastq.gz", "FileR2" : None },
+                ]
+
+        parquet_content = io.BytesIO()
+        pyarrow.parquet.write_table(table, parquet_content, row_group_size = 2)
+        ipc_file_content = io.BytesIO()
+        with pyarrow.ipc.new_file(ipc_file_content, table.schema) as writer:
+            writer.write_table(table, max_chunksize = 2)
+        ipc_stream_content = io.BytesIO()
+        with pyarrow.ipc.new_stream(ipc_stream_content, table.schema) as writer:
+            writer.write_table(table, max_chunksize = 2)
+
+        for filename, content in [
+                ("samplesheet.parquet", parquet_content.getvalue()),
+                ("samplesheet.arrow", ipc_file_content.getvalue()),
+                ("samplesheet.arrows", ipc_stream_content.getvalue()),
+                ]:
+            assert json.loads(self.convert_samplesheet(content, filename).body) == expected, filename
+
+    def test_conversion_cache(self):
+        content = (
+                b"ID,Date,ZIP Code,FileR1,FileR2\n"
+                b"ID1,2021-01-05,123,a_R1.fastq.gz,a_R2.fastq.gz\n"
+                b"ID2,not a date,456,b_R1.fastq.gz,b_R2.fastq.gz\n"
+                )
+        first_response = self.import_samplesheet(content)
+        cache = self.testapp.app.registry["samplesheet_cache"]
+        assert len(cache._entries) == 1
+
+        # The repeated import is served from the cache and stages the rows again
+        second_response = self.import_samplesheet(content)
+        assert len(cache._entries) == 1
+        assert second_response.json == first_response.json
+        assert len(self.get_pending().json['metadatasets']) == 2
+
+    def whoami_latency(self) -> float:
+        start = time.perf_counter()
+        self.testapp.get(
+            url       = f"{base_url}/rpc/whoami",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'user_b')),
+            status    = 200
+        )
+        return time.perf_counter() - start
+
+    def test_api_latency_during_import(self):
+        """The conversion runs in a worker process and must not stall the
+        requests that are served concurrently"""
+        # The compressed workbook repeats a single row, such that the upload
+        # is small and only one metadataset is staged, but the conversion in
+        # the worker process takes several seconds
+        workbook = openpyxl.Workbook(write_only = True)
+        worksheet = workbook.create_sheet()
+        worksheet.append([ "ID", "Date", "ZIP Code", "FileR1", "FileR2" ])
+        for _ in range(50000):
+            worksheet.append([ "ID1", "2021-1-5", "123", "a_R1.fastq.gz", "a_R2.fastq.gz" ])
+        content = io.BytesIO()
+        workbook.save(content)
+
+        baseline = [ self.whoami_latency() for _ in range(20) ]
+
+        import_done = threading.Event()
+        import_responses, import_errors = [], []
+
+        def run_import():
+            try:
+                import_app = TestApp(self.testapp.app)
+                import_responses.append(import_app.post(
+                    url            = "/api/ui/import",
+                    headers        = self.apikey_auth(self.fixture_manager.get_fixture('users', 'user_a')),
+                    upload_files   = [("file", "samplesheet.xlsx", content.getvalue())],
+                    status         = 200
+                ))
+            except BaseException as e:
+                import_errors.append(e)
+            finally:
+                import_done.set()
+
+        import_thread = threading.Thread(target = run_import, daemon = True)
+        import_thread.start()
+
+        latencies = []
+        deadline = time.monotonic() + 120
+        while not import_done.is_set() and time.monotonic() < deadline:
+            latencies.append(self.whoami_latency())
+        import_thread.join(timeout = max(deadline - time.monotonic(), 0))
+
+        assert import_done.is_set(), "The import did not finish in time"
+        if import_errors:
+            raise import_errors[0]
+        assert import_responses[0].json['nStaged'] == 1
+        assert len(latencies) > 1
+        assert statistics.median(latencies) < 3 * statistics.median(baseline) + 0.1
@@ -86,3 +86,76 @@ class ServiceExecutionTest(BaseIntegrationTest):
             mdrecords = {mdr.metadatum.name: mdr.value for mdr in mset_after.metadatumrecords}
             for key, value in request_body.get("record", dict()).items():
                 assert mdrecords.get(key) == str(value), f"Metadata was not set as expected {key}: {mdrecords.get(key)}, expected: {value}"
+                assert mset_after.record.get(key) == str(value), f"Denormalized record was not updated {key}: {mset_after.record.get(key)}, expected: {value}"
+
+    @parameterized.expand([
+        ("unauthorized_no_user", "", "service_0", ["mset_a"], 401),
+        ("forbidden_no_service_user", "admin", "service_0", ["mset_a"], 403),
+        ("service_does_not_exist", "service_user_0", "service_x", ["mset_a"], 404),
+        ("success", "service_user_0", "service_0", ["mset_a"], 200),
+        ("service_already_executed", "service_user_0", "service_0", ["mset_a", "mset_a_sexec"], 400),
+        ("metadataset_not_found", "service_user_0", "service_0", ["mset_a", "mset_x"], 400),
+        ("duplicate_metadataset", "service_user_0", "service_0", ["mset_a", "mset_a"], 400),
+    ])
+    def test_service_execution_bulk(self, _, executing_user: str, service_id: str, mset_ids: list, expected_status: int):
+        user = self.fixture_manager.get_fixture('users', executing_user) if executing_user else None
+        auth_headers = self.apikey_auth(user) if user else {}
+
+        request_body = {
+            "executions": [
+                {
+                    "metadatasetId": mset_id,
+                    "record": {"ServiceMeta0": 313, "ServiceMeta1": "test_file_unreferenced.txt"} if idx == 0 else {"ServiceMeta0": 313},
+                    "fileIds": ["test_file_unreferenced"] if idx == 0 else []
+                }
+                for idx, mset_id in enumerate(mset_ids)
+            ]
+        }
+
+        response = self.testapp.post_json(
+            url       = f"{base_url}/service-execution/{service_id}",
+            headers   = auth_headers,
+            status    = expected_status,
+            params    = request_body
+        )
+
+        if expected_status == 200:
+            assert [ item['metadatasetId']['site'] for item in response.json ] == mset_ids
+            for mset_id in mset_ids:
+                mset_after = self.fixture_manager.get_fixture_db("metadatasets", mset_id, joinedload(models.MetaDataSet.service_executions).joinedload(models.ServiceExecution.service))
+                assert service_id in (sexec.service.site_id for sexec in mset_after.service_executions), f"Service {service_id} was not executed."
+        elif expected_status == 400:
+            # Errors are reported for the offending metadatasets and nothing is stored
+            assert all('entity' in error for error in response.json)
+            if "mset_x" in mset_ids:
+                assert { "site" : "mset_x" } in (error['entity'] for error in response.json)
+            mset_after = self.fixture_manager.get_fixture_db("metadatasets", "mset_a", joinedload(models.MetaDataSet.service_executions).joinedload(models.ServiceExecution.service))
+            assert service_id not in (sexec.service.site_id for sexec in mset_after.service_executions)
+
+    def test_service_execution_bulk_duplicate_identifiers(self):
+        """A metadataset referenced by its site ID and its UUID is a duplicate"""
+        mset = self.fixture_manager.get_fixture_db("metadatasets", "mset_a")
+        request_body = {
+            "executions": [
+                {
+                    "metadatasetId": mset_id,
+                    "record": {"ServiceMeta0": 313, "ServiceMeta1": "test_file_unreferenced.txt"},
+                    "fileIds": ["test_file_unreferenced"]
+                }
+                for mset_id in [ mset.site_id, str(mset.uuid) ]
+            ]
+        }
+
+        response = self.testapp.post_json(
+            url       = f"{base_url}/service-execution/service_0",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'service_user_0')),
+            status    = 400,
+            params    = request_body
+        )
+
+        messages = [ error['message'] for error in response.json ]
+        assert messages.count("Metadataset occurs multiple times among provided results") == 2
+        assert "File occurs in multiple results" in messages
+
+        mset_after = self.fixture_manager.get_fixture_db("metadatasets", "mset_a", joinedload(models.MetaDataSet.service_executions).joinedload(models.ServiceExecution.service))
+        assert "service_0" not in (sexec.service.site_id for sexec in mset_after.service_executions)
@@ -0,0 +1,151 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import uuid
+
+from parameterized import parameterized
+from sqlalchemy import event
+
+from datameta.api import base_url
+from datameta.models import ServiceLease
+
+from . import BaseIntegrationTest
+
+
+class ServiceLeaseTest(BaseIntegrationTest):
+    def setUp(self):
+        super().setUp()
+        self.fixture_manager.load_fixtureset('groups')
+        self.fixture_manager.load_fixtureset('users')
+        self.fixture_manager.load_fixtureset('apikeys')
+        self.fixture_manager.load_fixtureset('services')
+        self.fixture_manager.load_fixtureset('metadata')
+        self.fixture_manager.load_fixtureset('files_msets')
+        self.fixture_manager.load_fixtureset('submissions')
+        self.fixture_manager.load_fixtureset('metadatasets')
+        self.fixture_manager.load_fixtureset('serviceexecutions')
+        self.fixture_manager.copy_files_to_storage()
+        self.fixture_manager.populate_metadatasets()
+
+    def claim(self, executing_user: str, service_id: str, status: int = 200, count: int = 10, duration: int = 60):
+        user = self.fixture_manager.get_fixture('users', executing_user) if executing_user else None
+        return self.testapp.post_json(
+            url       = f"{base_url}/services/{service_id}/leases",
+            headers   = self.apikey_auth(user) if user else {},
+            status    = status,
+            params    = {"count": count, "duration": duration}
+        )
+
+    @parameterized.expand([
+        ("unauthorized_no_user", "", "service_0", 401),
+        ("forbidden_no_service_user", "user_a", "service_0", 403),
+        ("service_does_not_exist", "service_user_0", "service_x", 404),
+    ])
+    def test_claim_failures(self, _, executing_user: str, service_id: str, expected_status: int):
+        self.claim(executing_user, service_id, expected_status)
+
+    def test_claim_release_reclaim(self):
+        # Only mset_a is awaiting service_0
+        response = self.claim("service_user_0", "service_0")
+        assert [ lease['metadatasetId']['site'] for lease in response.json ] == [ 'mset_a' ]
+        assert response.json[0]['metadataset']['id']['site'] == 'mset_a'
+        lease_id = response.json[0]['id']['uuid']
+
+        # A second claim must not hand out the leased metadataset again
+        response = self.claim("service_user_0", "service_0")
+        assert response.json == []
+
+        # Other users cannot renew or release the lease
+        self.testapp.put_json(
+            url       = f"{base_url}/service-leases/{lease_id}",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'user_a')),
+            status    = 403,
+            params    = {"duration": 60}
+        )
+        self.testapp.delete(
+            url       = f"{base_url}/service-leases/{lease_id}",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'user_a')),
+            status    = 403
+        )
+
+        # The lease holder can renew and release the lease
+        service_user = self.fixture_manager.get_fixture('users', 'service_user_0')
+        self.testapp.put_json(
+            url       = f"{base_url}/service-leases/{lease_id}",
+            headers   = self.apikey_auth(service_user),
+            status    = 200,
+            params    = {"duration": 120}
+        )
+        self.testapp.delete(
+            url       = f"{base_url}/service-leases/{lease_id}",
+            headers   = self.apikey_auth(service_user),
+            status    = 204
+        )
+
+        # After the release, the metadataset can be claimed again
+        response = self.claim("service_user_0", "service_0")
+        assert [ lease['metadatasetId']['site'] for lease in response.json ] == [ 'mset_a' ]
+
+    def test_concurrent_claim(self):
+        """A metadataset leased by a concurrent claim that is not visible to the
+        transaction of a claim is skipped"""
+        lease = {
+                "uuid"             : uuid.uuid4(),
+                "service_id"       : self.fixture_manager.get_fixture_db('services', 'service_0').id,
+                "user_id"          : self.fixture_manager.get_fixture_db('users', 'service_user_0').id,
+                "metadataset_id"   : self.fixture_manager.get_fixture_db('metadatasets', 'mset_a').id,
+                "expires"          : datetime.datetime.utcnow() + datetime.timedelta(hours = 1),
+                }
+        leased = []
+
+        def lease_concurrently(session, transaction, connection):
+            # Take the snapshot of the claim's transaction, then lease the
+            # metadataset in another transaction
+            if not leased:
+                leased.append(lease)
+                connection.execute("SELECT 1")
+                with self.engine.begin() as other_connection:
+                    other_connection.execute(ServiceLease.__table__.insert().values(**lease))
+
+        dbsession_factory = self.testapp.app.registry['dbsession_factory']
+        event.listen(dbsession_factory, "after_begin", lease_concurrently)
+        try:
+            response = self.claim("service_user_0", "service_0")
+        finally:
+            event.remove(dbsession_factory, "after_begin", lease_concurrently)
+
+        assert leased
+        assert response.json == []
+
+    def test_service_execution_ends_lease(self):
+        response = self.claim("service_user_0", "service_0")
+        lease_id = response.json[0]['id']['uuid']
+
+        self.testapp.post_json(
+            url       = f"{base_url}/service-execution/service_0/mset_a",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'service_user_0')),
+            status    = 200,
+            params    = {
+                "record": {"ServiceMeta0": 313, "ServiceMeta1": "test_file_unreferenced.txt"},
+                "fileIds": ["test_file_unreferenced"]
+            }
+        )
+
+        self.testapp.put_json(
+            url       = f"{base_url}/service-leases/{lease_id}",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'service_user_0')),
+            status    = 404,
+            params    = {"duration": 60}
+        )
@@ -422,6 +422,15 @@ class TestStageAndSubmitSenario(BaseIntegrationTest):
             expected_submission_uuid = submission_response["id"]["uuid"]
         )
 
+        # check that the submitted metadatasets are counted for the group:
+        response = self.testapp.post(
+            "/api/ui/view",
+            headers = auth_headers,
+            params = { "draw": 1, "length": 25, "start": 0, "search[value]": "", "order[0][column]": 4, "order[0][dir]": "asc" },
+            status = 200
+        )
+        assert response.json["recordsTotal"] == len(metadataset_ids)
+
         # check if files and metadatasets can still be accessed
         # after submission:
         _ = [
@@ -0,0 +1,121 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import transaction
+from parameterized import parameterized
+
+from datameta.models import Group, User, get_tm_session
+
+from . import BaseIntegrationTest
+
+
+class ViewTableTest(BaseIntegrationTest):
+    def setUp(self):
+        super().setUp()
+        self.fixture_manager.load_fixtureset('groups')
+        self.fixture_manager.load_fixtureset('users')
+        self.fixture_manager.load_fixtureset('apikeys')
+        self.fixture_manager.load_fixtureset('services')
+        self.fixture_manager.load_fixtureset('metadata')
+        self.fixture_manager.load_fixtureset('files_msets')
+        self.fixture_manager.load_fixtureset('submissions')
+        self.fixture_manager.load_fixtureset('metadatasets')
+        self.fixture_manager.load_fixtureset('serviceexecutions')
+        self.fixture_manager.copy_files_to_storage()
+        self.fixture_manager.populate_metadatasets()
+
+    def view(self, search: str = "", sort_idx: int = 4, sort_dir: str = "asc", start: int = 0, length: int = 25, cursor: str = None):
+        params = {
+                "draw": 1,
+                "length": length,
+                "start": start,
+                "search[value]": search,
+                "order[0][column]": sort_idx,
+                "order[0][dir]": sort_dir
+                }
+        if cursor is not None:
+            params["cursor"] = cursor
+        return self.testapp.post(
+            url       = "/api/ui/view",
+            headers   = self.apikey_auth(self.fixture_manager.get_fixture('users', 'user_a')),
+            status    = 200,
+            params    = params
+        )
+
+    @parameterized.expand([
+        ("no_search", "", ['mset_a', 'mset_a_sexec', 'mset_b_sexec']),
+        ("record_value", "MD03", ['mset_a']),
+        ("submission_label", "submission_a_label", ['mset_a', 'mset_a_sexec']),
+        ("many_terms", "123 2021-03-04 submission_a sexec MD100", ['mset_a_sexec']),
+        ("no_match", "MD03 MD100", []),
+    ])
+    def test_search(self, _, search: str, expected_mset_ids: list):
+        response = self.view(search)
+        assert [ mset['id']['site'] for mset in response.json['data'] ] == expected_mset_ids
+        assert response.json['recordsFiltered'] == len(expected_mset_ids)
+        assert response.json['recordsTotal'] == 3
+
+    def test_too_many_search_terms(self):
+        response = self.view(" ".join(f"term{i}" for i in range(11)))
+        assert 'error' in response.json
+
+    @parameterized.expand([
+        (f"{sort_idx}_{sort_dir}", sort_idx, sort_dir)
+        for sort_idx in range(12)
+        for sort_dir in ("asc", "desc")
+    ])
+    def test_keyset_pagination(self, _, sort_idx: int, sort_dir: str):
+        self.assert_keyset_pagination(sort_idx, sort_dir)
+
+    @parameterized.expand([ ("asc", "asc"), ("desc", "desc") ])
+    def test_keyset_pagination_null_sort_values(self, _, sort_dir: str):
+        # Users without a full name must not be skipped by the cursor
+        with transaction.manager:
+            db = get_tm_session(self.session_factory, transaction.manager)
+            db.query(User).filter(User.site_id != 'user_a').update({ User.fullname : None }, synchronize_session = False)
+
+        assert len(self.assert_keyset_pagination(2, sort_dir)) == 3
+
+    def test_keyset_pagination_recounts(self):
+        expected = [ mset['id']['site'] for mset in self.view().json['data'] ]
+        first_page = self.view(length = 1).json
+
+        # Metadatasets submitted while paging are reflected in the counts
+        with transaction.manager:
+            db = get_tm_session(self.session_factory, transaction.manager)
+            group_id = db.query(User.group_id).filter(User.site_id == 'user_a').scalar()
+            db.query(Group).filter(Group.id == group_id).update({ Group.n_metadatasets : Group.n_metadatasets + 5 }, synchronize_session = False)
+
+        second_page = self.view(start = 1, length = 1, cursor = first_page['cursor']).json
+        assert [ mset['id']['site'] for mset in second_page['data'] ] == expected[1:2]
+        assert second_page['recordsTotal'] == first_page['recordsTotal'] + 5
+        assert second_page['recordsFiltered'] == first_page['recordsFiltered']
+
+    def assert_keyset_pagination(self, sort_idx: int, sort_dir: str):
+        # The full result using OFFSET pagination
+        expected = [ mset['id']['site'] for mset in self.view(sort_idx = sort_idx, sort_dir = sort_dir).json['data'] ]
+
+        # Page through the result one row at a time using the cursor
+        returned, cursor = [], None
+        for start in range(len(expected)):
+            response = self.view(sort_idx = sort_idx, sort_dir = sort_dir, start = start, length = 1, cursor = cursor)
+            assert response.json['recordsFiltered'] == len(expected)
+            returned += [ mset['id']['site'] for mset in response.json['data'] ]
+            cursor = response.json['cursor']
+
+        assert returned == expected
+
+        # The last cursor yields an empty page
+        assert self.view(sort_idx = sort_idx, sort_dir = sort_dir, start = len(expected), length = 1, cursor = cursor).json['data'] == []
+        return returned
@@ -0,0 +1,2 @@
+"""Tests of individual components that do not require a database.
+"""
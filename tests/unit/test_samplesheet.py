@@ -0,0 +1,242 @@
+# Copyright 2021 Universität Tübingen, DKFZ and EMBL for the German Human Genome-Phenome Archive (GHGA)
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import io
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pandas.api.types as pdtypes
+
+from datameta import samplesheet
+from datameta.samplesheet import pyarrow
+from datameta.utils import formatted_mrec_value_str
+
+
+def reference_conversion(series, datetimefmt):
+    """The former per-value conversion: values were rendered to ISO strings
+    and formatted according to the datetime format afterwards"""
+    def to_str(x):
+        return "" if pd.isna(x) else str(x)
+
+    def strptime_iso_or_empty(s):
+        try:
+            return datetime.datetime.strptime(s, datetimefmt).isoformat()
+        except (ValueError, TypeError):
+            return ""
+
+    def datetime_iso_or_empty(x):
+        return "" if pd.isna(x) else x.isoformat()
+
+    if datetimefmt is None:
+        values = series.map(to_str)
+    elif pdtypes.is_datetime64_dtype(series):
+        values = series.map(datetime_iso_or_empty)
+    else:
+        values = series.map(strptime_iso_or_empty).fillna("")
+    return [ None if not value else formatted_mrec_value_str(value, datetimefmt) for value in values ]
+
+
+class SampleSheetConversionTest(unittest.TestCase):
+    columns = {
+        "text" : (None, [ "a", 1, 1.5, 2.0, np.nan, None, True, "nan", "" ]),
+        "date" : ("%Y-%m-%d", [ "2021-01-02", "bad", np.nan, None, "0001-01-01", "2021-02-30", 5, "2021-1-2", "" ]),
+        "offset" : ("%Y-%m-%d %H:%M:%S%z", [
+            "2021-01-02 03:04:05+0100", "2021-01-02 03:04:05+0000", "2021-01-02 03:04:05-0230",
+            "2021-01-02 03:04:05", np.nan, "bad", None, "2021-01-02 03:04:05Z", ""
+            ]),
+        "year" : ("%d.%m.%y", [ "01.02.21", "31.12.99", "31.12.68", "01.01.69", "xx", None, np.nan, "29.02.21", "1.2.21" ]),
+        "datetime" : ("%d.%m.%Y %H:%M", pd.to_datetime([
+            "2021-01-02 03:04", None, "1999-12-31 23:59", "2000-02-29 00:00", None, "2021-01-02 03:04",
+            "1970-01-01 00:00", "2262-04-11 00:00", "1677-09-22 00:00"
+            ])),
+    }
+
+    def test_string_conversion_matches_reference(self):
+        data = pd.DataFrame({ name : pd.Series(values, dtype = None if isinstance(values, pd.DatetimeIndex) else object) for name, (_, values) in self.columns.items() })
+        metadata = [ SimpleNamespace(name = name, datetimefmt = datetimefmt) for name, (datetimefmt, _) in self.columns.items() ]
+        expected = { mdat.name : reference_conversion(data[mdat.name], mdat.datetimefmt) for mdat in metadata }
+
+        samplesheet.string_conversion(data, metadata)
+
+        for mdat in metadata:
+            with self.subTest(column = mdat.name):
+                self.assertEqual([ value if value else None for value in data[mdat.name] ], expected[mdat.name])
+
+    def test_string_conversion_numeric_columns(self):
+        data = pd.DataFrame({ "float" : [ 1.5, np.nan ], "int" : pd.Series([ 1, None ], dtype = "Int64") })
+        metadata = [ SimpleNamespace(name = name, datetimefmt = None) for name in data.columns ]
+
+        samplesheet.string_conversion(data, metadata)
+
+        self.assertEqual(data["float"].tolist(), [ "1.5", "" ])
+        self.assertEqual(data["int"].tolist(), [ "1", "" ])
+
+
+class SampleSheetReaderTest(unittest.TestCase):
+    def create_workbook(self, rows):
+        workbook = openpyxl.Workbook()
+        worksheet = workbook.active
+        for row in rows:
+            worksheet.append(row)
+        content = io.BytesIO()
+        workbook.save(content)
+        return content
+
+    def assert_xlsx_chunks_match_read_excel(self, rows):
+        content = self.create_workbook(rows)
+        expected = pd.read_excel(content, dtype = "object", engine = "openpyxl")
+
+        for chunksize in [ 1, 2, 3, 100 ]:
+            with self.subTest(chunksize = chunksize):
+                content.seek(0)
+                chunks = list(samplesheet.read_xlsx_chunks(content, chunksize))
+                self.assertTrue(all(len(chunk) <= chunksize for chunk in chunks))
+                pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index = True), expected)
+
+    def test_read_xlsx_chunks(self):
+        self.assert_xlsx_chunks_match_read_excel([
+            [ "ID", "Number", "Flag", "Error", "Date", "Text" ],
+            [ "ID1", 1, True, "#N/A", datetime.datetime(2021, 1, 5), "a" ],
+            [ "ID2", 2.0, False, "#DIV/0!", datetime.datetime(2021, 1, 6, 12, 30), None ],
+            [],
+            [ None, None, None, None, None, None ],
+            [ "ID3", 2.5, None, 1, "2021-01-07", "b" ],
+            [ "ID4", -3.0, True, "#VALUE!", None, "" ],
+            [ None, None, None, None, None, "c" ],
+            [],
+            [ "ID5", 10 ** 12, False, None, datetime.datetime(1999, 12, 31), "d" ],
+            [],
+            [],
+            ])
+
+    def test_read_xlsx_chunks_empty(self):
+        self.assert_xlsx_chunks_match_read_excel([ [ "ID", "Number" ] ])
+        self.assert_xlsx_chunks_match_read_excel([ [ "ID", "Number" ], [], [] ])
+
+    def test_convert_chunks_drops_duplicates_across_chunks(self):
+        metadata = { name : SimpleNamespace(name = name, datetimefmt = datetimefmt) for name, datetimefmt in [ ("ID", None), ("Date", "%Y-%m-%d") ] }
+        chunks = iter([
+            pd.DataFrame({ "ID" : [ "ID1", "ID2", "ID1", np.nan ], "Date" : [ "2021-01-05", np.nan, "2021-01-05", np.nan ], "Other" : [ "a", "b", "c", "d" ] }, dtype = object),
+            pd.DataFrame({ "ID" : [ "ID2", "ID3", None ], "Date" : [ None, "2021-01-06", None ], "Other" : [ "e", "f", "g" ] }, dtype = object),
+            pd.DataFrame({ "ID" : [ "ID3", "ID1" ], "Date" : [ "2021-01-06", "2021-01-06" ], "Other" : [ "h", "i" ] }, dtype = object),
+            ])
+
+        converted = list(samplesheet.convert_chunks(chunks, metadata, "samplesheet.csv"))
+
+        self.assertEqual(converted, [
+            [ { "ID" : "ID1", "Date" : "2021-01-05" }, { "ID" : "ID2", "Date" : None }, { "ID" : None, "Date" : None } ],
+            [ { "ID" : "ID3", "Date" : "2021-01-06" } ],
+            [ { "ID" : "ID1", "Date" : "2021-01-06" } ],
+            ])
+
+    def test_convert_chunks_compares_converted_rows(self):
+        metadata = { name : SimpleNamespace(name = name, datetimefmt = datetimefmt) for name, datetimefmt in [ ("ID", None), ("Date", "%Y-%m-%d") ] }
+        chunks = iter([
+            pd.DataFrame({ "ID" : [ 123, 456 ], "Date" : [ "2021-01-05", "2021-1-6" ] }),
+            pd.DataFrame({ "ID" : [ "123", "456", "789" ], "Date" : [ "2021-01-05", "2021-01-06", "2021-01-06" ] }),
+            pd.DataFrame({ "ID" : pd.Series([], dtype = object), "Date" : pd.Series([], dtype = object) }),
+            ])
+
+        converted = list(samplesheet.convert_chunks(chunks, metadata, "samplesheet.csv"))
+
+        self.assertEqual(converted, [
+            [ { "ID" : "123", "Date" : "2021-01-05" }, { "ID" : "456", "Date" : "2021-01-06" } ],
+            [ { "ID" : "789", "Date" : "2021-01-06" } ],
+            [],
+            ])
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class ArrowSampleSheetTest(unittest.TestCase):
+    metadata = { name : SimpleNamespace(name = name, datetimefmt = datetimefmt) for name, datetimefmt in [
+        ("ID", None), ("Date", "%Y-%m-%d"), ("Time", "%Y-%m-%d %H:%M:%S"), ("Count", None), ("Flag", None)
+        ] }
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def convert(self, content: bytes):
+        input_path, output_path = os.path.join(self.tmpdir.name, "samplesheet"), os.path.join(self.tmpdir.name, "converted.ndjson")
+        with open(input_path, "wb") as input_file:
+            input_file.write(content)
+        samplesheet.convert_samplesheet_file(input_path, output_path, self.metadata, "samplesheet")
+        with open(output_path) as output_file:
+            return [ record for line in output_file for record in json.loads(line)["records"] ]
+
+    def convert_without_pyarrow(self, content: bytes):
+        with mock.patch.object(samplesheet, "pyarrow", None):
+            return self.convert(content)
+
+    def test_delimited(self):
+        content = (
+                b"ID\tDate\tTime\tCount\tFlag\tOther\n"
+                b"ID1\t2021-01-05\t2021-01-05 12:30:00\t1\tTRUE\tx\n"
+                b"NA\tn/a\t\tNULL\tNone\ty\n"
+                b"ID2\t2021-1-6\tbad\t-2\tnan\tz\n"
+                b"ID1\t2021-01-05\t2021-01-05 12:30:00\t1\tTRUE\tx\n"
+                b"ID3\t\t\t007\t#N/A\t\n"
+                b"ID4\t2021-02-30\t2021-01-05\t1.5\tFalse\t\n"
+                )
+        expected = self.convert_without_pyarrow(content)
+        self.assertEqual(len(expected), 5)
+        self.assertEqual(self.convert(content), expected)
+
+    def test_columnar_formats(self):
+        table = pyarrow.table({
+            "ID"      : pyarrow.array([ "ID1", "ID2", None, "ID1", "ID3" ], pyarrow.string()),
+            "Date"    : pyarrow.array([ datetime.date(2021, 1, 5), None, datetime.date(1999, 12, 31), datetime.date(2021, 1, 5), datetime.date(2000, 2, 29) ], pyarrow.date32()),
+            "Time"    : pyarrow.array([ datetime.datetime(2021, 1, 5, 12, 30), datetime.datetime(2021, 1, 6), None, datetime.datetime(2021, 1, 5, 12, 30), None ], pyarrow.timestamp("us")),
+            "Count"   : pyarrow.array([ 1, None, -2, 1, 2 ** 53 + 1 ], pyarrow.int64()),
+            "Flag"    : pyarrow.array([ "a", "b", None, "a", "c" ], pyarrow.string()),
+            "Other"   : pyarrow.array([ 1.5, 2.5, 3.5, 4.5, None ], pyarrow.float64()),
+            })
+
+        csv_content = (
+                b"ID,Date,Time,Count,Flag,Other\n"
+                b"ID1,2021-01-05,2021-01-05 12:30:00,1,a,1.5\n"
+                b"ID2,,2021-01-06 00:00:00,,b,2.5\n"
+                b",1999-12-31,,-2,,3.5\n"
+                b"ID1,2021-01-05,2021-01-05 12:30:00,1,a,4.5\n"
+                b"ID3,2000-02-29,,9007199254740993,c,\n"
+                )
+        expected = self.convert_without_pyarrow(csv_content)
+        self.assertEqual(len(expected), 4)
+
+        parquet_content = io.BytesIO()
+        pyarrow.parquet.write_table(table, parquet_content, row_group_size = 2)
+
+        ipc_file_content = io.BytesIO()
+        with pyarrow.ipc.new_file(ipc_file_content, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize = 2):
+                writer.write_batch(batch)
+
+        ipc_stream_content = io.BytesIO()
+        with pyarrow.ipc.new_stream(ipc_stream_content, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize = 2):
+                writer.write_batch(batch)
+
+        for name, content in [ ("csv", csv_content), ("parquet", parquet_content.getvalue()), ("ipc_file", ipc_file_content.getvalue()), ("ipc_stream", ipc_stream_content.getvalue()) ]:
+            with self.subTest(format = name):
+                self.assertEqual(self.convert(content), expected)